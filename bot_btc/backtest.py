@@ -0,0 +1,420 @@
+# backtest.py
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from exchange_info import SymbolFilters
+from grid import (GRID_LEVELS, GRID_STEP, GRID_STEP_PCT, GRID_VOL_MULT, SPACINGS, GridConfig, VolatilityEstimator,
+                  build_grid_orders, order_size)
+from order_book import BookSide
+from pnl_engine import PnLEngine
+from quote_manager import QUOTE_TOLERANCE_TICKS, within_tolerance
+from recorder import (RECORD_DIR, KIND_BID, KIND_ASK, KIND_TRADE, FLAG_RESET, FLAG_LAST, FLAG_BUYER_MAKER,
+                      iter_records, recorded_files)
+
+BacktestConfig = namedtuple('BacktestConfig', [
+    'symbol', 'mode', 'step', 'levels', 'order_pct', 'interval_ms', 'latency_ms',
+    'tick_size', 'precision', 'min_qty', 'min_notional', 'maker_fee', 'taker_fee',
+    'initial_quote', 'initial_base', 'leverage', 'tolerance_ticks', 'use_spread',
+    'spacing', 'step_pct', 'vol_mult', 'skew',
+], defaults=('BTCUSDT', 'spot', GRID_STEP, GRID_LEVELS, 0.1, 5000, 50,
+             0.01, 5, 0.0, 5.0, 0.001, 0.001,
+             1000.0, 0.0, 1, QUOTE_TOLERANCE_TICKS, True,
+             'arithmetic', GRID_STEP_PCT, GRID_VOL_MULT, 0.0))
+
+
+# Ордер в симуляции: queue_ahead — объём биржевой очереди перед нами на нашей цене
+class SimOrder:
+    __slots__ = ('level', 'side', 'price', 'qty', 'filled', 'queue_ahead', 'active_at', 'reserved')
+
+    def __init__(self, level, side, price, qty, queue_ahead, active_at, reserved):
+        self.level = level
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.filled = 0.0
+        self.queue_ahead = queue_ahead
+        self.active_at = active_at
+        self.reserved = reserved  # спот: заблокированные средства, фьючерсы: маржа
+
+    @property
+    def remaining(self):
+        return self.qty - self.filled
+
+
+def level_qty(side, price):
+    key = price * side.sign
+    i = bisect_left(side.keys, key)
+    if i < len(side.keys) and side.keys[i] == key:
+        return side.qtys[i]
+    return 0.0
+
+
+# === Реплей стратегии сетки с симуляцией исполнения ===
+# События — кортежи recorder (kind, flags, update_id, exchange_ts, local_ts, price, qty),
+# из записанных файлов или synthetic_events. Каждые interval_ms времени биржи сетка
+# пересчитывается той же build_grid_orders, что и в боте, и сверяется с живыми ордерами
+# как в QuoteManager (в пределах допуска ордер не трогаем и он сохраняет место в очереди).
+# Исполнение: лимитный ордер стоит в очереди за объёмом уровня на момент выставления;
+# очередь уменьшается сделками по цене и сокращением уровня; ордер, через который
+# прошла цена, исполняется целиком. Пересекающий стакан ордер исполняется как тейкер.
+class Backtest:
+    def __init__(self, config):
+        self.cfg = config
+        self.futures = config.mode != 'spot'
+        self.grid = GridConfig(config.levels, config.spacing, config.step, config.step_pct, config.vol_mult,
+                               config.skew)
+        self.filters = SymbolFilters(config.min_qty, 10 ** -config.precision, config.tick_size,
+                                     config.min_notional, config.precision, None)
+        self.volatility = VolatilityEstimator()
+        self.bids = BookSide(True)
+        self.asks = BookSide(False)
+        self.orders = {}  # (side, level) -> SimOrder
+        self.pnl = PnLEngine(config.symbol)
+        self.now = 0
+        self.next_quote = 0
+        self.events = 0
+        self.rejects = 0
+        # спот: свободные и заблокированные USDT / базовый актив; фьючерсы: кошелёк
+        self.quote_free = config.initial_quote
+        self.quote_locked = 0.0
+        self.base_free = config.initial_base
+        self.base_locked = 0.0
+        self.wallet = config.initial_quote
+        self.start_equity = None
+        self.fills = {k: array('d') for k in ('ts', 'side', 'price', 'qty', 'fee', 'maker')}
+        self.curve = {k: array('d') for k in ('ts', 'mid', 'position', 'pnl', 'equity')}
+
+    # === Баланс ===
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def equity(self, mid):
+        if self.futures:
+            return self.wallet + self.pnl.unrealized
+        return self.quote_free + self.quote_locked + (self.base_free + self.base_locked) * mid
+
+    # Баланс для размера ордера — как fetch_balance в боте
+    def sizing_balance(self):
+        return self.wallet if self.futures else self.quote_free
+
+    def _reserve(self, side, price, qty):
+        if self.futures:
+            margin = price * qty / self.cfg.leverage
+            used = sum(o.reserved for o in self.orders.values())
+            used += abs(self.pnl.position) * (self.pnl.mark_price or price) / self.cfg.leverage
+            if margin > self.wallet + self.pnl.unrealized - used:
+                return None
+            return margin
+        if side == 'BUY':
+            cost = price * qty
+            if cost > self.quote_free:
+                return None
+            self.quote_free -= cost
+            self.quote_locked += cost
+            return cost
+        if qty > self.base_free:
+            return None
+        self.base_free -= qty
+        self.base_locked += qty
+        return qty
+
+    def _release(self, order):
+        if self.futures:
+            return
+        left = order.reserved * order.remaining / order.qty
+        if order.side == 'BUY':
+            self.quote_locked -= left
+            self.quote_free += left
+        else:
+            self.base_locked -= left
+            self.base_free += left
+
+    # === Исполнение ===
+    def _fill(self, order, qty, price, maker):
+        fee = price * qty * (self.cfg.maker_fee if maker else self.cfg.taker_fee)
+        if self.futures:
+            realized = self.pnl.realized
+            self.pnl.on_fill(order.side, price, qty, fee)
+            self.wallet += self.pnl.realized - realized - fee
+        else:
+            self.pnl.on_fill(order.side, price, qty, fee)
+            if order.side == 'BUY':
+                reserved = order.reserved * qty / order.qty
+                self.quote_locked -= reserved
+                self.quote_free += reserved - price * qty - fee
+                self.base_free += qty
+            else:
+                self.base_locked -= qty
+                self.quote_free += price * qty - fee
+        order.filled += qty
+        f = self.fills
+        f['ts'].append(self.now)
+        f['side'].append(1 if order.side == 'BUY' else -1)
+        f['price'].append(price)
+        f['qty'].append(qty)
+        f['fee'].append(fee)
+        f['maker'].append(1 if maker else 0)
+        if order.remaining <= 1e-12:
+            self.orders.pop((order.side, order.level), None)
+
+    def _on_trade(self, price, qty, buyer_maker):
+        # агрессор продаёт — бьёт наши BUY, агрессор покупает — наши SELL
+        side = 'BUY' if buyer_maker else 'SELL'
+        for order in list(self.orders.values()):
+            if order.side != side or order.active_at > self.now:
+                continue
+            through = price < order.price if side == 'BUY' else price > order.price
+            if through:
+                self._fill(order, order.remaining, order.price, True)
+            elif price == order.price:
+                left = qty - order.queue_ahead
+                order.queue_ahead = max(order.queue_ahead - qty, 0.0)
+                if left > 0:
+                    self._fill(order, min(left, order.remaining), order.price, True)
+
+    def _on_level(self, is_bid, price, qty):
+        for order in self.orders.values():
+            if order.price == price and (order.side == 'BUY') == is_bid and qty < order.queue_ahead:
+                order.queue_ahead = qty
+
+    # Цена прошла через ордер без сделок в потоке (например, синтетические данные)
+    def _check_crossed(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        for order in list(self.orders.values()):
+            if order.active_at > self.now:
+                continue
+            if order.side == 'BUY' and ask is not None and ask[0] < order.price:
+                self._fill(order, order.remaining, order.price, True)
+            elif order.side == 'SELL' and bid is not None and bid[0] > order.price:
+                self._fill(order, order.remaining, order.price, True)
+
+    # === Котирование ===
+    def _place(self, req):
+        reserved = self._reserve(req.side, req.price, req.qty)
+        if reserved is None:
+            self.rejects += 1
+            return
+        order = SimOrder(req.level, req.side, req.price, req.qty, 0.0, self.now + self.cfg.latency_ms, reserved)
+        self.orders[(req.side, req.level)] = order
+        best = self.asks.best() if req.side == 'BUY' else self.bids.best()
+        crosses = best is not None and (best[0] <= req.price if req.side == 'BUY' else best[0] >= req.price)
+        if crosses:
+            self._fill(order, order.qty, best[0], False)
+        else:
+            order.queue_ahead = level_qty(self.bids if req.side == 'BUY' else self.asks, req.price)
+
+    def _cancel(self, order):
+        self._release(order)
+        self.orders.pop((order.side, order.level), None)
+
+    def _quote(self):
+        cfg = self.cfg
+        mid = self.mid()
+        if mid is None:
+            return
+        self.pnl.mark(mid)
+        if self.start_equity is None:
+            self.start_equity = self.equity(mid)
+        c = self.curve
+        c['ts'].append(self.now)
+        c['mid'].append(mid)
+        c['position'].append(self.pnl.position)
+        c['pnl'].append(self.pnl.net)
+        c['equity'].append(self.equity(mid))
+        self.volatility.update(mid)
+
+        qty, order_value = order_size(self.sizing_balance(), mid, cfg.order_pct, cfg.precision)
+        if qty < cfg.min_qty or qty <= 0 or order_value < cfg.min_notional:
+            return
+        desired = build_grid_orders(mid, qty, self.filters, self.grid, None, cfg.use_spread, False,
+                                    self.volatility.sigma)
+        wanted = set()
+        for req in desired:
+            slot = (req.side, req.level)
+            wanted.add(slot)
+            order = self.orders.get(slot)
+            if order is not None:
+                if within_tolerance(order, req, self.filters, cfg.tolerance_ticks):
+                    continue
+                self._cancel(order)
+            self._place(req)
+        for slot, order in list(self.orders.items()):
+            if slot not in wanted:
+                self._cancel(order)
+
+    # === Прогон ===
+    def run(self, events):
+        bids, asks = self.bids, self.asks
+        interval = self.cfg.interval_ms
+        started = time.perf_counter()
+        for kind, flags, _, ts, _, price, qty in events:
+            self.events += 1
+            self.now = ts
+            if kind == KIND_TRADE:
+                if self.orders:
+                    self._on_trade(price, qty, flags & FLAG_BUYER_MAKER)
+                continue
+            if flags & FLAG_RESET:
+                bids.clear()
+                asks.clear()
+            (bids if kind == KIND_BID else asks).update(price, qty)
+            if self.orders:
+                self._on_level(kind == KIND_BID, price, qty)
+            if flags & FLAG_LAST:
+                if self.orders:
+                    self._check_crossed()
+                if ts >= self.next_quote:
+                    self._quote()
+                    self.next_quote = ts + interval
+        return self.result(time.perf_counter() - started)
+
+    def result(self, elapsed):
+        mid = self.mid() or 0.0
+        self.pnl.mark(mid)
+        equity = self.equity(mid)
+        peak, drawdown = -math.inf, 0.0
+        for e in self.curve['equity']:
+            peak = max(peak, e)
+            drawdown = max(drawdown, peak - e)
+        makers = sum(self.fills['maker'])
+        return {
+            'config': self.cfg._asdict(),
+            'events': self.events,
+            'elapsed_s': round(elapsed, 3),
+            'events_per_s': round(self.events / elapsed) if elapsed else None,
+            'fills': len(self.fills['ts']),
+            'maker_fills': int(makers),
+            'taker_fills': len(self.fills['ts']) - int(makers),
+            'rejects': self.rejects,
+            'position': self.pnl.position,
+            'avg_price': self.pnl.avg_price,
+            'realized': self.pnl.realized,
+            'unrealized': self.pnl.unrealized,
+            'fees': self.pnl.fees,
+            'net_pnl': self.pnl.net,
+            'start_equity': self.start_equity,
+            'end_equity': equity,
+            'max_drawdown': drawdown,
+        }
+
+
+# === Источники событий ===
+def recorded_events(symbol, root=RECORD_DIR, start_day=None, end_day=None):
+    return itertools.chain.from_iterable(iter_records(p) for p in recorded_files(symbol, root, start_day, end_day))
+
+
+# Синтетический стакан: случайное блуждание mid, depth уровней с каждой стороны
+# каждые step_ms и сделка по лучшей цене с вероятностью trade_prob
+def synthetic_events(count, mid=30000.0, tick=0.01, spread_ticks=2, depth=5, step_ms=100,
+                     vol=0.0002, trade_prob=0.5, seed=1):
+    rng = random.Random(seed)
+    ts = 0
+    update_id = 0
+    emitted = 0
+    prev_bids, prev_asks = set(), set()
+    first = True
+    while emitted < count:
+        mid *= math.exp(vol * rng.gauss(0, 1))
+        ts += step_ms
+        update_id += 1
+        best_bid = math.floor(mid / tick - spread_ticks / 2) * tick
+        bids = {round(best_bid - i * tick, 8) for i in range(depth)}
+        asks = {round(best_bid + (spread_ticks + i) * tick, 8) for i in range(depth)}
+        batch = [(KIND_BID, p, 0.0) for p in prev_bids - bids] + [(KIND_ASK, p, 0.0) for p in prev_asks - asks]
+        batch += [(KIND_BID, p, round(rng.uniform(0.1, 5), 3)) for p in sorted(bids)]
+        batch += [(KIND_ASK, p, round(rng.uniform(0.1, 5), 3)) for p in sorted(asks)]
+        prev_bids, prev_asks = bids, asks
+        last = len(batch) - 1
+        for i, (kind, price, qty) in enumerate(batch):
+            flags = (FLAG_RESET if first and i == 0 else 0) | (FLAG_LAST if i == last else 0)
+            yield kind, flags, update_id, ts, ts * 1000, price, qty
+        first = False
+        emitted += len(batch)
+        if rng.random() < trade_prob:
+            buyer_maker = rng.random() < 0.5
+            price = max(bids) if buyer_maker else min(asks)
+            flags = FLAG_LAST | (FLAG_BUYER_MAKER if buyer_maker else 0)
+            yield KIND_TRADE, flags, update_id, ts, ts * 1000, price, round(rng.uniform(0.01, 2), 3)
+            emitted += 1
+
+
+# === Сохранение результата: summary.json, fills.csv, curve.csv ===
+def save_result(bt, summary, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    for name, columns in (('fills', bt.fills), ('curve', bt.curve)):
+        with open(os.path.join(out_dir, f'{name}.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+
+
+def _floats(text):
+    return [float(x) for x in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Реплей сетки на записанных или синтетических данных")
+    parser.add_argument('symbol')
+    parser.add_argument('--from', dest='start_day')
+    parser.add_argument('--to', dest='end_day')
+    parser.add_argument('--root', default=RECORD_DIR)
+    parser.add_argument('--synthetic', type=int, help="число синтетических событий вместо записи")
+    parser.add_argument('--mode', default='spot', choices=['spot', 'futures'])
+    parser.add_argument('--step', default=str(GRID_STEP), help="шаг сетки, можно списком: 0.1,0.25,0.5")
+    parser.add_argument('--levels', default=str(GRID_LEVELS), help="число уровней, можно списком")
+    parser.add_argument('--order-pct', default='0.1', help="доля баланса на ордер, можно списком")
+    parser.add_argument('--spacing', default='arithmetic', choices=SPACINGS)
+    parser.add_argument('--step-pct', type=float, default=GRID_STEP_PCT, help="geometric: шаг в долях цены")
+    parser.add_argument('--vol-mult', type=float, default=GRID_VOL_MULT, help="volatility: шаг в σ")
+    parser.add_argument('--skew', default='0', help="перекос объёма по уровням, можно списком")
+    parser.add_argument('--interval-ms', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=int, default=50)
+    parser.add_argument('--tick', type=float, default=0.01)
+    parser.add_argument('--precision', type=int, default=5)
+    parser.add_argument('--min-notional', type=float, default=5.0)
+    parser.add_argument('--maker-fee', type=float, default=0.001)
+    parser.add_argument('--taker-fee', type=float, default=0.001)
+    parser.add_argument('--balance', type=float, default=1000.0)
+    parser.add_argument('--base', type=float, default=0.0, help="спот: начальный объём базового актива")
+    parser.add_argument('--leverage', type=int, default=1)
+    parser.add_argument('--out', help="каталог для summary.json / fills.csv / curve.csv")
+    args = parser.parse_args()
+
+    runs = list(itertools.product(_floats(args.step), [int(x) for x in args.levels.split(',')], _floats(args.order_pct),
+                                  _floats(args.skew)))
+    for step, levels, order_pct, skew in runs:
+        cfg = BacktestConfig(symbol=args.symbol.upper(), mode=args.mode, step=step, levels=levels, order_pct=order_pct,
+                             interval_ms=args.interval_ms, latency_ms=args.latency_ms, tick_size=args.tick,
+                             precision=args.precision, min_notional=args.min_notional, maker_fee=args.maker_fee,
+                             taker_fee=args.taker_fee, initial_quote=args.balance, initial_base=args.base,
+                             leverage=args.leverage, spacing=args.spacing, step_pct=args.step_pct,
+                             vol_mult=args.vol_mult, skew=skew)
+        if args.synthetic:
+            events = synthetic_events(args.synthetic, tick=args.tick)
+        else:
+            events = recorded_events(cfg.symbol, args.root, args.start_day, args.end_day)
+        bt = Backtest(cfg)
+        summary = bt.run(events)
+        print(f"step={step} levels={levels} order_pct={order_pct} skew={skew}: PnL {summary['net_pnl']:.2f}, "
+              f"сделок {summary['fills']}, позиция {summary['position']:.5f}, "
+              f"просадка {summary['max_drawdown']:.2f}, {summary['events_per_s']} событий/с")
+        if args.out:
+            out = args.out if len(runs) == 1 else os.path.join(args.out, f"step{step}_levels{levels}_pct{order_pct}_skew{skew}")
+            save_result(bt, summary, out)
+
+
+if __name__ == '__main__':
+    main()
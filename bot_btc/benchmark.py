@@ -0,0 +1,268 @@
+# benchmark.py
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import aiohttp
+from binance.client import Client
+from loguru import logger
+from bot_commands import place_grid_orders
+from exchange_gateway import ExchangeGateway, close_sessions
+from market_data import MarketDataHub
+from quote_manager import QuoteManager
+from user_stream import user_data
+
+BENCH_PORT = 8950
+PERCENTILES = (('p50', 50), ('p99', 99), ('p99.9', 99.9))
+MOCK_START_TIMEOUT = 10
+
+
+# Перцентиль по отсортированной выборке (nearest-rank)
+def percentile(values, pct):
+    if not values:
+        return None
+    rank = max(int(len(values) * pct / 100 + 0.999999) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def latency_stats(values):
+    values = sorted(values)
+    stats = {name: percentile(values, pct) for name, pct in PERCENTILES}
+    stats['mean'] = sum(values) / len(values) if values else None
+    stats['max'] = values[-1] if values else None
+    stats['count'] = len(values)
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in stats.items()}
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# === Замер цикла котировок одного символа ===
+# tick → decision: от получения события стакана из сокета до готовой желаемой сетки
+# (вход в reconcile), decision → ack: от сетки до ответов биржи на все запросы цикла.
+class TimedQuoteManager(QuoteManager):
+    def __init__(self, gateway, symbol, stats):
+        super().__init__(gateway, symbol)
+        self.stats = stats
+        self.tick_ms = None
+        self.responses = 0
+        gateway.listeners.append(self._on_response)
+
+    def _on_response(self, rate_limits, status):
+        self.responses += 1
+
+    async def reconcile(self, desired, filters):
+        decided = time.time() * 1000
+        before = self.responses
+        results = await super().reconcile(desired, filters)
+        if self.stats.recording:
+            self.stats.tick_to_decision.append(decided - self.tick_ms)
+            if self.responses > before:  # цикл без запросов к бирже не учитываем в decision → ack
+                self.stats.decision_to_ack.append(time.time() * 1000 - decided)
+            self.stats.errors += sum(1 for r in results if r.error is not None)
+        return results
+
+
+class RunStats:
+    def __init__(self):
+        self.recording = False
+        self.tick_to_decision = []
+        self.decision_to_ack = []
+        self.cycles = {}  # символ -> циклов за время замера
+        self.errors = 0
+
+
+# Цикл как в main_bot.run_symbol, но по событию стакана вместо INTERVAL
+async def bench_symbol(symbol, client, trade_mode, order_pct, hub, stats, stop):
+    gateway = ExchangeGateway(client, trade_mode)
+    quotes = TimedQuoteManager(gateway, symbol, stats)
+    user_data.subscribe(symbol, client, trade_mode, False, on_order=quotes.on_order_update)
+    book = await hub.subscribe(symbol, trade_mode, False, gateway)
+    updated = asyncio.Event()
+    book.listeners.append(lambda b: updated.set())
+    await book.wait_ready()
+    stats.cycles[symbol] = 0
+    while not stop.is_set():
+        await updated.wait()
+        updated.clear()
+        bid, ask, _ = book.best()
+        quotes.tick_ms = book.local_time
+        try:
+            await place_grid_orders(gateway, symbol, (bid + ask) / 2, order_pct, book.book, quotes)
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"[Bench] [{symbol}] Ошибка цикла: {e}")
+        if stats.recording:
+            stats.cycles[symbol] += 1
+
+
+async def wait_mock(url):
+    deadline = time.monotonic() + MOCK_START_TIMEOUT
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/api/v3/ping") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"mock_exchange не запустился на {url}")
+            await asyncio.sleep(0.1)
+
+
+def start_mock(args, symbols, port):
+    mock = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_exchange.py')
+    cmd = [sys.executable, mock, '--port', str(port), '--symbols', ','.join(symbols),
+           '--prices', str(args.price), '--vol', str(args.vol), '--tick-ms', str(args.tick_ms), '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+           '--weight-limit', '100000000', '--order-limit', '100000000',
+           '--balance', str(args.balance), '--base-balance', str(args.base_balance)]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# === Один прогон: N символов против свежего mock_exchange в отдельном процессе ===
+# Отдельный процесс и порт на прогон: CPU биржи не попадает в замер, а кэши
+# exchangeInfo, RateGovernor и сессии привязаны к адресу и не переходят между прогонами.
+async def bench_run(args, count, port):
+    symbols = [f"BENCH{i}USDT" for i in range(count)]
+    url = f"http://127.0.0.1:{port}"
+    os.environ.update(API_URL=f"{url}/api", FUTURES_URL=f"{url}/fapi",
+                      STREAM_URL=f"ws://127.0.0.1:{port}/spot", FUTURES_STREAM_URL=f"ws://127.0.0.1:{port}/futures")
+    mock = start_mock(args, symbols, port)
+    hub = MarketDataHub()
+    stats = RunStats()
+    stop = asyncio.Event()
+    tasks = []
+    error = None
+    try:
+        await wait_mock(url)
+        client = Client('bench', 'bench', ping=False)
+        client.API_URL = os.environ['API_URL']
+        client.FUTURES_URL = os.environ['FUTURES_URL']
+        tasks = [asyncio.ensure_future(bench_symbol(s, client, args.mode, args.order_pct, hub, stats, stop))
+                 for s in symbols]
+        await asyncio.sleep(args.warmup)
+        stats.recording = True
+        cpu_start, wall_start = cpu_seconds(), time.monotonic()
+        await asyncio.sleep(args.duration)
+        stats.recording = False
+        cpu, wall = cpu_seconds() - cpu_start, time.monotonic() - wall_start
+    except Exception as e:
+        # Прогон без замера (mock не поднялся, клиент не создан) — в результат идёт ошибка, остальные прогоны продолжаются
+        error = f"{type(e).__name__}: {e}"
+        logger.error(f"[Bench] Прогон на {count} символов не выполнен: {error}")
+    finally:
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await hub.close()
+        await user_data.close()
+        await close_sessions()
+        mock.terminate()
+        _, _, mock_usage = os.wait4(mock.pid, 0)
+
+    if error is not None:
+        return {'symbols': count, 'error': error}
+    cycles = sum(stats.cycles.values())
+    return {
+        'symbols': count,
+        'duration_s': round(wall, 3),
+        'tick_to_decision_ms': latency_stats(stats.tick_to_decision),
+        'decision_to_ack_ms': latency_stats(stats.decision_to_ack),
+        'cycles_per_sec_per_symbol': round(cycles / wall / count, 3),
+        'symbols_cycling': sum(1 for c in stats.cycles.values() if c),
+        'cpu_pct_total': round(cpu / wall * 100, 2),
+        'cpu_pct_per_symbol': round(cpu / wall * 100 / count, 3),
+        'errors': stats.errors,
+        # биржа за весь прогон с прогревом: близко к 100% — упёрлись в mock_exchange, а не в бота
+        'exchange_cpu_pct': round((mock_usage.ru_utime + mock_usage.ru_stime) / (args.warmup + wall) * 100, 2),
+    }
+
+
+# Сравнение с прошлым результатом: изменение p50/p99 по числу символов
+def compare(result, baseline):
+    previous = {run['symbols']: run for run in baseline.get('runs', []) if 'error' not in run}
+    for run in result['runs']:
+        base = previous.get(run['symbols'])
+        if base is None or 'error' in run:
+            continue
+        for metric in ('tick_to_decision_ms', 'decision_to_ack_ms'):
+            for p in ('p50', 'p99'):
+                old, new = base[metric].get(p), run[metric].get(p)
+                if old and new is not None:
+                    print(f"{run['symbols']} симв. {metric} {p}: {old} → {new} ({(new / old - 1) * 100:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Задержка tick → order и пропускная способность против mock_exchange")
+    parser.add_argument('--symbols', default='1,10,50', type=lambda s: [int(x) for x in s.split(',')],
+                        help="число символов в прогонах через запятую")
+    parser.add_argument('--mode', default='futures', choices=['spot', 'futures'])
+    parser.add_argument('--duration', type=float, default=30.0, help="длительность замера прогона, с")
+    parser.add_argument('--warmup', type=float, default=5.0, help="прогрев до начала замера, с")
+    # Шаг сетки 0.25 при цене 100 — 25 тиков: ордера переставляются, но редко исполняются
+    parser.add_argument('--price', type=float, default=100.0, help="начальная цена символов биржи")
+    parser.add_argument('--vol', type=float, default=0.0002, help="волатильность цены биржи за тик")
+    parser.add_argument('--tick-ms', type=int, default=100, help="период обновления стакана биржи")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="задержка ответа биржи")
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--order-pct', type=float, default=0.001)
+    parser.add_argument('--balance', type=float, default=1000000.0)
+    parser.add_argument('--base-balance', type=float, default=1000.0)
+    parser.add_argument('--port', type=int, default=BENCH_PORT, help="порт первого прогона, далее +1")
+    parser.add_argument('--label', help="метка версии в результате (по умолчанию git-ревизия)")
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--baseline', help="прошлый benchmark.json для сравнения")
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    runs = []
+    for i, count in enumerate(args.symbols):
+        run = await bench_run(args, count, args.port + i)
+        runs.append(run)
+        if 'error' in run:
+            print(f"{count} символов: ошибка — {run['error']}")
+            continue
+        print(f"{count} символов: tick→decision p99 {run['tick_to_decision_ms']['p99']} мс, "
+                       f"decision→ack p99 {run['decision_to_ack_ms']['p99']} мс, "
+                       f"{run['cycles_per_sec_per_symbol']} циклов/с на символ, CPU {run['cpu_pct_total']}%")
+    return {
+        'label': args.label or git_revision(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('out', 'baseline', 'label', 'log_level')},
+        'runs': runs,
+    }
+
+
+# Запуск: python benchmark.py --symbols 1,10,50 --duration 30 --out bench-$(git rev-parse --short HEAD).json
+if __name__ == '__main__':
+    args = parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    result = asyncio.run(main(args))
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Результат записан в {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
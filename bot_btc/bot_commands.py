@@ -1,22 +1,33 @@
 from telegram import ReplyKeyboardMarkup
 from telegram.ext import Updater, CommandHandler
-from db import get_today_pnl, get_pnl_history
+from db import get_today_pnl, get_pnl_history, get_pnl_totals
+from exchange_info import exchange_info, is_filter_error
+from user_stream import user_data
+from orders import submit_orders
+from grid import order_size, grid_config, build_grid_orders
+from rate_governor import PRIORITY_LOW
+from metrics import metrics
+from fill_store import session_fills
+import asyncio
 import os
 import subprocess
 import sys
 import signal
 from datetime import datetime
-from math import log10
 from loguru import logger
 
 logger.remove()
 logger.add(sys.stdout, level="DEBUG")  
 client_instances = {}
 TRADE_MODES = {}
+GATEWAYS = {}
+LOOP = None  # цикл событий торговли: запросы Telegram идут через его шлюзы
+STOP_SYMBOL = None  # main_bot.stop_symbol: /stop снимает задачу символа в торговом цикле
 
-GRID_LEVELS = 3
-GRID_STEP = 0.25
 ORDER_PCT = 0.1
+PNL_MAX_DAYS = 365
+FILLS_DEFAULT = 10
+FILLS_MAX = 50
 
 SYMBOLS = os.getenv("SYMBOLS", "BTCUSDT,SOLUSDT,ETHUSDT").split(',')
 
@@ -31,10 +42,22 @@ def start(update, context):
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     update.message.reply_text("Команды с указанием символа: например, /balance BTC", reply_markup=reply_markup)
 
-def round_price(price, step):
-    return round(round(price / step) * step, 8)
+def stream_balance(symbol, locked=False):
+    state = user_data.state(symbol)
+    if state is not None and state.live:
+        return state.balance('USDT', locked)
+    return None
+
+# Выполнить корутину в торговом цикле из потока Telegram
+def run_on_loop(coro, timeout=30):
+    return asyncio.run_coroutine_threadsafe(coro, LOOP).result(timeout)
 
 def get_balance(symbol):
+    usdt = stream_balance(symbol)
+    if usdt is not None:
+        return usdt
+    if LOOP is not None and symbol in GATEWAYS:
+        return run_on_loop(GATEWAYS[symbol].get_balance('USDT', priority=PRIORITY_LOW))
     client = client_instances[symbol]
     mode = TRADE_MODES[symbol]
     if mode == 'spot':
@@ -47,6 +70,17 @@ def get_balance(symbol):
                 return float(b['balance'])
         return 0.0
 
+# Для торгового цикла: без блокирующих запросов.
+# Сетка считается от free + locked: свои BUY-ордера блокируют USDT, и от одного free
+# объём уровней менялся бы после каждой выставки, а менеджер котировок перевыставлял сетку
+async def fetch_balance(symbol, gateway):
+    with metrics.timer(symbol, 'balance'):
+        usdt = stream_balance(symbol, locked=True)
+        if usdt is not None:
+            return usdt
+        metrics.inc(symbol, 'balance_rest')
+        return await gateway.get_balance('USDT', locked=True)
+
 def save_daily_start_balance(symbol):
     today = datetime.now().strftime('%Y-%m-%d')
     path = f"start_balance_{symbol}_{today}.txt"
@@ -87,30 +121,102 @@ def pnl_today(update, context):
     if context.args:
         symbol = context.args[0].upper()
         pnl, count = get_today_pnl(symbol)
-        update.message.reply_text(f"Сегодняшний PnL для {symbol}: {pnl:.2f} USDT\nСделок: {count}")
+        msg = f"Сегодняшний PnL для {symbol}: {pnl:.2f} USDT\nСделок: {count}"
+        session = session_summary(symbol)
+        if session:
+            msg += f"\n\n{session}"
+        update.message.reply_text(msg)
     else:
         update.message.reply_text("Укажи символ: /pnl_today BTC")
 
 def pnl_table(update, context):
     if context.args:
         symbol = context.args[0].upper()
-        rows = get_pnl_history(symbol, 7)
+        days = pnl_days(context.args[1:])
+        rows = get_pnl_history(symbol, days)
         if not rows:
             update.message.reply_text("Нет данных.")
             return
-        msg = f"📊 История PnL по {symbol} за 7 дней:\n\n"
+        msg = f"📊 История PnL по {symbol} за {days} дней:\n\n"
         for date_str, pnl in rows:
             pnl_fmt = f"+{pnl:.2f}" if pnl >= 0 else f"{pnl:.2f}"
             msg += f"{date_str}  |  {pnl_fmt} USDT\n"
+        msg += f"\nИтого: {sum(pnl for _, pnl in rows):.2f} USDT"
         update.message.reply_text(msg)
     else:
         update.message.reply_text("Укажи символ: /pnl_table BTC")
 
+def pnl_days(args, default=7):
+    if args and args[0].isdigit():
+        return max(1, min(int(args[0]), PNL_MAX_DAYS))
+    return default
+
+# Сводка по всем символам: /pnl_total 30
+def pnl_total(update, context):
+    days = pnl_days(context.args, 30)
+    rows = get_pnl_totals(days)
+    if not rows:
+        update.message.reply_text("Нет данных.")
+        return
+    msg = f"📊 PnL по всем символам за {days} дней:\n\n"
+    for symbol, pnl, fee, count in rows:
+        msg += f"{symbol}  |  {pnl:+.2f} USDT  |  комиссия {fee:.2f}  |  сделок {count}\n"
+    total = sum(r[1] for r in rows)
+    fees = sum(r[2] for r in rows)
+    msg += f"\nИтого: {total:+.2f} USDT, комиссия {fees:.2f} USDT"
+    update.message.reply_text(msg)
+
+# Итоги сессии по FillStore процесса; None, если символ торгуется не здесь или сделок нет
+def session_summary(symbol):
+    store = session_fills.get(symbol)
+    if store is None or not store.total:
+        return None
+    buy_qty, buy_cost, sell_qty, sell_cost, fee, count = store.totals()
+    msg = f"Сделки {symbol} за сессию: {store.total}"
+    if count < store.total:
+        msg += f" (итоги по последним {count})"
+    return (f"{msg}\nКуплено {buy_qty:.6f} на {buy_cost:.2f} USDT, продано {sell_qty:.6f} на {sell_cost:.2f} USDT, "
+            f"комиссия {fee:.4f} USDT")
+
+# Сделки текущей сессии из FillStore: итоги по буферу и последние исполнения, /fills BTC 20
+def fills(update, context):
+    if not context.args:
+        update.message.reply_text("Укажи символ: /fills BTC")
+        return
+    symbol = context.args[0].upper()
+    store = session_fills.get(symbol)
+    if store is None or not store.total:
+        update.message.reply_text(f"Нет сделок {symbol} за сессию.")
+        return
+    n = FILLS_DEFAULT
+    if len(context.args) > 1 and context.args[1].isdigit():
+        n = max(1, min(int(context.args[1]), FILLS_MAX))
+    msg = f"🧾 {session_summary(symbol)}\n\n"
+    for trade_id, ts_ms, side, price, qty, _ in store.recent(n):
+        msg += f"{datetime.fromtimestamp(ts_ms / 1000):%H:%M:%S}  |  {side} {qty:.6f} по {price}  |  #{trade_id}\n"
+    update.message.reply_text(msg)
+
+# Задержки этапов торгового цикла по символу
+def latency(update, context):
+    if context.args:
+        symbol = context.args[0].upper()
+        update.message.reply_text(metrics.report(symbol))
+    else:
+        update.message.reply_text("Укажи символ: /latency BTC")
+
 
-def run_bot(bot_token, clients_dict, trade_modes_dict):
-    global client_instances, TRADE_MODES
+# Клиенты и торговый цикл для обработчиков; без опроса Telegram — в воркерах orchestrator.py
+def attach(clients_dict, trade_modes_dict, gateways_dict=None, loop=None, stop_symbol=None):
+    global client_instances, TRADE_MODES, GATEWAYS, LOOP, STOP_SYMBOL
     client_instances = clients_dict
     TRADE_MODES = trade_modes_dict
+    GATEWAYS = gateways_dict or {}
+    LOOP = loop
+    STOP_SYMBOL = stop_symbol
+
+
+def run_bot(bot_token, clients_dict, trade_modes_dict, gateways_dict=None, loop=None, stop_symbol=None):
+    attach(clients_dict, trade_modes_dict, gateways_dict, loop, stop_symbol)
 
     updater = Updater(bot_token, use_context=True)
     dp = updater.dispatcher
@@ -118,6 +224,9 @@ def run_bot(bot_token, clients_dict, trade_modes_dict):
     dp.add_handler(CommandHandler("start", start))
     dp.add_handler(CommandHandler("pnl_today", pnl_today))
     dp.add_handler(CommandHandler("pnl_table", pnl_table))
+    dp.add_handler(CommandHandler("pnl_total", pnl_total))
+    dp.add_handler(CommandHandler("latency", latency))
+    dp.add_handler(CommandHandler("fills", fills))
     dp.add_handler(CommandHandler("status", status))
     dp.add_handler(CommandHandler("restart", restart))
     dp.add_handler(CommandHandler("balance", balance))
@@ -127,44 +236,23 @@ def run_bot(bot_token, clients_dict, trade_modes_dict):
 
 
 # ====== Сетка ордеров =======
-def generate_grid_prices(mid_price, spread_step=GRID_STEP, levels=GRID_LEVELS):
-    prices = []
-    for i in range(1, levels + 1):
-        buy = round(mid_price - i * spread_step, 2)
-        sell = round(mid_price + i * spread_step, 2)
-        prices.append((buy, sell))
-    return prices
-
-def place_grid_orders(client, trade_mode, symbol, mid_price, order_pct):
-    if trade_mode == 'spot':
-        info = client.get_symbol_info(symbol)
-        filters = {f['filterType']: f for f in info['filters']}
-    else:
-        try:
-            info = client.futures_exchange_info()
-            symbol_info = next((s for s in info['symbols'] if s['symbol'] == symbol), None)
-            if not symbol_info:
-                logger.error(f"[{symbol}] Не найдено в futures_exchange_info")
-                return
-            filters = {f['filterType']: f for f in symbol_info['filters']}
-        except Exception as e:
-            logger.error(f"[{symbol}] Ошибка при получении futures_exchange_info: {e}")
-            return
-
+async def place_grid_orders(gateway, symbol, mid_price, order_pct, book=None, quotes=None, volatility=None):
     try:
-        min_qty = float(filters['LOT_SIZE']['minQty'])
-        step_size = float(filters['LOT_SIZE']['stepSize'])
-        tick_size = float(filters['PRICE_FILTER']['tickSize'])
-        min_notional = float(filters.get('MIN_NOTIONAL', {}).get('minNotional', 10))
+        with metrics.timer(symbol, 'filters'):
+            filters = await exchange_info.get(gateway, symbol)
     except Exception as e:
-        logger.error(f"[{symbol}] Ошибка при обработке фильтров: {e}")
+        logger.error(f"[{symbol}] Ошибка при получении exchangeInfo: {e}")
+        return
+    if filters is None:
+        logger.error(f"[{symbol}] Не найдено в exchangeInfo")
         return
 
-    precision = abs(int(round(log10(step_size))))
+    min_qty = filters.min_qty
+    min_notional = filters.min_notional
+    precision = filters.precision
 
-    usdt = get_balance(symbol)
-    order_value = usdt * order_pct
-    qty = round(order_value / mid_price, precision)
+    usdt = await fetch_balance(symbol, gateway)
+    qty, order_value = order_size(usdt, mid_price, order_pct, precision)
 
     logger.info(f"[{symbol}] Подготовка ордера: qty={qty}, value={order_value:.2f}, min_qty={min_qty}, min_notional={min_notional}")
 
@@ -173,39 +261,34 @@ def place_grid_orders(client, trade_mode, symbol, mid_price, order_pct):
         return
 
     use_spread = os.getenv("USE_SPREAD", "true").lower() == "true"
-    step = 0.25
-    levels = 3
-
-    if use_spread:
-        for i in range(1, levels + 1):
-            buy_price = round_price(mid_price - i * step, tick_size)
-            sell_price = round_price(mid_price + i * step, tick_size)
-            try:
-                if trade_mode == 'spot':
-                    r1 = client.order_limit_buy(symbol=symbol, quantity=qty, price=str(buy_price))
-                    r2 = client.order_limit_sell(symbol=symbol, quantity=qty, price=str(sell_price))
-                else:
-                    r1 = client.futures_create_order(symbol=symbol, side='BUY', type='LIMIT', price=str(buy_price), quantity=qty, timeInForce='GTC')
-                    r2 = client.futures_create_order(symbol=symbol, side='SELL', type='LIMIT', price=str(sell_price), quantity=qty, timeInForce='GTC')
-                logger.info(f"[{symbol}] BUY {buy_price}, SELL {sell_price}, QTY {qty}")
-                logger.debug(f"[{symbol}] Ответ Binance BUY: {r1}")
-                logger.debug(f"[{symbol}] Ответ Binance SELL: {r2}")
-            except Exception as e:
-                logger.error(f"[{symbol}] Ошибка при размещении ордера: {e}")
-    else:
-        price = round_price(mid_price, tick_size)
-        try:
-            if trade_mode == 'spot':
-                r1 = client.order_limit_buy(symbol=symbol, quantity=qty, price=str(price))
-                r2 = client.order_limit_sell(symbol=symbol, quantity=qty, price=str(price))
-            else:
-                r1 = client.futures_create_order(symbol=symbol, side='BUY', type='LIMIT', price=str(price), quantity=qty, timeInForce='GTC')
-                r2 = client.futures_create_order(symbol=symbol, side='SELL', type='LIMIT', price=str(price), quantity=qty, timeInForce='GTC')
-            logger.info(f"[{symbol}] Без спреда по {price}, QTY {qty}")
-            logger.debug(f"[{symbol}] Ответ Binance BUY: {r1}")
-            logger.debug(f"[{symbol}] Ответ Binance SELL: {r2}")
-        except Exception as e:
-            logger.error(f"[{symbol}] Ошибка при размещении ордеров без спреда: {e}")
+    use_depth = os.getenv("USE_DEPTH_PRICING", "false").lower() == "true" and book is not None and book.synced
+    config = grid_config(symbol)
+    orders = build_grid_orders(mid_price, qty, filters, config, book, use_spread, use_depth, volatility)
+    # Уровни, не прошедшие minQty / minNotional после привязки к шагу, не выставляются
+    dropped = 2 * (config.levels if use_spread else 1) - len(orders)
+    if not orders:
+        logger.warning(f"[{symbol}] Пропущен: ни один уровень сетки не проходит min_qty={min_qty}, min_notional={min_notional}")
+        return
+    if dropped:
+        logger.debug(f"[{symbol}] Пропущено ордеров сетки ниже min_qty / min_notional: {dropped}")
+
+    # С менеджером котировок отправляется только дифф к живой сетке
+    with metrics.timer(symbol, 'order_ack'):
+        if quotes is not None:
+            results = await quotes.reconcile(orders, filters)
+        else:
+            results = await submit_orders(gateway, symbol, orders)
+    for res in results:
+        req = res.request
+        metrics.inc(symbol, 'orders_ok' if res.error is None else 'orders_rejected')
+        if res.error is None:
+            logger.info(f"[{symbol}] Уровень {req.level}: {req.side} {req.price}, QTY {req.qty}")
+            logger.debug(f"[{symbol}] Ответ Binance {req.side}: {res.response}")
+        else:
+            logger.error(f"[{symbol}] Уровень {req.level}: ошибка {req.side} {req.price}: {res.error}")
+            if is_filter_error(res.error):
+                exchange_info.invalidate(gateway)
+    return results
 
 def stop(update, context):
     if context.args:
@@ -213,17 +296,16 @@ def stop(update, context):
         try:
             client = client_instances[symbol]
             mode = TRADE_MODES[symbol]
-            if mode == 'spot':
+            if LOOP is not None and STOP_SYMBOL is not None:
+                # Задача символа в торговом цикле, затем его ордера; остальные символы торгуют дальше
+                run_on_loop(STOP_SYMBOL(symbol))
+            elif mode == 'spot':
                 orders = client.get_open_orders(symbol=symbol)
                 for o in orders:
                     client.cancel_order(symbol=symbol, orderId=o['orderId'])
             else:
                 client.futures_cancel_all_open_orders(symbol=symbol)
-
-            update.message.reply_text(f"🛑 Бот {symbol} остановлен. Все ордера удалены.")
-            logger.info(f"[{symbol}] Завершаем процесс по команде /stop")
-            import sys
-            sys.exit(0)  # завершает всё приложение, Docker перезапустит если настроено
+            update.message.reply_text(f"🛑 {symbol} остановлен, ордера удалены. Запуск снова: /restart {symbol}")
         except Exception as e:
             update.message.reply_text(f"❌ Ошибка при остановке: {e}")
     else:
@@ -1,81 +1,238 @@
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 DB_PATH = "trades.db"
+SCHEMA_VERSION = 3
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
+# === Одно долгоживущее соединение на поток ===
+# WAL позволяет потоку Telegram читать, пока торговый цикл пишет.
+_local = threading.local()
+
+def get_conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-16000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _local.conn = conn
+    return conn
+
+# id сделки Binance уникален только в пределах символа и рынка (spot / futures)
+def _create_trades(conn):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS trades (
-            id INTEGER PRIMARY KEY,
-            mode TEXT,
-            symbol TEXT,
+            id INTEGER NOT NULL,
+            mode TEXT NOT NULL,
+            symbol TEXT NOT NULL,
             side TEXT,
             price REAL,
             qty REAL,
             cost REAL,
-            timestamp TEXT
+            timestamp TEXT,
+            ts_ms INTEGER,
+            day TEXT,
+            fee REAL DEFAULT 0,
+            PRIMARY KEY (symbol, mode, id)
         )
     """)
-    conn.commit()
-    conn.close()
 
-def save_trade(trade_id, mode, symbol, side, price, qty):
-    conn = sqlite3.connect(DB_PATH)
+def init_db():
+    conn = get_conn()
     cursor = conn.cursor()
+    _create_trades(conn)
     cursor.execute("""
-        INSERT OR IGNORE INTO trades (id, mode, symbol, side, price, qty, cost, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        trade_id,
-        mode,
-        symbol,
-        side,
-        price,
-        qty,
-        price * qty,
-        datetime.utcnow().isoformat()
-    ))
+        CREATE TABLE IF NOT EXISTS daily_pnl (
+            symbol TEXT,
+            day TEXT,
+            buy_cost REAL DEFAULT 0,
+            sell_cost REAL DEFAULT 0,
+            buy_qty REAL DEFAULT 0,
+            sell_qty REAL DEFAULT 0,
+            fee REAL DEFAULT 0,
+            trade_count INTEGER DEFAULT 0,
+            PRIMARY KEY (symbol, day)
+        ) WITHOUT ROWID
+    """)
+    migrate(conn)
     conn.commit()
-    conn.close()
+
+# === Миграции схемы (PRAGMA user_version) ===
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        # 1: время сделки в мс и день (UTC) как отдельные колонки + индекс для PnL-запросов
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+        if 'ts_ms' not in columns:
+            conn.execute("ALTER TABLE trades ADD COLUMN ts_ms INTEGER")
+        if 'day' not in columns:
+            conn.execute("ALTER TABLE trades ADD COLUMN day TEXT")
+        conn.execute("""
+            UPDATE trades
+            SET ts_ms = CAST((julianday(timestamp) - 2440587.5) * 86400000 AS INTEGER),
+                day = date(timestamp)
+            WHERE day IS NULL
+        """)
+    if version < 2:
+        # 2: комиссия сделки (в котируемой валюте) и агрегат daily_pnl
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+        if 'fee' not in columns:
+            conn.execute("ALTER TABLE trades ADD COLUMN fee REAL DEFAULT 0")
+        _rebuild_daily_pnl(conn)
+    if version < 3:
+        # 3: ключ (symbol, mode, id) вместо id — с ним INSERT OR IGNORE терял сделки
+        # других символов с тем же id; агрегат пересобирается по новому ключу
+        pk = [row[1] for row in sorted(conn.execute("PRAGMA table_info(trades)"), key=lambda r: r[5]) if row[5]]
+        if pk != ['symbol', 'mode', 'id']:
+            conn.execute("ALTER TABLE trades RENAME TO trades_v2")
+            conn.execute("DROP INDEX IF EXISTS idx_trades_symbol_day")
+            _create_trades(conn)
+            conn.execute("""
+                INSERT OR IGNORE INTO trades (id, mode, symbol, side, price, qty, cost, timestamp, ts_ms, day, fee)
+                SELECT id, COALESCE(mode, ''), COALESCE(symbol, ''), side, price, qty, cost, timestamp, ts_ms, day, fee
+                FROM trades_v2
+            """)
+            conn.execute("DROP TABLE trades_v2")
+        _rebuild_daily_pnl(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_day ON trades (symbol, day, side, cost)")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def _rebuild_daily_pnl(conn):
+    conn.execute("DELETE FROM daily_pnl")
+    conn.execute("""
+        INSERT INTO daily_pnl (symbol, day, buy_cost, sell_cost, buy_qty, sell_qty, fee, trade_count)
+        SELECT symbol, day,
+               SUM(CASE WHEN side='BUY' THEN cost ELSE 0 END),
+               SUM(CASE WHEN side='SELL' THEN cost ELSE 0 END),
+               SUM(CASE WHEN side='BUY' THEN qty ELSE 0 END),
+               SUM(CASE WHEN side='SELL' THEN qty ELSE 0 END),
+               SUM(COALESCE(fee, 0)),
+               COUNT(*)
+        FROM trades
+        WHERE day IS NOT NULL
+        GROUP BY symbol, day
+    """)
+
+# Пересборка агрегата из сырых сделок: python db.py rebuild
+def rebuild_daily_pnl():
+    conn = get_conn()
+    with conn:
+        _rebuild_daily_pnl(conn)
+    return conn.execute("SELECT COUNT(*) FROM daily_pnl").fetchone()[0]
+
+def trade_day(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).date().isoformat()
+
+def save_trade(trade_id, mode, symbol, side, price, qty, ts_ms=None, fee=0):
+    save_trades([(trade_id, mode, symbol, side, price, qty, ts_ms, fee)])
+
+# Пачка сделок (trade_id, mode, symbol, side, price, qty[, ts_ms[, fee]]) одной транзакцией.
+# ts_ms — время сделки на бирже (по умолчанию текущее), fee — комиссия в котируемой валюте.
+# Вставка одним executemany; daily_pnl в той же транзакции учитывает только новые сделки:
+# если вставлены все — прибавляем пачку, если часть (повтор из REST-сверки) — executemany
+# не говорит, какие именно, и затронутые дни пересобираются из trades.
+def save_trades(trades):
+    now_ms = int(time.time() * 1000)
+    rows = []
+    for t in trades:
+        trade_id, mode, symbol, side, price, qty = t[:6]
+        ts_ms = t[6] if len(t) > 6 and t[6] else now_ms
+        fee = t[7] if len(t) > 7 and t[7] else 0
+        timestamp = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat()
+        rows.append((trade_id, mode, symbol, side, price, qty, price * qty, timestamp, ts_ms, trade_day(ts_ms), fee))
+    conn = get_conn()
+    with conn:
+        before = conn.total_changes
+        conn.executemany("""
+            INSERT OR IGNORE INTO trades (id, mode, symbol, side, price, qty, cost, timestamp, ts_ms, day, fee)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        inserted = conn.total_changes - before
+        if inserted == len(rows):
+            _add_daily_pnl(conn, rows)
+        elif inserted:
+            _refresh_daily_pnl(conn, {(r[2], r[9]) for r in rows})
+
+def _add_daily_pnl(conn, rows):
+    totals = {}  # (symbol, day) -> [buy_cost, sell_cost, buy_qty, sell_qty, fee, count]
+    for _, _, symbol, side, _, qty, cost, _, _, day, fee in rows:
+        agg = totals.setdefault((symbol, day), [0, 0, 0, 0, 0, 0])
+        if side == 'BUY':
+            agg[0] += cost
+            agg[2] += qty
+        else:
+            agg[1] += cost
+            agg[3] += qty
+        agg[4] += fee
+        agg[5] += 1
+    conn.executemany("""
+        INSERT INTO daily_pnl (symbol, day, buy_cost, sell_cost, buy_qty, sell_qty, fee, trade_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (symbol, day) DO UPDATE SET
+            buy_cost = buy_cost + excluded.buy_cost,
+            sell_cost = sell_cost + excluded.sell_cost,
+            buy_qty = buy_qty + excluded.buy_qty,
+            sell_qty = sell_qty + excluded.sell_qty,
+            fee = fee + excluded.fee,
+            trade_count = trade_count + excluded.trade_count
+    """, [(symbol, day, *agg) for (symbol, day), agg in totals.items()])
+
+def _refresh_daily_pnl(conn, keys):
+    conn.executemany("""
+        INSERT OR REPLACE INTO daily_pnl (symbol, day, buy_cost, sell_cost, buy_qty, sell_qty, fee, trade_count)
+        SELECT symbol, day,
+               SUM(CASE WHEN side='BUY' THEN cost ELSE 0 END),
+               SUM(CASE WHEN side='SELL' THEN cost ELSE 0 END),
+               SUM(CASE WHEN side='BUY' THEN qty ELSE 0 END),
+               SUM(CASE WHEN side='SELL' THEN qty ELSE 0 END),
+               SUM(COALESCE(fee, 0)),
+               COUNT(*)
+        FROM trades
+        WHERE symbol = ? AND day = ?
+        GROUP BY symbol, day
+    """, sorted(keys))
 
 def get_today_pnl(symbol):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     today = datetime.utcnow().date().isoformat()
-    cursor.execute("""
-        SELECT side, SUM(cost), COUNT(*)
-        FROM trades
-        WHERE date(timestamp) = ? AND symbol = ?
-        GROUP BY side
-    """, (today, symbol))
-    rows = cursor.fetchall()
-    conn.close()
-
-    total_buy = total_sell = 0
-    for row in rows:
-        if row[0] == 'BUY':
-            total_buy = row[1]
-        elif row[0] == 'SELL':
-            total_sell = row[1]
-    pnl = (total_sell or 0) - (total_buy or 0)
-    total_trades = sum(r[2] for r in rows)
-    return pnl, total_trades
+    row = get_conn().execute(
+        "SELECT sell_cost - buy_cost, trade_count FROM daily_pnl WHERE symbol = ? AND day = ?",
+        (symbol, today)).fetchone()
+    return row if row else (0, 0)
 
 def get_pnl_history(symbol, limit=7):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = get_conn().cursor()
     cursor.execute("""
-        SELECT date(timestamp), 
-               SUM(CASE WHEN side='SELL' THEN cost ELSE 0 END) -
-               SUM(CASE WHEN side='BUY' THEN cost ELSE 0 END) as pnl
-        FROM trades
+        SELECT day, sell_cost - buy_cost
+        FROM daily_pnl
         WHERE symbol = ?
-        GROUP BY date(timestamp)
-        ORDER BY date(timestamp) DESC
+        ORDER BY day DESC
         LIMIT ?
     """, (symbol, limit))
     rows = cursor.fetchall()
-    conn.close()
     return list(reversed(rows))
+
+# Итоги по всем символам за последние days дней (включая сегодня):
+# [(symbol, pnl, fee, trade_count), ...]
+def get_pnl_totals(days=30):
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    cursor = get_conn().cursor()
+    cursor.execute("""
+        SELECT symbol, SUM(sell_cost - buy_cost), SUM(fee), SUM(trade_count)
+        FROM daily_pnl
+        WHERE day >= ?
+        GROUP BY symbol
+        ORDER BY symbol
+    """, (since,))
+    return cursor.fetchall()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['rebuild']:
+        init_db()
+        print(f"daily_pnl пересобрана: {rebuild_daily_pnl()} строк")
+    else:
+        print("Использование: python db.py rebuild")
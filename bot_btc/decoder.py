@@ -0,0 +1,178 @@
+# decoder.py
+import argparse
+import json
+import time
+from collections import namedtuple
+
+# === JSON-бэкенд ===
+# orjson / ujson, если установлены (опционально, не в requirements.txt), иначе stdlib.
+# Все бэкенды принимают str и bytes.
+BACKENDS = {'json': json.loads}
+try:
+    import ujson
+    BACKENDS['ujson'] = ujson.loads
+except ImportError:
+    pass
+try:
+    import orjson
+    BACKENDS['orjson'] = orjson.loads
+except ImportError:
+    pass
+
+BACKEND = 'orjson' if 'orjson' in BACKENDS else 'ujson' if 'ujson' in BACKENDS else 'json'
+loads = BACKENDS[BACKEND]
+
+
+def decode_json(text):
+    return loads(text)
+
+
+def use_backend(name):
+    global BACKEND, loads
+    if name not in BACKENDS:
+        raise ValueError(f"JSON-бэкенд {name} не установлен, доступны: {', '.join(BACKENDS)}")
+    BACKEND = name
+    loads = BACKENDS[name]
+
+
+# === Типизированные сообщения ===
+# Берутся только нужные боту поля, цены и объёмы сразу во float — как в LocalOrderBook.
+# bids / asks — списки уровней [цена, объём]; prev_id (pu) есть только у фьючерсов.
+DepthUpdate = namedtuple('DepthUpdate', 'symbol event_time first_id last_id prev_id bids asks')
+AggTrade = namedtuple('AggTrade', 'symbol event_time trade_id price qty trade_time buyer_maker')
+BookTicker = namedtuple('BookTicker', 'symbol event_time update_id bid bid_qty ask ask_qty')
+# executionReport (спот) и ORDER_TRADE_UPDATE (фьючерсы) в одном виде.
+# client_order_id у отменённого спотового ордера — исходный (поле "C").
+ExecutionReport = namedtuple('ExecutionReport', 'symbol client_order_id order_id side status exec_type '
+                                                'price qty filled last_price last_qty fee fee_asset '
+                                                'trade_id trade_time event_time')
+
+
+# Уровни переводятся во float на месте: без новых списков и кортежей на каждый уровень
+def _levels(levels):
+    for level in levels:
+        level[0] = float(level[0])
+        level[1] = float(level[1])
+    return levels
+
+
+def depth_update(data):
+    return DepthUpdate(data['s'], data.get('E'), data['U'], data['u'], data.get('pu'),
+                       _levels(data['b']), _levels(data['a']))
+
+
+def agg_trade(data):
+    return AggTrade(data['s'], data.get('E'), data['a'], float(data['p']), float(data['q']), data['T'], data['m'])
+
+
+# У спотового bookTicker нет "e" и "E"
+def book_ticker(data):
+    return BookTicker(data['s'], data.get('E'), data['u'], float(data['b']), float(data['B']),
+                      float(data['a']), float(data['A']))
+
+
+def execution_report(event):
+    etype = event.get('e')
+    if etype == 'ORDER_TRADE_UPDATE':
+        o = event['o']
+    elif etype == 'executionReport':
+        o = event
+    else:
+        return None
+    status = o['X']
+    client_order_id = o['C'] if status == 'CANCELED' and o.get('C') else o['c']
+    return ExecutionReport(o['s'], client_order_id, o['i'], o['S'], status, o['x'],
+                           float(o['p']), float(o['q']), float(o['z']), float(o['L']), float(o['l']),
+                           float(o.get('n') or 0), o.get('N'), o.get('t'), o.get('T'), event.get('E'))
+
+
+MARKET_DECODERS = {'depthUpdate': depth_update, 'aggTrade': agg_trade, 'bookTicker': book_ticker}
+
+
+# Сообщение combined-потока /stream: (имя потока, структура). Ответы на SUBSCRIBE
+# и ошибки — (None, dict), неизвестные события — (имя потока, None).
+def decode_market(raw):
+    msg = loads(raw)
+    stream = msg.get('stream')
+    if stream is None:
+        return None, msg
+    data = msg.get('data')
+    if not data:
+        return stream, None
+    decode = MARKET_DECODERS.get(data.get('e'))
+    if decode is None:
+        return stream, book_ticker(data) if 'A' in data and 'u' in data else None
+    return stream, decode(data)
+
+
+# Событие потока пользовательских данных: ExecutionReport для ордеров, dict для остального
+def decode_user(raw):
+    event = loads(raw)
+    return execution_report(event) or event
+
+
+# === Микро-бенчмарк: python decoder.py ===
+# legacy — прежний путь: json.loads в dict и float() уже в стакане.
+def _sample_messages(levels):
+    bids = [[f"{30000 - i * 0.01:.2f}", f"{0.001 * (i + 1):.5f}"] for i in range(levels)]
+    asks = [[f"{30000.01 + i * 0.01:.2f}", f"{0.002 * (i + 1):.5f}"] for i in range(levels)]
+    depth = json.dumps({'stream': 'btcusdt@depth@100ms', 'data': {
+        'e': 'depthUpdate', 'E': 1700000000000, 's': 'BTCUSDT', 'U': 100, 'u': 120, 'b': bids, 'a': asks}})
+    ticker = json.dumps({'stream': 'btcusdt@bookTicker', 'data': {
+        'u': 400900217, 's': 'BTCUSDT', 'b': '30000.00', 'B': '31.21', 'a': '30000.01', 'A': '40.66'}})
+    report = json.dumps({
+        'e': 'executionReport', 'E': 1700000000000, 's': 'BTCUSDT', 'c': 'mm-B1-123', 'S': 'BUY', 'o': 'LIMIT',
+        'f': 'GTC', 'q': '0.00100000', 'p': '30000.00', 'P': '0.00', 'F': '0.00', 'g': -1, 'C': '', 'x': 'TRADE',
+        'X': 'FILLED', 'r': 'NONE', 'i': 4293153, 'l': '0.00100000', 'z': '0.00100000', 'L': '30000.00',
+        'n': '0.00003', 'N': 'USDT', 'T': 1700000000000, 't': 12345, 'I': 8641984, 'w': False, 'm': True,
+        'M': True, 'O': 1700000000000, 'Z': '30.00', 'Y': '30.00', 'Q': '0.00', 'W': 1700000000000, 'V': 'NONE'})
+    return {'depth': depth, 'bookTicker': ticker, 'executionReport': report}
+
+
+def _legacy_market(raw):
+    data = json.loads(raw)['data']
+    if 'b' in data and isinstance(data['b'], list):
+        for p, q in data['b']:
+            float(p), float(q)
+        for p, q in data['a']:
+            float(p), float(q)
+    else:
+        float(data['b']), float(data['B']), float(data['a']), float(data['A'])
+
+
+_LegacyUpdate = namedtuple('_LegacyUpdate', 'symbol client_order_id order_id side status price qty filled')
+
+
+# Как прежний parse_order_update в user_stream плюс float полей исполнения
+def _legacy_user(raw):
+    e = json.loads(raw)
+    _LegacyUpdate(e['s'], e['c'], e['i'], e['S'], e['X'], float(e['p']), float(e['q']), float(e['z']))
+    float(e['L']), float(e['l']), float(e.get('n') or 0)
+
+
+def _rate(func, raw, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func(raw)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость декодирования сообщений потоков")
+    parser.add_argument('--count', type=int, default=20000, help="сообщений на замер")
+    parser.add_argument('--levels', type=int, default=20, help="уровней на сторону в depthUpdate")
+    args = parser.parse_args()
+
+    for kind, raw in _sample_messages(args.levels).items():
+        legacy = _legacy_user if kind == 'executionReport' else _legacy_market
+        decode = decode_user if kind == 'executionReport' else decode_market
+        base = _rate(legacy, raw, args.count)
+        print(f"{kind} ({len(raw)} байт): legacy {base:,.0f} сообщ./с")
+        for name in BACKENDS:
+            use_backend(name)
+            rate = _rate(decode, raw, args.count)
+            print(f"  {name}: {rate:,.0f} сообщ./с ({rate / base:.2f}x), {1e6 / rate:.2f} мкс/сообщ.")
+
+
+if __name__ == '__main__':
+    main()
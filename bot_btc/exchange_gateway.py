@@ -0,0 +1,213 @@
+# exchange_gateway.py
+import hashlib
+import hmac
+import json
+import time
+from collections import namedtuple
+from urllib.parse import urlencode, urlparse
+import aiohttp
+from decoder import decode_json
+from rate_governor import governor_for, PRIORITY_CRITICAL, PRIORITY_QUOTE, PRIORITY_SYNC, PRIORITY_LOW
+
+RECV_WINDOW = 5000
+REQUEST_TIMEOUT = 10
+
+RateLimits = namedtuple('RateLimits', 'weight orders')  # {'1m': 120}, {'10s': 3, '1d': 50}
+
+
+class APIError(Exception):
+    def __init__(self, status, code, msg):
+        super().__init__(f"APIError(status={status}, code={code}): {msg}")
+        self.status = status
+        self.code = code
+        self.msg = msg
+
+
+# Заголовки X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S -> {'1m': n}, {'10s': n}
+def parse_rate_limits(headers):
+    weight, orders = {}, {}
+    for name, value in headers.items():
+        lname = name.lower()
+        if lname.startswith('x-mbx-used-weight-'):
+            weight[lname[len('x-mbx-used-weight-'):]] = int(value)
+        elif lname.startswith('x-mbx-order-count-'):
+            orders[lname[len('x-mbx-order-count-'):]] = int(value)
+    return RateLimits(weight, orders)
+
+
+# Число без экспоненты: 1e-05 -> "0.00001"
+def fmt_number(x):
+    if isinstance(x, str):
+        return x
+    return f"{x:.8f}".rstrip('0').rstrip('.')
+
+
+# === Общие keep-alive сессии: одна на хост API ===
+_sessions = {}
+
+
+def get_session(url):
+    host = urlparse(url).netloc
+    session = _sessions.get(host)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=100, keepalive_timeout=60)
+        session = _sessions[host] = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+    return session
+
+
+async def close_sessions():
+    for session in _sessions.values():
+        await session.close()
+    _sessions.clear()
+
+
+# === Асинхронный шлюз к REST API Binance ===
+# Адреса и ключи берутся из синхронного клиента символа, поэтому переопределения
+# API_URL / FUTURES_URL (тестнет) действуют и здесь. Запросы подписываются HMAC,
+# разобранные лимиты из заголовков последнего ответа лежат в rate_limits.
+class ExchangeGateway:
+    def __init__(self, client, trade_mode):
+        self.trade_mode = trade_mode
+        self.futures = trade_mode != 'spot'
+        self.api_url = client.FUTURES_URL if self.futures else client.API_URL
+        self.api_key = client.API_KEY
+        self.api_secret = client.API_SECRET
+        self.rate_limits = RateLimits({}, {})
+        self.governor = governor_for(self.api_url, trade_mode)
+        self.listeners = []  # callback(rate_limits, status) после каждого ответа
+
+    def _sign(self, params):
+        params['timestamp'] = int(time.time() * 1000)
+        params['recvWindow'] = RECV_WINDOW
+        query = urlencode(params)
+        signature = hmac.new(self.api_secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+        return f"{query}&signature={signature}"
+
+    # weight / orders — расход лимитов запроса, priority — очередь в RateGovernor
+    async def request(self, method, path, params=None, signed=False, weight=1, orders=0, priority=PRIORITY_SYNC):
+        await self.governor.acquire(weight, orders, priority)
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        query = self._sign(params) if signed else urlencode(params)
+        url = f"{self.api_url}/{path}"
+        if query:
+            url = f"{url}?{query}"
+        headers = {'X-MBX-APIKEY': self.api_key} if self.api_key else {}
+        async with get_session(self.api_url).request(method, url, headers=headers) as resp:
+            self.rate_limits = parse_rate_limits(resp.headers)
+            self.governor.update(self.rate_limits, resp.status, resp.headers.get('Retry-After'))
+            for listener in self.listeners:
+                listener(self.rate_limits, resp.status)
+            data = await resp.json(loads=decode_json, content_type=None)
+            if resp.status >= 400:
+                code = data.get('code') if isinstance(data, dict) else None
+                msg = data.get('msg') if isinstance(data, dict) else data
+                raise APIError(resp.status, code, msg)
+            return data
+
+    # === Операции, которые использует бот ===
+    async def exchange_info(self):
+        return await self.request('GET', 'v1/exchangeInfo' if self.futures else 'v3/exchangeInfo',
+                                  weight=1 if self.futures else 20)
+
+    # Вес снимка стакана растёт с limit (спот 1000 — 50, фьючерсы 1000 — 20)
+    async def depth(self, symbol, limit=1000, priority=PRIORITY_LOW):
+        if self.futures:
+            weight = 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+        else:
+            weight = 5 if limit <= 100 else 25 if limit <= 500 else 50
+        return await self.request('GET', 'v1/depth' if self.futures else 'v3/depth',
+                                  {'symbol': symbol, 'limit': limit}, weight=weight, priority=priority)
+
+    # listenKey потока пользовательских данных: только заголовок с ключом, без подписи
+    async def new_listen_key(self):
+        path = 'v1/listenKey' if self.futures else 'v3/userDataStream'
+        data = await self.request('POST', path, weight=1 if self.futures else 2, priority=PRIORITY_LOW)
+        return data['listenKey']
+
+    async def keepalive_listen_key(self, listen_key):
+        if self.futures:
+            return await self.request('PUT', 'v1/listenKey', weight=1, priority=PRIORITY_LOW)
+        return await self.request('PUT', 'v3/userDataStream', {'listenKey': listen_key}, weight=2,
+                                  priority=PRIORITY_LOW)
+
+    async def account(self, priority=PRIORITY_SYNC):
+        return await self.request('GET', 'v3/account', signed=True, weight=20, priority=priority)
+
+    async def futures_balances(self, priority=PRIORITY_SYNC):
+        return await self.request('GET', 'v2/balance', signed=True, weight=5, priority=priority)
+
+    async def positions(self, priority=PRIORITY_SYNC):
+        return await self.request('GET', 'v2/positionRisk', signed=True, weight=5, priority=priority)
+
+    async def get_balance(self, asset='USDT', priority=PRIORITY_SYNC, locked=False):
+        if self.futures:
+            for b in await self.futures_balances(priority):
+                if b['asset'] == asset:
+                    return float(b['balance'])
+            return 0.0
+        for b in (await self.account(priority))['balances']:
+            if b['asset'] == asset:
+                return float(b['free']) + (float(b['locked']) if locked else 0.0)
+        return 0.0
+
+    def _order_params(self, symbol, side, price, qty, client_order_id=None):
+        return {
+            'symbol': symbol,
+            'side': side,
+            'type': 'LIMIT',
+            'timeInForce': 'GTC',
+            'price': fmt_number(price),
+            'quantity': fmt_number(qty),
+            'newClientOrderId': client_order_id,
+        }
+
+    async def new_order(self, symbol, side, price, qty, client_order_id=None):
+        params = self._order_params(symbol, side, price, qty, client_order_id)
+        return await self.request('POST', 'v1/order' if self.futures else 'v3/order', params, signed=True,
+                                  weight=0 if self.futures else 1, orders=1, priority=PRIORITY_QUOTE)
+
+    # Только фьючерсы: до 5 ордеров за запрос, ответ — по ордеру на позицию
+    async def batch_orders(self, symbol, orders):
+        batch = [{k: v for k, v in self._order_params(symbol, *o).items() if v is not None} for o in orders]
+        params = {'batchOrders': json.dumps(batch, separators=(',', ':'))}
+        return await self.request('POST', 'v1/batchOrders', params, signed=True,
+                                  weight=5, orders=len(batch), priority=PRIORITY_QUOTE)
+
+    # Только фьючерсы: изменение цены/количества LIMIT-ордера без снятия
+    async def modify_order(self, symbol, side, price, qty, order_id=None, client_order_id=None):
+        params = {
+            'symbol': symbol,
+            'side': side,
+            'price': fmt_number(price),
+            'quantity': fmt_number(qty),
+            'orderId': order_id,
+            'origClientOrderId': client_order_id,
+        }
+        return await self.request('PUT', 'v1/order', params, signed=True, orders=1, priority=PRIORITY_QUOTE)
+
+    # Только спот: снять и выставить заново одним запросом
+    async def cancel_replace(self, symbol, side, price, qty, cancel_client_order_id, client_order_id=None):
+        params = self._order_params(symbol, side, price, qty, client_order_id)
+        params['cancelReplaceMode'] = 'STOP_ON_FAILURE'
+        params['cancelOrigClientOrderId'] = cancel_client_order_id
+        return await self.request('POST', 'v3/order/cancelReplace', params, signed=True, orders=1, priority=PRIORITY_QUOTE)
+
+    async def cancel_order(self, symbol, order_id=None, client_order_id=None):
+        params = {'symbol': symbol, 'orderId': order_id, 'origClientOrderId': client_order_id}
+        return await self.request('DELETE', 'v1/order' if self.futures else 'v3/order', params, signed=True,
+                                  priority=PRIORITY_CRITICAL)
+
+    async def cancel_all(self, symbol):
+        path = 'v1/allOpenOrders' if self.futures else 'v3/openOrders'
+        return await self.request('DELETE', path, {'symbol': symbol}, signed=True, priority=PRIORITY_CRITICAL)
+
+    async def open_orders(self, symbol):
+        return await self.request('GET', 'v1/openOrders' if self.futures else 'v3/openOrders', {'symbol': symbol},
+                                  signed=True, weight=1 if self.futures else 6)
+
+    async def my_trades(self, symbol, from_id=None, limit=1000):
+        params = {'symbol': symbol, 'fromId': from_id, 'limit': limit}
+        return await self.request('GET', 'v1/userTrades' if self.futures else 'v3/myTrades', params, signed=True,
+                                  weight=5 if self.futures else 20)
+
@@ -0,0 +1,81 @@
+# exchange_info.py
+import asyncio
+import os
+import time
+from collections import namedtuple
+from math import log10
+from loguru import logger
+
+EXCHANGE_INFO_TTL = int(os.getenv("EXCHANGE_INFO_TTL", "3600"))
+
+# Коды ошибок Binance, означающие нарушение фильтров символа
+FILTER_ERROR_CODES = {-1013, -1111, -4003, -4014, -4023, -4164}
+
+SymbolFilters = namedtuple('SymbolFilters', 'min_qty step_size tick_size min_notional precision price_precision')
+
+
+def _precision(step):
+    return max(-int(round(log10(step))), 0)
+
+
+def parse_filters(symbol_info):
+    filters = {f['filterType']: f for f in symbol_info['filters']}
+    min_qty = float(filters['LOT_SIZE']['minQty'])
+    step_size = float(filters['LOT_SIZE']['stepSize'])
+    tick_size = float(filters['PRICE_FILTER']['tickSize'])
+    notional = filters.get('MIN_NOTIONAL') or filters.get('NOTIONAL') or {}
+    min_notional = float(notional.get('minNotional', notional.get('notional', 10)))
+    return SymbolFilters(min_qty, step_size, tick_size, min_notional, _precision(step_size), _precision(tick_size))
+
+
+def is_filter_error(e):
+    return getattr(e, 'code', None) in FILTER_ERROR_CODES
+
+
+# === Кэш exchangeInfo ===
+# Загружается один раз на сервер (спот/фьючерсы, прод/тестнет) и индексирует
+# разобранные фильтры по символу. Обновляется по TTL или после отказа биржи по фильтру.
+class ExchangeInfoCache:
+    def __init__(self, ttl=EXCHANGE_INFO_TTL):
+        self.ttl = ttl
+        self._filters = {}    # источник -> {символ: SymbolFilters}
+        self._loaded_at = {}  # источник -> время загрузки
+        self._locks = {}
+
+    async def load(self, gateway):
+        info = await gateway.exchange_info()
+        gateway.governor.seed(info.get('rateLimits', []))
+        parsed = {}
+        for s in info['symbols']:
+            try:
+                parsed[s['symbol']] = parse_filters(s)
+            except (KeyError, ValueError):
+                continue
+        self._filters[gateway.api_url] = parsed
+        self._loaded_at[gateway.api_url] = time.monotonic()
+        logger.info(f"[exchangeInfo] Загружено {len(parsed)} символов ({gateway.trade_mode})")
+        return parsed
+
+    def _expired(self, source):
+        # после invalidate() времени загрузки нет — перезагрузка сразу, а не по TTL от 0
+        if source not in self._filters or source not in self._loaded_at:
+            return True
+        return time.monotonic() - self._loaded_at[source] > self.ttl
+
+    async def get(self, gateway, symbol):
+        source = gateway.api_url
+        if self._expired(source):
+            lock = self._locks.setdefault(source, asyncio.Lock())
+            async with lock:
+                if self._expired(source):  # другой символ мог уже загрузить
+                    await self.load(gateway)
+        return self._filters[source].get(symbol)
+
+    def invalidate(self, gateway=None):
+        if gateway is None:
+            self._loaded_at.clear()
+        else:
+            self._loaded_at.pop(gateway.api_url, None)
+
+
+exchange_info = ExchangeInfoCache()
@@ -0,0 +1,76 @@
+# fill_store.py
+import os
+from array import array
+
+FILL_BUFFER_SIZE = int(os.getenv("FILL_BUFFER_SIZE", "10000"))
+
+SIDE_BUY = 1
+SIDE_SELL = -1
+
+
+# === Последние исполнения в кольцевом буфере ===
+# Колонки — массивы array фиксированной длины (id, время, сторона, цена, объём, комиссия),
+# ~41 байт на сделку вместо словаря. Все сделки сразу пишутся в SQLite (save_trades),
+# поэтому вытесненные из буфера остаются в базе; память не растёт со временем работы.
+class FillStore:
+    def __init__(self, capacity=FILL_BUFFER_SIZE):
+        self.capacity = capacity
+        self.ids = array('q', bytes(8 * capacity))
+        self.ts = array('q', bytes(8 * capacity))
+        self.sides = array('b', bytes(capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self.qtys = array('d', bytes(8 * capacity))
+        self.fees = array('d', bytes(8 * capacity))
+        self.head = 0   # позиция следующей записи
+        self.size = 0
+        self.total = 0  # всего сделок за сессию, включая вытесненные
+
+    def __len__(self):
+        return self.size
+
+    def append(self, trade_id, ts_ms, side, price, qty, fee=0.0):
+        i = self.head
+        self.ids[i] = trade_id
+        self.ts[i] = ts_ms
+        self.sides[i] = SIDE_BUY if side == 'BUY' else SIDE_SELL
+        self.prices[i] = price
+        self.qtys[i] = qty
+        self.fees[i] = fee
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    # Индексы буфера от старых к новым (или только последние n)
+    def _indices(self, n=None):
+        n = self.size if n is None else min(n, self.size)
+        start = (self.head - n) % self.capacity
+        return ((start + k) % self.capacity for k in range(n))
+
+    # (id, ts_ms, side, price, qty, fee) от старых к новым
+    def recent(self, n=None):
+        for i in self._indices(n):
+            yield (self.ids[i], self.ts[i], 'BUY' if self.sides[i] == SIDE_BUY else 'SELL',
+                   self.prices[i], self.qtys[i], self.fees[i])
+
+    # Агрегаты по сделкам в буфере с ts_ms >= since_ms:
+    # (buy_qty, buy_cost, sell_qty, sell_cost, fee, count)
+    def totals(self, since_ms=0):
+        bq = bc = sq = sc = fee = 0.0
+        count = 0
+        for i in self._indices():
+            if self.ts[i] < since_ms:
+                continue
+            cost = self.prices[i] * self.qtys[i]
+            if self.sides[i] == SIDE_BUY:
+                bq += self.qtys[i]
+                bc += cost
+            else:
+                sq += self.qtys[i]
+                sc += cost
+            fee += self.fees[i]
+            count += 1
+        return bq, bc, sq, sc, fee, count
+
+
+# Буферы текущей сессии по символам: пишет main_bot, читает команда /fills
+session_fills = {}
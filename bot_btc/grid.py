@@ -0,0 +1,164 @@
+# grid.py
+import math
+import os
+from collections import namedtuple
+import numpy as np
+from orders import OrderRequest
+
+GRID_LEVELS = 3
+GRID_STEP = 0.25          # arithmetic: шаг между уровнями, USDT
+GRID_STEP_PCT = 0.0001    # geometric: множитель (1 + step_pct) между уровнями
+GRID_VOL_MULT = 1.0       # volatility: шаг = vol_mult × σ × mid
+GRID_VOL_HALFLIFE = 20    # циклов
+GRID_VOL_WARMUP = 5       # до стольких замеров σ шаг как в arithmetic
+SPACINGS = ('arithmetic', 'geometric', 'volatility')
+SNAP_EPS = 1e-9           # допуск округления float при привязке к шагу
+
+# skew — перекос объёма по уровням: вес уровня i = (1 + skew)^(i - 1), нормированный
+# к среднему 1, так что суммарный объём сетки не зависит от skew
+GridConfig = namedtuple('GridConfig', 'levels spacing step step_pct vol_mult skew',
+                        defaults=(GRID_LEVELS, 'arithmetic', GRID_STEP, GRID_STEP_PCT, GRID_VOL_MULT, 0.0))
+
+# Массивы по уровням; buy_ok / sell_ok — уровень проходит minQty / minNotional
+GridLadder = namedtuple('GridLadder', 'levels buy_prices sell_prices qtys buy_ok sell_ok')
+
+
+def round_price(price, step):
+    return round(round(price / step) * step, 8)
+
+
+# Параметры сетки символа: {SYMBOL}_GRID_* перекрывает общий GRID_*
+def grid_config(symbol):
+    def env(name, default):
+        return os.getenv(f"{symbol}_{name}", os.getenv(name, default))
+    config = GridConfig(int(env("GRID_LEVELS", GRID_LEVELS)), env("GRID_SPACING", "arithmetic").lower(),
+                        float(env("GRID_STEP", GRID_STEP)), float(env("GRID_STEP_PCT", GRID_STEP_PCT)),
+                        float(env("GRID_VOL_MULT", GRID_VOL_MULT)), float(env("GRID_SKEW", 0.0)))
+    if config.spacing not in SPACINGS:
+        raise ValueError(f"[{symbol}] GRID_SPACING={config.spacing}, допустимо: {', '.join(SPACINGS)}")
+    return config
+
+
+# Объём ордера: доля баланса по текущей цене
+def order_size(balance, mid_price, order_pct, precision):
+    order_value = balance * order_pct
+    return round(order_value / mid_price, precision), order_value
+
+
+# === Оценка волатильности для spacing=volatility ===
+# EWMA квадрата лог-доходности mid между циклами котировок: σ на горизонте перекотировки
+class VolatilityEstimator:
+    def __init__(self, halflife=GRID_VOL_HALFLIFE, warmup=GRID_VOL_WARMUP):
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.warmup = warmup
+        self.variance = 0.0
+        self.samples = 0
+        self.last = None
+
+    def update(self, mid_price):
+        if self.last:
+            r = math.log(mid_price / self.last)
+            self.variance = r * r if not self.samples else self.variance + self.alpha * (r * r - self.variance)
+            self.samples += 1
+        self.last = mid_price
+
+    @property
+    def sigma(self):
+        return math.sqrt(self.variance) if self.samples >= self.warmup else None
+
+
+_level_cache = {}
+
+
+# Номера уровней 1..n и нормированные веса объёма — один раз на (n, skew)
+def _levels(levels, skew):
+    key = (levels, skew)
+    cached = _level_cache.get(key)
+    if cached is None:
+        index = np.arange(1, levels + 1, dtype=np.float64)
+        weights = (1.0 + skew) ** (index - 1)
+        cached = _level_cache[key] = (index, weights / weights.mean())
+    return cached
+
+
+def snap_down(values, step):
+    return np.round(np.floor(values / step + SNAP_EPS) * step, 10)
+
+
+def snap_up(values, step):
+    return np.round(np.ceil(values / step - SNAP_EPS) * step, 10)
+
+
+# Цены, до которых нужно пройти сторону стакана, чтобы набрать depth_qty (NaN — не хватает глубины)
+def depth_prices(side, depth_qty):
+    cum = side.cumulative()
+    if not cum:
+        return np.full(len(depth_qty), np.nan)
+    j = np.searchsorted(cum, depth_qty, 'left')
+    keys = np.asarray(side.keys)
+    prices = keys[len(keys) - 1 - np.minimum(j, len(cum) - 1)] * side.sign
+    return np.where(j < len(cum), prices, np.nan)
+
+
+# Сырые цены уровней до привязки к тику
+def ladder_prices(mid_price, index, config, volatility=None):
+    if config.spacing == 'geometric':
+        factor = (1.0 + config.step_pct) ** index
+        return mid_price / factor, mid_price * factor
+    step = config.step
+    if config.spacing == 'volatility' and volatility:
+        step = config.vol_mult * volatility * mid_price
+    offsets = index * step
+    return mid_price - offsets, mid_price + offsets
+
+
+# === Сетка целиком одним векторным проходом ===
+# Цены уровней по spacing, объёмы с перекосом skew, buy — вниз к tick_size, sell — вверх
+# (котировка не подходит к mid ближе расчётной), объём — вниз к step_size. С use_depth
+# уровень не ближе цены, за которой в стакане накоплен объём сетки до этого уровня.
+def grid_ladder(mid_price, qty, filters, config=GridConfig(), book=None, use_depth=False, volatility=None):
+    index, weights = _levels(config.levels, config.skew)
+    buy, sell = ladder_prices(mid_price, index, config, volatility)
+    qtys = snap_down(qty * weights, filters.step_size)
+    if use_depth and book is not None:
+        depth_qty = np.cumsum(qtys)
+        buy = np.fmin(buy, depth_prices(book.bids, depth_qty))
+        sell = np.fmax(sell, depth_prices(book.asks, depth_qty))
+    buy = snap_down(buy, filters.tick_size)
+    sell = snap_up(sell, filters.tick_size)
+    size_ok = qtys >= max(filters.min_qty, filters.step_size)
+    buy_ok = size_ok & (buy > 0) & (buy * qtys >= filters.min_notional)
+    sell_ok = size_ok & (sell * qtys >= filters.min_notional)
+    return GridLadder(index.astype(np.int64), buy, sell, qtys, buy_ok, sell_ok)
+
+
+# Одна пара ордеров по mid (USE_SPREAD=false)
+def mid_ladder(mid_price, qty, filters):
+    price = np.array([round_price(mid_price, filters.tick_size)])
+    qtys = snap_down(np.array([qty]), filters.step_size)
+    ok = (qtys >= max(filters.min_qty, filters.step_size)) & (price * qtys >= filters.min_notional)
+    return GridLadder(np.zeros(1, dtype=np.int64), price, price, qtys, ok, ok)
+
+
+# Ордера прошедших проверку уровней: BUY и SELL уровня подряд, от ближнего к дальнему
+def ladder_orders(ladder):
+    orders = []
+    rows = zip(ladder.levels.tolist(), ladder.buy_prices.tolist(), ladder.sell_prices.tolist(),
+               ladder.qtys.tolist(), ladder.buy_ok.tolist(), ladder.sell_ok.tolist())
+    for level, buy, sell, qty, buy_ok, sell_ok in rows:
+        if buy_ok:
+            orders.append(OrderRequest(level, 'BUY', buy, qty))
+        if sell_ok:
+            orders.append(OrderRequest(level, 'SELL', sell, qty))
+    return orders
+
+
+# === Желаемая сетка без обращения к бирже ===
+# Общая для живой торговли (place_grid_orders) и реплея (backtest.py)
+def build_grid_orders(mid_price, qty, filters, config=GridConfig(), book=None, use_spread=True, use_depth=False,
+                      volatility=None):
+    if use_spread:
+        ladder = grid_ladder(mid_price, qty, filters, config, book, use_depth, volatility)
+    else:
+        ladder = mid_ladder(mid_price, qty, filters)
+    return ladder_orders(ladder)
@@ -1,30 +1,43 @@
 # main_bot.py
 import asyncio
-import json
-import aiohttp
 import os
-import requests
+import time
 from dotenv import load_dotenv
 from binance.client import Client
 from datetime import datetime
 from loguru import logger
-from db import init_db, save_trade
+from db import init_db, save_trades
 from threading import Thread
-from bot_commands import run_bot, get_balance, place_grid_orders
+from bot_commands import run_bot, attach, fetch_balance, place_grid_orders
+from market_data import MarketDataHub
+from recorder import MarketRecorder
+from exchange_info import exchange_info
+from exchange_gateway import ExchangeGateway
+from user_stream import user_data, fill_from_trade, quote_fee
+from quote_manager import QuoteManager
+from pnl_engine import PnLEngine
+from fill_store import FillStore, session_fills
+from notifier import TelegramNotifier
+from metrics import metrics
+from grid import VolatilityEstimator
 
 # === Загрузка .env ===
 load_dotenv()
 
 # === Универсальная инициализация клиентов ===
 clients = {}
+gateways = {}
 modes = {}
 symbols = os.getenv("SYMBOLS", "BTCUSDT,SOLUSDT").split(',')
+API_URL = os.getenv("API_URL")          # переопределение адресов REST (mock_exchange.py)
+FUTURES_URL = os.getenv("FUTURES_URL")
 
 for symbol in symbols:
     api_key = os.getenv(f"{symbol}_API_KEY")
     api_secret = os.getenv(f"{symbol}_API_SECRET")
     trade_mode = os.getenv(f"{symbol}_MODE", "spot").lower()
-    client = Client(api_key, api_secret)
+    # С переопределённым адресом не пингуем боевой API при создании клиента
+    client = Client(api_key, api_secret, ping=not (API_URL or FUTURES_URL))
 
     if os.getenv(f"{symbol}_TESTNET", "false").lower() == "true":
         if trade_mode == "futures":
@@ -37,7 +50,13 @@ for symbol in symbols:
                 client.API_URL = "https://testnet.binance.vision/api"
 
 
+    if API_URL:
+        client.API_URL = API_URL
+    if FUTURES_URL:
+        client.FUTURES_URL = FUTURES_URL
+
     clients[symbol] = client
+    gateways[symbol] = ExchangeGateway(client, trade_mode)
     modes[symbol] = trade_mode
 
 TG_TOKEN = os.getenv("TG_TOKEN")
@@ -45,45 +64,24 @@ ORDER_PCT = float(os.getenv("ORDER_PCT", "0.1"))
 INTERVAL = int(os.getenv("INTERVAL", "5"))
 TAKE_PROFIT = float(os.getenv("TAKE_PROFIT", "99999"))
 STOP_LOSS = float(os.getenv("STOP_LOSS", "-99999"))
+BOOK_STALE_MS = int(os.getenv("BOOK_STALE_MS", "5000"))
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "60"))
+TRADES_PAGE_LIMIT = 1000
+RECORD_MARKET_DATA = os.getenv("RECORD_MARKET_DATA", "false").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Prometheus /metrics, 0 — выключен
 
 # === PnL-состояние для каждого символа ===
-session_start_ids = {}
-session_trades = {}
-
-# === Telegram ===
-def send_telegram(message):
-    chat_id = os.getenv("TG_CHAT_ID")
-    if not TG_TOKEN or not chat_id:
-        return
-    url = f"https://api.telegram.org/bot{TG_TOKEN}/sendMessage"
-    try:
-        requests.post(url, data={"chat_id": chat_id, "text": message})
-    except Exception as e:
-        logger.error(f"[Telegram] Ошибка: {e}")
+pnl_engines = {}
+symbol_tasks = {}  # символ -> задача торгового цикла, /stop в воркере снимает одну из них
+trade_cursors = {}    # последняя сделка, учтённая сверкой REST
+stream_fill_ids = {}  # сделки из потока, ещё не подтверждённые сверкой REST
 
-# === Получение стакана ===
-async def get_order_book(symbol, trade_mode, use_testnet):
-    if use_testnet:
-        url = f'wss://stream.binance.vision/ws/{symbol.lower()}@depth5@100ms' if trade_mode == 'spot' \
-              else f'wss://stream.binancefuture.com/ws/{symbol.lower()}@depth5@100ms'
-    else:
-        url = f'wss://stream.binance.com:9443/ws/{symbol.lower()}@depth5@100ms' if trade_mode == 'spot' \
-              else f'wss://fstream.binance.com/ws/{symbol.lower()}@depth5@100ms'
-
-    async with aiohttp.ClientSession() as session:
-        async with session.ws_connect(url) as ws:
-            async for msg in ws:
-                try:
-                    data = json.loads(msg.data)
-                    if 'bids' in data and 'asks' in data:
-                        bid = float(data['bids'][0][0])
-                        ask = float(data['asks'][0][0])
-                        return bid, ask
-                    else:
-                        continue  # пропускаем пустые или системные сообщения
-                except Exception as e:
-                    logger.warning(f"[{symbol}] Невалидное сообщение в стакане: {e}")
+# === Рыночные данные: один поток на все символы, опционально с записью на диск ===
+market_data = MarketDataHub(MarketRecorder() if RECORD_MARKET_DATA else None)
 
+# === Telegram: очередь уведомлений, отправка в фоне ===
+notifier = TelegramNotifier(TG_TOKEN, os.getenv("TG_CHAT_ID"))
 
 # === PnL логика ===
 def get_last_trade_id(symbol):
@@ -94,98 +92,188 @@ def get_last_trade_id(symbol):
     return 0
 
 def save_last_trade_id(symbol, trade_id):
-    with open(f"last_trade_id_{symbol}.txt", "w") as f:
+    # Атомарная запись: временный файл + os.replace
+    path = f"last_trade_id_{symbol}.txt"
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
         f.write(str(trade_id))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
-def track_trades_and_pnl(symbol):
-    client = clients[symbol]
+# Новые сделки страницами по TRADES_PAGE_LIMIT начиная с fromId = курсор + 1.
+# Курсор сохраняется после того, как вызывающий обработал страницу.
+async def iter_new_trades(symbol):
+    gateway = gateways[symbol]
+    last_id = get_last_trade_id(symbol)
+    while True:
+        # первый запуск (курсора нет): только последние сделки
+        page = await gateway.my_trades(symbol, from_id=last_id + 1 if last_id else None, limit=TRADES_PAGE_LIMIT)
+        page = [t for t in page if t['id'] > last_id]
+        if not page:
+            return
+        yield page
+        last_id = page[-1]['id']
+        save_last_trade_id(symbol, last_id)
+        trade_cursors[symbol] = last_id
+        if len(page) < TRADES_PAGE_LIMIT:
+            return
+
+async def track_trades_and_pnl(symbol):
     trade_mode = modes[symbol]
 
-    trades = client.get_my_trades(symbol=symbol) if trade_mode == 'spot' else client.futures_account_trades(symbol=symbol)
-    last_saved_id = get_last_trade_id(symbol)
-    new_trades = [t for t in trades if t['id'] > last_saved_id]
-    if not new_trades:
+    # Исполнения, уже пришедшие из потока, повторно не учитываем
+    seen = stream_fill_ids.setdefault(symbol, set())
+    async for page in iter_new_trades(symbol):
+        missed = [f for f in (fill_from_trade(symbol, t, trade_mode) for t in page) if f.id not in seen]
+        if missed:
+            logger.info(f"[{symbol}] Сверка REST: догружено {len(missed)} сделок")
+            record_fills(symbol, missed)
+    stream_fill_ids[symbol] = {i for i in seen if i > trade_cursors[symbol]}
+
+def on_stream_fill(fill):
+    symbol = fill.symbol
+    seen = stream_fill_ids.setdefault(symbol, set())
+    if fill.id <= trade_cursors[symbol] or fill.id in seen:
         return
-    save_last_trade_id(symbol, new_trades[-1]['id'])
-
-    if symbol not in session_trades:
-        session_trades[symbol] = []
-
-    total_buy = total_sell = qty_buy = qty_sell = 0
-    for t in new_trades:
-        qty = float(t['qty'])
-        price = float(t['price'])
-        cost = qty * price
-        is_buy = t['isBuyer'] if trade_mode == 'spot' else t['side'] == 'BUY'
-        if is_buy:
-            total_buy += cost
-            qty_buy += qty
-        else:
-            total_sell += cost
-            qty_sell += qty
-        if t['id'] >= session_start_ids[symbol]:
-            side = 'BUY' if is_buy else 'SELL'
-            save_trade(t['id'], trade_mode, symbol, side, float(t['price']), float(t['qty']))
-            session_trades[symbol].append(t)
-
-    sb = ss = sqb = sqs = 0
-    for t in session_trades[symbol]:
-        qty = float(t['qty'])
-        price = float(t['price'])
-        cost = qty * price
-        is_buy = t['isBuyer'] if trade_mode == 'spot' else t['side'] == 'BUY'
-        if is_buy:
-            sb += cost
-            sqb += qty
-        else:
-            ss += cost
-            sqs += qty
-
-    pnl = ss - sb
-    msg = (
-        f"[{symbol}] Сессия PnL\n"
-        f"Покупка: {sqb:.4f} на {sb:.2f} USDT\n"
-        f"Продажа: {sqs:.4f} на {ss:.2f} USDT\n"
-        f"→ PnL: {pnl:.2f} USDT"
-    )
+    seen.add(fill.id)
+    record_fills(symbol, [fill])
+
+def record_fills(symbol, fills):
+    trade_mode = modes[symbol]
+    rows = [(f.id, trade_mode, symbol, f.side, f.price, f.qty, f.time, quote_fee(f)) for f in fills]
+    with metrics.timer(symbol, 'db_write'):
+        save_trades(rows)
+    metrics.inc(symbol, 'fills', len(rows))
+
+    store = session_fills[symbol]
+    engine = pnl_engines[symbol]
+    for row in rows:
+        store.append(row[0], row[6], row[3], row[4], row[5], row[7])
+        engine.on_fill(row[3], row[4], row[5], row[7])
+
+    msg = engine.summary()
     logger.info(msg)
-    send_telegram(msg)
+    notifier.notify(msg, key=f"{symbol}:pnl")
+    check_pnl_limits(symbol)
 
+# TAKE_PROFIT / STOP_LOSS по итогу сессии, включая нереализованный PnL. Останавливается
+# только этот символ (как по /stop): выход процесса бросил бы остальные символы воркера
+# с живыми ордерами, а код 0 оркестратор не перезапускает. True — символ остановлен.
+def check_pnl_limits(symbol):
+    task = symbol_tasks.get(symbol)
+    if task is None:
+        return True
+    pnl = pnl_engines[symbol].net
     if pnl >= TAKE_PROFIT:
-        send_telegram(f"[STOP {symbol}] Профит достигнут: {pnl:.2f} USDT")
-        exit(0)
-    if pnl <= STOP_LOSS:
-        send_telegram(f"[STOP {symbol}] Убыток достигнут: {pnl:.2f} USDT")
-        exit(0)
+        notifier.alert(f"[STOP {symbol}] Профит достигнут: {pnl:.2f} USDT")
+    elif pnl <= STOP_LOSS:
+        notifier.alert(f"[STOP {symbol}] Убыток достигнут: {pnl:.2f} USDT")
+    else:
+        return False
+    del symbol_tasks[symbol]
+    asyncio.ensure_future(stop_symbol(symbol, task))
+    return True
 
 # === Основной цикл по символу ===
 async def run_symbol(symbol):
     client = clients[symbol]
+    gateway = gateways[symbol]
     trade_mode = modes[symbol]
     use_testnet = os.getenv(f"{symbol}_TESTNET", "false").lower() == "true"
 
-    session_start_ids[symbol] = get_last_trade_id(symbol)
+    trade_cursors[symbol] = get_last_trade_id(symbol)
+    engine = pnl_engines[symbol] = PnLEngine(symbol)
+    session_fills[symbol] = FillStore()
+
+    try:
+        await exchange_info.get(gateway, symbol)
+    except Exception as e:
+        logger.error(f"[{symbol}] Не удалось загрузить exchangeInfo: {e}")
+
+    quotes = QuoteManager(gateway, symbol)
+    volatility = VolatilityEstimator()  # для GRID_SPACING=volatility
+    account = user_data.subscribe(symbol, client, trade_mode, use_testnet,
+                                  on_fill=on_stream_fill, on_order=quotes.on_order_update).state
+    book = await market_data.subscribe(symbol, trade_mode, use_testnet, gateway)
+    await book.wait_ready()
+    last_reconcile = 0
 
     while True:
         try:
-            bid, ask = await get_order_book(symbol, trade_mode, use_testnet)
+            if book.is_stale(BOOK_STALE_MS):
+                logger.warning(f"[{symbol}] Стакан устарел, пропускаем цикл")
+                await asyncio.sleep(1)
+                continue
+            cycle_start = time.perf_counter()
+            metrics.observe(symbol, 'book_age', book.age_ms())
+            bid, ask, _ = book.best()
             mid_price = (bid + ask) / 2
-            usdt = get_balance(symbol)
+            engine.mark(mid_price)
+            volatility.update(mid_price)
+            if check_pnl_limits(symbol):
+                return
+            usdt = await fetch_balance(symbol, gateway)
             order_value = usdt * ORDER_PCT
             qty = round(order_value / mid_price, 6)
-            send_telegram(f"[{symbol}] Баланс: {usdt:.2f} USDT, Ордер на: {order_value:.2f} USDT ({qty:.6f} {symbol[:-4]})")
-            place_grid_orders(client, trade_mode, symbol, mid_price, ORDER_PCT)
-            track_trades_and_pnl(symbol)
-            await asyncio.sleep(INTERVAL)
+            notifier.notify(f"[{symbol}] Баланс: {usdt:.2f} USDT, Ордер на: {order_value:.2f} USDT ({qty:.6f} {symbol[:-4]})",
+                            key=f"{symbol}:balance")
+            await place_grid_orders(gateway, symbol, mid_price, ORDER_PCT, book.book, quotes, volatility.sigma)
+            # Сделки приходят из потока; REST — только периодическая сверка или при его потере
+            if not account.live or time.monotonic() - last_reconcile >= RECONCILE_INTERVAL:
+                with metrics.timer(symbol, 'trade_sync'):
+                    await track_trades_and_pnl(symbol)
+                quotes.mark_dirty()
+                last_reconcile = time.monotonic()
+            metrics.observe(symbol, 'cycle', (time.perf_counter() - cycle_start) * 1000)
+            # При нехватке лимитов перекотировка замедляется
+            await asyncio.sleep(gateway.governor.scaled_interval(INTERVAL))
         except Exception as e:
             logger.error(f"[{symbol}] Ошибка: {e}")
+            metrics.inc(symbol, 'cycle_errors')
             await asyncio.sleep(5)
 
+# Остановка одного символа без завершения процесса: сначала задача (новые ордера
+# больше не ставятся), затем снятие его ордеров на бирже
+async def stop_symbol(symbol, task=None):
+    task = symbol_tasks.pop(symbol, task)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    await gateways[symbol].cancel_all(symbol)
+    logger.info(f"[{symbol}] Торговля остановлена, ордера удалены")
+
+
+# Задача символа, снятая через stop_symbol, завершается штатно и не обрывает gather остальных
+async def trade_symbol(symbol):
+    symbol_tasks[symbol] = asyncio.current_task()
+    try:
+        await run_symbol(symbol)
+    except asyncio.CancelledError:
+        if symbol in symbol_tasks:
+            raise
+
 # === Запуск Telegram и торговли ===
-if __name__ == '__main__':
+# telegram=False — воркер orchestrator.py: команды приходят по IPC, extra — его фоновые корутины
+def main(telegram=True, extra=()):
     init_db()
     logger.info(f"[Старт] Универсальный Telegram-бот запущен для: {', '.join(symbols)}")
-    Thread(target=run_bot, args=(TG_TOKEN, clients, modes), daemon=True).start()
     loop = asyncio.get_event_loop()
-    tasks = [run_symbol(symbol) for symbol in symbols]
-    loop.run_until_complete(asyncio.gather(*tasks))
+    if telegram:
+        Thread(target=run_bot, args=(TG_TOKEN, clients, modes, gateways, loop, stop_symbol), daemon=True).start()
+    else:
+        attach(clients, modes, gateways, loop, stop_symbol)
+    tasks = [trade_symbol(symbol) for symbol in symbols] + list(extra)
+    try:
+        loop.run_until_complete(metrics.serve(METRICS_HOST, METRICS_PORT))
+        loop.run_until_complete(asyncio.gather(*tasks))
+    finally:
+        # TAKE_PROFIT / STOP_LOSS завершают процесс: дослать аварийные сообщения
+        loop.run_until_complete(notifier.close())
+        loop.run_until_complete(metrics.close())
+        if market_data.recorder is not None:
+            market_data.recorder.close()
+
+
+if __name__ == '__main__':
+    main()
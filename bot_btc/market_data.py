@@ -0,0 +1,340 @@
+# market_data.py
+import asyncio
+import os
+import time
+import aiohttp
+from loguru import logger
+from decoder import decode_market, decode_json, DepthUpdate, AggTrade
+from metrics import metrics
+from order_book import LocalOrderBook, OutOfSync
+
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+HEARTBEAT = 20
+SNAPSHOT_LIMIT = 1000
+SNAPSHOT_TIMEOUT = 10
+SNAPSHOT_RETRY_MIN_DELAY = 1
+SNAPSHOT_RETRY_MAX_DELAY = 60
+MAX_PENDING_EVENTS = 1000
+
+
+# Адреса можно переопределить через API_URL / FUTURES_URL / STREAM_URL / FUTURES_STREAM_URL,
+# например для локальной биржи mock_exchange.py
+def stream_base_url(trade_mode, use_testnet):
+    override = os.getenv("STREAM_URL" if trade_mode == 'spot' else "FUTURES_STREAM_URL")
+    if override:
+        return override
+    if use_testnet:
+        return 'wss://stream.binance.vision' if trade_mode == 'spot' else 'wss://stream.binancefuture.com'
+    return 'wss://stream.binance.com:9443' if trade_mode == 'spot' else 'wss://fstream.binance.com'
+
+
+def depth_snapshot_url(trade_mode, use_testnet):
+    override = os.getenv("API_URL" if trade_mode == 'spot' else "FUTURES_URL")
+    if override:
+        return f"{override}/v3/depth" if trade_mode == 'spot' else f"{override}/v1/depth"
+    if use_testnet:
+        return 'https://testnet.binance.vision/api/v3/depth' if trade_mode == 'spot' \
+            else 'https://testnet.binancefuture.com/fapi/v1/depth'
+    return 'https://api.binance.com/api/v3/depth' if trade_mode == 'spot' \
+        else 'https://fapi.binance.com/fapi/v1/depth'
+
+
+# === Локальный стакан символа, получающий события из общего потока ===
+# Ведёт LocalOrderBook (REST-снимок + проверка последовательности, пересинхронизация
+# при разрыве) и хранит лучший bid/ask в памяти — торговый цикл читает его без сети.
+class SymbolBook:
+    def __init__(self, symbol, trade_mode, use_testnet, recorder=None, gateway=None):
+        self.symbol = symbol
+        self.stream_name = f"{symbol.lower()}@depth@100ms"
+        self.trade_stream_name = f"{symbol.lower()}@aggTrade"
+        self.recorder = recorder  # SymbolRecorder: запись стакана и сделок для реплея
+        self.snapshot_url = depth_snapshot_url(trade_mode, use_testnet)
+        self.gateway = gateway  # ExchangeGateway: снимок идёт через RateGovernor и учитывается в весе
+        self.book = LocalOrderBook(symbol, futures=trade_mode != 'spot')
+        self.bid = None
+        self.ask = None
+        self.event_time = None  # время события биржи, мс
+        self.local_time = None  # время получения, мс
+        self.listeners = []     # callback(book) после каждого обновления лучших цен
+        self._ready = asyncio.Event()
+        self._pending = []
+        self._snapshot_task = None
+        self._snapshot_failures = 0  # подряд; задаёт паузу перед следующей попыткой
+
+    # Сделки нужны только для записи
+    @property
+    def stream_names(self):
+        return [self.stream_name, self.trade_stream_name] if self.recorder else [self.stream_name]
+
+    async def wait_ready(self, timeout=None):
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+    def best(self):
+        return self.bid, self.ask, self.event_time
+
+    def age_ms(self):
+        if self.local_time is None:
+            return None
+        return time.time() * 1000 - self.local_time
+
+    def is_stale(self, max_age_ms):
+        age = self.age_ms()
+        return age is None or age > max_age_ms
+
+    async def _fetch_snapshot(self, session):
+        if self.gateway is not None:
+            return await self.gateway.depth(self.symbol, SNAPSHOT_LIMIT)
+        params = {'symbol': self.symbol, 'limit': SNAPSHOT_LIMIT}
+        timeout = aiohttp.ClientTimeout(total=SNAPSHOT_TIMEOUT)
+        async with session.get(self.snapshot_url, params=params, timeout=timeout) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=decode_json)
+
+    # Ошибка снимка (429, 5xx, таймаут) касается только этого символа: стакан остаётся
+    # не готовым, запрос повторяется с растущей паузой, общий поток не трогается
+    async def _load_snapshot(self, session):
+        while True:
+            if self._snapshot_failures:
+                delay = min(SNAPSHOT_RETRY_MIN_DELAY * 2 ** (self._snapshot_failures - 1), SNAPSHOT_RETRY_MAX_DELAY)
+                await asyncio.sleep(delay)
+            try:
+                snapshot = await self._fetch_snapshot(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._snapshot_failures += 1
+                metrics.inc(self.symbol, 'snapshot_errors')
+                logger.warning(f"[{self.symbol}] Снимок стакана не получен: {e}, попытка {self._snapshot_failures}")
+                continue
+            self._snapshot_failures = 0
+            return snapshot
+
+    def reset(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        self.book.reset()
+        self._ready.clear()
+        self._pending = []
+
+    def resync(self, session):
+        self.reset()
+        self._snapshot_task = asyncio.ensure_future(self._load_snapshot(session))
+
+    def _publish(self, received=None):
+        bid, ask = self.book.best_bid(), self.book.best_ask()
+        if bid is None or ask is None:
+            return
+        self.bid = bid[0]
+        self.ask = ask[0]
+        self.event_time = self.book.event_time
+        self.local_time = received or time.time() * 1000
+        self._ready.set()
+        for listener in self.listeners:
+            listener(self)
+
+    def _apply(self, event, received=None):
+        if not self.book.synced:
+            if self._snapshot_task is None and self.book.last_update_id is not None:
+                # снимок уже загружен, ждём событие, перекрывающее его lastUpdateId
+                self._apply_diff(event)
+            else:
+                self._pending.append(event)
+                if len(self._pending) > MAX_PENDING_EVENTS:
+                    # пока снимок повторяется, нужны только свежие события: старые отбрасываем
+                    del self._pending[:MAX_PENDING_EVENTS // 2]
+                if self._snapshot_task is None or not self._snapshot_task.done():
+                    return
+                snapshot = self._snapshot_task.result()
+                self._snapshot_task = None
+                self.book.load_snapshot(snapshot)
+                if self.recorder:
+                    self.recorder.snapshot(snapshot)
+                pending, self._pending = self._pending, []
+                for ev in pending:
+                    self._apply_diff(ev)
+            if not self.book.synced:
+                return
+        else:
+            self._apply_diff(event)
+        self._publish(received)
+
+    def _apply_diff(self, event):
+        if self.book.apply_diff(event) and self.recorder:
+            self.recorder.diff(event)
+
+    # event — decoder.DepthUpdate, received — время получения сообщения из сокета, мс
+    def on_event(self, event, session, received=None):
+        try:
+            self._apply(event, received)
+        except OutOfSync as e:
+            logger.warning(f"[{self.symbol}] Рассинхронизация стакана: {e}, загружаем снимок заново")
+            self.resync(session)
+            self._pending.append(event)
+        except Exception as e:
+            # битый снимок или событие — пересинхронизация только этого символа
+            logger.error(f"[{self.symbol}] Ошибка стакана: {e}, загружаем снимок заново")
+            self.resync(session)
+
+    def on_trade(self, trade):
+        if self.recorder:
+            self.recorder.trade(trade)
+
+
+# === Общий поток для всех символов одного сервера ===
+# Одно соединение /stream?streams=a@depth/b@depth/..., события раскладываются
+# по символам по полю "stream". Подписки добавляются и снимаются на лету
+# сообщениями SUBSCRIBE/UNSUBSCRIBE.
+class CombinedStream:
+    def __init__(self, base_url, session):
+        self.base_url = base_url
+        self.session = session
+        self.books = {}  # имя потока -> SymbolBook (у книги может быть несколько потоков)
+        self._ws = None
+        self._task = None
+        self._request_id = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for book in self.symbol_books():
+            book.reset()
+
+    def symbol_books(self):
+        return {id(b): b for b in self.books.values()}.values()
+
+    async def _send(self, method, names):
+        if self._ws is None or self._ws.closed or not names:
+            return
+        self._request_id += 1
+        await self._ws.send_json({'method': method, 'params': list(names), 'id': self._request_id})
+
+    async def subscribe(self, book):
+        for name in book.stream_names:
+            self.books[name] = book
+        if self._ws is not None:
+            book.resync(self.session)
+            await self._send('SUBSCRIBE', book.stream_names)
+        self.start()
+
+    async def unsubscribe(self, book):
+        names = [n for n in book.stream_names if self.books.pop(n, None) is not None]
+        if not names:
+            return
+        book.reset()
+        await self._send('UNSUBSCRIBE', names)
+
+    def _on_message(self, raw):
+        received = time.time() * 1000
+        try:
+            stream, msg = decode_market(raw)
+        except Exception as e:
+            logger.warning(f"[Поток] Невалидное сообщение: {e}")
+            return
+        if stream is None:
+            if msg.get('error'):
+                logger.warning(f"[Поток] Ошибка подписки: {msg['error']}")
+            return  # ответы на SUBSCRIBE/UNSUBSCRIBE
+        book = self.books.get(stream)
+        if book is None:
+            return
+        kind = type(msg)
+        if kind is DepthUpdate:
+            book.on_event(msg, self.session, received)
+        elif kind is AggTrade:
+            book.on_trade(msg)
+        else:
+            return
+        metrics.observe(book.symbol, 'ws_message', time.time() * 1000 - received)
+        if msg.event_time:
+            metrics.observe(book.symbol, 'event_lag', received - msg.event_time)
+
+    async def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            names = list(self.books)
+            url = f"{self.base_url}/stream?streams={'/'.join(names)}"
+            try:
+                async with self.session.ws_connect(url, heartbeat=HEARTBEAT) as ws:
+                    self._ws = ws
+                    logger.info(f"[Поток] Подключено к {self.base_url}: {len(names)} потоков")
+                    delay = RECONNECT_MIN_DELAY
+                    for book in self.symbol_books():
+                        book.resync(self.session)
+                    await self._send('SUBSCRIBE', [n for n in self.books if n not in names])
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._on_message(msg.data)
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                logger.warning(f"[Поток] Соединение с {self.base_url} закрыто")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[Поток] Ошибка соединения с {self.base_url}: {e}")
+            finally:
+                self._ws = None
+                for book in self.symbol_books():
+                    book.reset()
+            logger.info(f"[Поток] Переподключение через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+# === Хаб рыночных данных ===
+# Одно соединение на сервер (спот/фьючерсы, прод/тестнет) для всех символов процесса.
+# С recorder (MarketRecorder) стакан и сделки каждого символа пишутся на диск.
+class MarketDataHub:
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.streams = {}  # базовый URL -> CombinedStream
+        self.books = {}    # символ -> SymbolBook
+        self._stream_of = {}
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def subscribe(self, symbol, trade_mode, use_testnet, gateway=None):
+        if symbol in self.books:
+            return self.books[symbol]
+        base_url = stream_base_url(trade_mode, use_testnet)
+        stream = self.streams.get(base_url)
+        if stream is None:
+            stream = self.streams[base_url] = CombinedStream(base_url, self._get_session())
+        book = SymbolBook(symbol, trade_mode, use_testnet, self.recorder.writer(symbol) if self.recorder else None,
+                          gateway)
+        self.books[symbol] = book
+        self._stream_of[symbol] = stream
+        await stream.subscribe(book)
+        return book
+
+    async def unsubscribe(self, symbol):
+        book = self.books.pop(symbol, None)
+        if book is None:
+            return
+        await self._stream_of.pop(symbol).unsubscribe(book)
+
+    def get(self, symbol):
+        return self.books.get(symbol)
+
+    async def close(self):
+        for stream in self.streams.values():
+            await stream.stop()
+        if self._session is not None:
+            await self._session.close()
+        if self.recorder is not None:
+            self.recorder.close()
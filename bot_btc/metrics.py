@@ -0,0 +1,195 @@
+# metrics.py
+import time
+from aiohttp import web
+from loguru import logger
+
+# === Гистограмма в стиле HDR ===
+# Значения в микросекундах, на каждую степень двойки 2^SUB_BUCKET_BITS корзин:
+# относительная погрешность квантилей не больше 1/16, память постоянная.
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_BITS = 36  # до ~19 часов
+MAX_VALUE_US = (1 << MAX_BITS) - 1
+BUCKETS = (MAX_BITS - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+# Границы le для Prometheus, мс
+EXPORT_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+REPORT_PERCENTILES = (50, 99, 99.9)
+GLOBAL = ""  # метрики процесса, не привязанные к символу (Telegram)
+
+
+def bucket_index(us):
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS
+
+
+# Верхняя граница корзины (не включая), мкс
+def bucket_upper(index):
+    if index < SUB_BUCKETS:
+        return index + 1
+    shift = index // SUB_BUCKETS - 1
+    return (index % SUB_BUCKETS + SUB_BUCKETS + 1) << shift
+
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total_us', 'max_us')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, ms):
+        us = int(ms * 1000)
+        if us < 0:
+            us = 0  # отрицательный лаг — расхождение часов с биржей
+        elif us > MAX_VALUE_US:
+            us = MAX_VALUE_US
+        self.counts[bucket_index(us)] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    # Квантиль, мс (верхняя граница корзины, не больше максимума)
+    def percentile(self, pct):
+        if not self.count:
+            return None
+        rank = max(self.count * pct / 100, 1)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bucket_upper(index) - 1, self.max_us) / 1000
+        return self.max_us / 1000
+
+    # Накопленные счётчики для границ le (мс); корзина, пересекающая границу, идёт выше
+    def cumulative(self, bounds_ms):
+        out = []
+        index, seen = 0, 0
+        for bound in bounds_ms:
+            limit = int(bound * 1000)
+            while index < BUCKETS and bucket_upper(index) - 1 <= limit:
+                seen += self.counts[index]
+                index += 1
+            out.append(seen)
+        return out
+
+
+class StageTimer:
+    __slots__ = ('metrics', 'symbol', 'stage', 'start')
+
+    def __init__(self, metrics, symbol, stage):
+        self.metrics = metrics
+        self.symbol = symbol
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.symbol, self.stage, (time.perf_counter() - self.start) * 1000)
+        if exc_type is not None:
+            self.metrics.inc(self.symbol, f"{self.stage}_errors")
+        return False
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+# === Метрики процесса: гистограммы этапов и счётчики по символам ===
+# Пишутся из торгового цикла без блокировок; читают /metrics (тот же цикл)
+# и /latency из потока Telegram — по снимку словаря.
+class Metrics:
+    def __init__(self):
+        self.histograms = {}  # (символ, этап) -> LatencyHistogram
+        self.counters = {}    # (символ, событие) -> int
+        self._runner = None
+
+    def observe(self, symbol, stage, ms):
+        hist = self.histograms.get((symbol, stage))
+        if hist is None:
+            hist = self.histograms[(symbol, stage)] = LatencyHistogram()
+        hist.record(ms)
+
+    def inc(self, symbol, name, n=1):
+        key = (symbol, name)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    # with metrics.timer(symbol, 'balance'): ...
+    def timer(self, symbol, stage):
+        return StageTimer(self, symbol, stage)
+
+    # Текстовый формат Prometheus 0.0.4
+    def render(self):
+        lines = ["# HELP bot_latency_seconds Время этапов торгового цикла",
+                 "# TYPE bot_latency_seconds histogram"]
+        for (symbol, stage), hist in sorted(list(self.histograms.items())):
+            labels = f'symbol="{_label(symbol)}",stage="{_label(stage)}"'
+            for bound, n in zip(EXPORT_BUCKETS_MS, hist.cumulative(EXPORT_BUCKETS_MS)):
+                lines.append(f'bot_latency_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {n}')
+            lines.append(f'bot_latency_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f'bot_latency_seconds_sum{{{labels}}} {hist.total_us / 1e6:.6f}')
+            lines.append(f'bot_latency_seconds_count{{{labels}}} {hist.count}')
+        lines += ["# HELP bot_events_total Счётчики событий бота",
+                  "# TYPE bot_events_total counter"]
+        for (symbol, name), n in sorted(list(self.counters.items())):
+            lines.append(f'bot_events_total{{symbol="{_label(symbol)}",event="{_label(name)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def _report_lines(self, symbol):
+        lines = []
+        for (s, stage), hist in sorted(list(self.histograms.items())):
+            if s != symbol or not hist.count:
+                continue
+            p50, p99, p999 = (hist.percentile(p) for p in REPORT_PERCENTILES)
+            lines.append(f"{stage}: n={hist.count}, p50 {p50:.3f}, p99 {p99:.3f}, "
+                         f"p99.9 {p999:.3f}, max {hist.max_us / 1000:.3f}")
+        counters = [f"{name} {n}" for (s, name), n in sorted(list(self.counters.items())) if s == symbol]
+        if counters:
+            lines.append("Счётчики: " + ", ".join(counters))
+        return lines
+
+    # Сводка для Telegram-команды /latency
+    def report(self, symbol):
+        lines = self._report_lines(symbol)
+        if not lines:
+            return f"Нет замеров для {symbol}."
+        common = self._report_lines(GLOBAL)
+        msg = f"⏱ Задержки {symbol}, мс:\n\n" + "\n".join(lines)
+        if common:
+            msg += "\n\nОбщие:\n" + "\n".join(common)
+        return msg
+
+    async def _handle(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    # port=0 — эндпоинт не поднимается
+    async def serve(self, host, port):
+        if not port:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            logger.error(f"[Metrics] Не удалось открыть {host}:{port}: {e}")
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info(f"[Metrics] Prometheus: http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics = Metrics()
@@ -0,0 +1,775 @@
+# mock_exchange.py
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import secrets
+import time
+from collections import deque
+from aiohttp import web, WSMsgType
+from loguru import logger
+from exchange_gateway import fmt_number
+
+BOOK_DEPTH = 20
+UPDATES_PER_TICK = 10        # событие стакана покрывает диапазон U..u, как на бирже
+MAX_TRADES = 100000          # история myTrades на символ
+SUBSCRIBER_QUEUE = 10000     # сообщений в очереди медленного клиента до отключения
+FEES = {'spot': (0.001, 0.001), 'futures': (0.0002, 0.0005)}  # мейкер, тейкер
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class MockError(Exception):
+    def __init__(self, status, code, msg, data=None):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+        self.data = data
+
+
+def unknown_order():
+    return MockError(400, -2011, "Unknown order sent.")
+
+
+# === Клиент WebSocket: своя очередь и отправка, чтобы рассылка не ждала сеть ===
+class Subscriber:
+    def __init__(self, ws):
+        self.ws = ws
+        self.queue = asyncio.Queue()
+        self.streams = set()
+
+    def send(self, text):
+        if self.queue.qsize() >= SUBSCRIBER_QUEUE:
+            asyncio.ensure_future(self.ws.close())
+            return
+        self.queue.put_nowait(text)
+
+    async def writer(self):
+        while True:
+            await self.ws.send_str(await self.queue.get())
+
+
+# === Ордер ===
+class MockOrder:
+    __slots__ = ('symbol', 'order_id', 'client_order_id', 'side', 'price', 'qty', 'filled', 'cum_quote',
+                 'status', 'time', 'update_time', 'reserved')
+
+    def __init__(self, symbol, order_id, client_order_id, side, price, qty):
+        self.symbol = symbol
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.filled = 0.0
+        self.cum_quote = 0.0
+        self.status = 'NEW'
+        self.time = self.update_time = now_ms()
+        self.reserved = 0.0  # спот: заблокированный остаток (USDT для BUY, базовый актив для SELL)
+
+    @property
+    def remaining(self):
+        return self.qty - self.filled
+
+
+# === Символ: синтетический стакан вокруг случайного блуждания цены ===
+class MockSymbol:
+    def __init__(self, symbol, price, tick, step, min_qty, min_notional, level_ticks, vol, rng):
+        self.symbol = symbol
+        self.base = symbol[:-4]
+        self.quote = symbol[-4:]
+        self.mid = price
+        self.tick = tick
+        self.step = step
+        self.min_qty = min_qty
+        self.min_notional = min_notional
+        self.level_ticks = level_ticks
+        self.vol = vol
+        self.rng = rng
+        self.bids = {}
+        self.asks = {}
+        self.update_id = 1
+        self.orders = {}      # orderId -> MockOrder (только открытые)
+        self.by_client = {}   # clientOrderId -> MockOrder
+        self.trades = deque(maxlen=MAX_TRADES)
+        self.rebuild()
+
+    def round_tick(self, price):
+        return round(round(price / self.tick) * self.tick, 8)
+
+    def best_bid(self):
+        return max(self.bids) if self.bids else None
+
+    def best_ask(self):
+        return min(self.asks) if self.asks else None
+
+    def _target(self):
+        gap = self.level_ticks * self.tick
+        best_bid = math.floor(self.mid / self.tick - 1) * self.tick
+        bids = [round(best_bid - i * gap, 8) for i in range(BOOK_DEPTH)]
+        asks = [round(best_bid + 2 * self.tick + i * gap, 8) for i in range(BOOK_DEPTH)]
+        return bids, asks
+
+    def rebuild(self):
+        bids, asks = self._target()
+        self.bids = {p: round(self.rng.uniform(0.1, 5), 3) for p in bids}
+        self.asks = {p: round(self.rng.uniform(0.1, 5), 3) for p in asks}
+
+    # Шаг цены: возвращает изменённые уровни (bids, asks) в формате depthUpdate
+    def step_price(self):
+        self.mid *= math.exp(self.vol * self.rng.gauss(0, 1))
+        changes = []
+        for book, target in zip((self.bids, self.asks), self._target()):
+            diff = {}
+            target = set(target)
+            for p in list(book):
+                if p not in target:
+                    del book[p]
+                    diff[p] = 0.0
+            for p in target:
+                if p not in book or self.rng.random() < 0.1:
+                    book[p] = diff[p] = round(self.rng.uniform(0.1, 5), 3)
+            changes.append([[fmt_number(p), fmt_number(q)] for p, q in diff.items()])
+        self.update_id += UPDATES_PER_TICK
+        return changes
+
+    # lastUpdateId внутри диапазона следующего события: и спот, и фьючерсы сходятся с первого diff
+    def snapshot(self, limit):
+        bids = sorted(self.bids.items(), reverse=True)[:limit]
+        asks = sorted(self.asks.items())[:limit]
+        return {
+            'lastUpdateId': self.update_id + 1,
+            'E': now_ms(),
+            'T': now_ms(),
+            'bids': [[fmt_number(p), fmt_number(q)] for p, q in bids],
+            'asks': [[fmt_number(p), fmt_number(q)] for p, q in asks],
+        }
+
+    def filters(self):
+        return [
+            {'filterType': 'PRICE_FILTER', 'tickSize': fmt_number(self.tick), 'minPrice': fmt_number(self.tick),
+             'maxPrice': '10000000'},
+            {'filterType': 'LOT_SIZE', 'minQty': fmt_number(self.min_qty), 'stepSize': fmt_number(self.step),
+             'maxQty': '100000'},
+            {'filterType': 'NOTIONAL', 'minNotional': fmt_number(self.min_notional)},
+            {'filterType': 'MIN_NOTIONAL', 'notional': fmt_number(self.min_notional)},
+        ]
+
+
+# === Лимиты частоты: фиксированные окна, как у Binance ===
+class MockLimiter:
+    def __init__(self, limits):
+        self.limits = limits  # [(тип, интервал с, лимит, суффикс заголовка)]
+        self.used = {}        # (тип, интервал) -> (начало окна, использовано)
+
+    def _window(self, kind, interval, now):
+        start, used = self.used.get((kind, interval), (0, 0))
+        window = now - now % interval
+        return (window, 0) if window != start else (start, used)
+
+    # None — можно, иначе пауза до конца окна в секундах
+    def charge(self, weight, orders):
+        now = int(time.time())
+        pending = {}
+        for kind, interval, limit, _ in self.limits:
+            cost = weight if kind == 'REQUEST_WEIGHT' else orders
+            start, used = self._window(kind, interval, now)
+            if cost and used + cost > limit:
+                return kind, start + interval - now
+            pending[(kind, interval)] = (start, used + cost)
+        self.used.update(pending)
+        return None
+
+    def headers(self):
+        now = int(time.time())
+        out = {}
+        for kind, interval, _, suffix in self.limits:
+            _, used = self._window(kind, interval, now)
+            name = 'X-MBX-USED-WEIGHT-' if kind == 'REQUEST_WEIGHT' else 'X-MBX-ORDER-COUNT-'
+            out[name + suffix] = str(used)
+        return out
+
+    def rate_limits(self):
+        names = {1: 'SECOND', 60: 'MINUTE', 86400: 'DAY'}
+        out = []
+        for kind, interval, limit, _ in self.limits:
+            unit = 60 if interval % 60 == 0 and interval < 86400 else (86400 if interval >= 86400 else 1)
+            out.append({'rateLimitType': kind, 'interval': names[unit], 'intervalNum': interval // unit, 'limit': limit})
+        return out
+
+
+# === Рынок (спот или фьючерсы) с одним аккаунтом ===
+class MockMarket:
+    def __init__(self, kind, symbols, args):
+        self.kind = kind
+        self.futures = kind == 'futures'
+        self.maker_fee, self.taker_fee = FEES[kind]
+        self.symbols = symbols
+        self.ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+        self.agg_ids = itertools.count(1)
+        # спот: актив -> [free, locked]; фьючерсы: кошелёк USDT и позиции
+        self.balances = {'USDT': [args.balance, 0.0]}
+        for s in symbols.values():
+            self.balances.setdefault(s.base, [args.base_balance, 0.0])
+        self.wallet = args.balance
+        self.positions = {s: [0.0, 0.0] for s in symbols}  # символ -> [кол-во, цена входа]
+        self.listen_keys = set()
+        self.user_subs = set()
+        self.market_subs = set()
+        # Лимит ордеров только по запросу (--order-limit): сетка с перекотировкой быстро
+        # выбирает биржевые 100 за 10 с, и без флага заглушка не должна её душить
+        limits = [('REQUEST_WEIGHT', 60, args.weight_limit, '1M')]
+        if args.order_limit and self.futures:
+            limits += [('ORDERS', 10, args.order_limit, '10S'), ('ORDERS', 60, args.order_limit * 4, '1M')]
+        elif args.order_limit:
+            limits += [('ORDERS', 10, args.order_limit, '10S'), ('ORDERS', 86400, args.order_limit * 2000, '1D')]
+        self.limiter = MockLimiter(limits)
+
+    def symbol(self, params):
+        s = self.symbols.get(params['symbol'])
+        if s is None:
+            raise MockError(400, -1121, "Invalid symbol.")
+        return s
+
+    # === Рассылка ===
+    def publish(self, stream, data):
+        text = None
+        for sub in self.market_subs:
+            if stream in sub.streams:
+                text = text or json.dumps({'stream': stream, 'data': data})
+                sub.send(text)
+
+    def publish_user(self, event):
+        if self.user_subs:
+            text = json.dumps(event)
+            for sub in self.user_subs:
+                sub.send(text)
+
+    def _order_event(self, order, exec_type, last_qty=0.0, last_price=0.0, fee=0.0, trade_id=-1,
+                     maker=False, orig_client_id=''):
+        ts = now_ms()
+        o = {
+            's': order.symbol, 'c': order.client_order_id, 'S': order.side, 'o': 'LIMIT', 'f': 'GTC',
+            'q': fmt_number(order.qty), 'p': fmt_number(order.price), 'x': exec_type, 'X': order.status,
+            'i': order.order_id, 'l': fmt_number(last_qty), 'z': fmt_number(order.filled),
+            'L': fmt_number(last_price), 'n': fmt_number(fee), 'N': 'USDT' if fee else None,
+            'T': ts, 't': trade_id, 'm': maker,
+        }
+        if self.futures:
+            return {'e': 'ORDER_TRADE_UPDATE', 'E': ts, 'T': ts, 'o': o}
+        o.update({'e': 'executionReport', 'E': ts, 'C': orig_client_id, 'O': order.time,
+                  'Z': fmt_number(order.cum_quote), 'Y': fmt_number(last_qty * last_price)})
+        return o
+
+    def _account_event(self, sym):
+        ts = now_ms()
+        if self.futures:
+            amount, entry = self.positions[sym.symbol]
+            return {'e': 'ACCOUNT_UPDATE', 'E': ts, 'T': ts, 'a': {
+                'm': 'ORDER',
+                'B': [{'a': 'USDT', 'wb': fmt_number(self.wallet), 'cw': fmt_number(self.wallet), 'bc': '0'}],
+                'P': [{'s': sym.symbol, 'pa': fmt_number(amount), 'ep': fmt_number(entry), 'cr': '0',
+                       'up': fmt_number(amount * (sym.mid - entry)), 'mt': 'cross', 'iw': '0', 'ps': 'BOTH'}]}}
+        return {'e': 'outboundAccountPosition', 'E': ts, 'u': ts, 'B': [
+            {'a': a, 'f': fmt_number(self.balances[a][0]), 'l': fmt_number(self.balances[a][1])}
+            for a in (sym.base, sym.quote)]}
+
+    # === Ордера ===
+    def order_response(self, order):
+        data = {
+            'symbol': order.symbol, 'orderId': order.order_id, 'clientOrderId': order.client_order_id,
+            'price': fmt_number(order.price), 'origQty': fmt_number(order.qty),
+            'executedQty': fmt_number(order.filled), 'status': order.status, 'timeInForce': 'GTC',
+            'type': 'LIMIT', 'side': order.side,
+        }
+        if self.futures:
+            avg = order.cum_quote / order.filled if order.filled else 0.0
+            data.update({'avgPrice': fmt_number(avg), 'cumQuote': fmt_number(order.cum_quote),
+                         'updateTime': order.update_time, 'positionSide': 'BOTH', 'reduceOnly': False})
+        else:
+            data.update({'orderListId': -1, 'transactTime': order.update_time, 'time': order.time,
+                         'cummulativeQuoteQty': fmt_number(order.cum_quote)})
+        return data
+
+    def _validate(self, sym, price, qty):
+        if price <= 0 or abs(price / sym.tick - round(price / sym.tick)) > 1e-6:
+            raise MockError(400, -1013, "Filter failure: PRICE_FILTER")
+        if qty < sym.min_qty or abs(qty / sym.step - round(qty / sym.step)) > 1e-6:
+            raise MockError(400, -1013, "Filter failure: LOT_SIZE")
+        if price * qty < sym.min_notional:
+            if self.futures:
+                raise MockError(400, -4164, f"Order's notional must be no smaller than {sym.min_notional}")
+            raise MockError(400, -1013, "Filter failure: NOTIONAL")
+
+    def _reserve(self, sym, order):
+        if self.futures:
+            return
+        asset, amount = (sym.quote, order.price * order.qty) if order.side == 'BUY' else (sym.base, order.qty)
+        balance = self.balances[asset]
+        if balance[0] < amount:
+            raise MockError(400, -2010, "Account has insufficient balance for requested action.")
+        balance[0] -= amount
+        balance[1] += amount
+        order.reserved = amount
+
+    def _release(self, sym, order):
+        if self.futures or not order.reserved:
+            return
+        balance = self.balances[sym.quote if order.side == 'BUY' else sym.base]
+        balance[0] += order.reserved
+        balance[1] -= order.reserved
+        order.reserved = 0.0
+
+    def new_order(self, params):
+        sym = self.symbol(params)
+        if params.get('type', 'LIMIT') != 'LIMIT':
+            raise MockError(400, -1116, "Invalid orderType.")
+        side = params['side']
+        price, qty = float(params['price']), float(params['quantity'])
+        self._validate(sym, price, qty)
+        client_id = params.get('newClientOrderId') or f"mock-{secrets.token_hex(8)}"
+        if client_id in sym.by_client:
+            raise MockError(400, -2010, "Duplicate order sent.")
+        order = MockOrder(sym.symbol, next(self.ids), client_id, side, price, qty)
+        self._reserve(sym, order)
+        sym.orders[order.order_id] = order
+        sym.by_client[client_id] = order
+        self.publish_user(self._order_event(order, 'NEW'))
+        # Спот блокирует средства под ордер и сразу сообщает новый free/locked
+        if not self.futures:
+            self.publish_user(self._account_event(sym))
+        self._match_taker(sym, order)
+        return order
+
+    def find_order(self, sym, params):
+        order = None
+        if params.get('orderId'):
+            order = sym.orders.get(int(params['orderId']))
+        elif params.get('origClientOrderId'):
+            order = sym.by_client.get(params['origClientOrderId'])
+        if order is None:
+            raise unknown_order()
+        return order
+
+    def _close(self, sym, order, status):
+        order.status = status
+        order.update_time = now_ms()
+        sym.orders.pop(order.order_id, None)
+        sym.by_client.pop(order.client_order_id, None)
+
+    def cancel_order(self, params):
+        sym = self.symbol(params)
+        order = self.find_order(sym, params)
+        self._release(sym, order)
+        self._close(sym, order, 'CANCELED')
+        cancel_id = params.get('newClientOrderId') or f"cancel-{secrets.token_hex(6)}"
+        if self.futures:
+            self.publish_user(self._order_event(order, 'CANCELED'))
+        else:
+            event = self._order_event(order, 'CANCELED', orig_client_id=order.client_order_id)
+            event['c'] = cancel_id
+            self.publish_user(event)
+            self.publish_user(self._account_event(sym))
+        data = self.order_response(order)
+        if not self.futures:
+            data['origClientOrderId'] = order.client_order_id
+            data['clientOrderId'] = cancel_id
+        return data
+
+    def cancel_all(self, params):
+        sym = self.symbol(params)
+        return [self.cancel_order({'symbol': sym.symbol, 'orderId': oid}) for oid in list(sym.orders)]
+
+    # Фьючерсы: изменение цены/количества (PUT /fapi/v1/order)
+    def modify_order(self, params):
+        sym = self.symbol(params)
+        order = self.find_order(sym, params)
+        price, qty = float(params['price']), float(params['quantity'])
+        self._validate(sym, price, qty)
+        if qty < order.filled:
+            raise MockError(400, -4032, "Exceed maximum modify order limit.")
+        order.price, order.qty = price, qty
+        order.update_time = now_ms()
+        self.publish_user(self._order_event(order, 'AMENDMENT'))
+        self._match_taker(sym, order)
+        return self.order_response(order)
+
+    # Спот: POST /api/v3/order/cancelReplace
+    def cancel_replace(self, params):
+        try:
+            cancel = self.cancel_order({'symbol': params['symbol'], 'orderId': params.get('cancelOrderId'),
+                                        'origClientOrderId': params.get('cancelOrigClientOrderId')})
+        except MockError as e:
+            raise MockError(400, -2022, "Order cancel-replace failed.", {
+                'cancelResult': 'FAILURE', 'newOrderResult': 'NOT_ATTEMPTED',
+                'cancelResponse': {'code': e.code, 'msg': e.msg}, 'newOrderResponse': None})
+        try:
+            order = self.new_order(params)
+        except MockError as e:
+            raise MockError(409, -2021, "Order cancel-replace partially failed.", {
+                'cancelResult': 'SUCCESS', 'newOrderResult': 'FAILURE',
+                'cancelResponse': cancel, 'newOrderResponse': {'code': e.code, 'msg': e.msg}})
+        return {'cancelResult': 'SUCCESS', 'newOrderResult': 'SUCCESS',
+                'cancelResponse': cancel, 'newOrderResponse': self.order_response(order)}
+
+    # Фьючерсы: POST /fapi/v1/batchOrders, ответ — по элементу на ордер
+    def batch_orders(self, params):
+        out = []
+        for item in json.loads(params['batchOrders']):
+            try:
+                out.append(self.order_response(self.new_order(item)))
+            except MockError as e:
+                out.append({'code': e.code, 'msg': e.msg})
+            except (KeyError, ValueError) as e:
+                out.append({'code': -1102, 'msg': f"Mandatory parameter {e} was not sent, was empty/null, or malformed."})
+        return out
+
+    # === Исполнение ===
+    def _match_taker(self, sym, order):
+        if order.status not in ('NEW', 'PARTIALLY_FILLED'):
+            return
+        if order.side == 'BUY':
+            best = sym.best_ask()
+            if best is not None and best <= order.price:
+                self.fill(sym, order, order.remaining, best, False)
+        else:
+            best = sym.best_bid()
+            if best is not None and best >= order.price:
+                self.fill(sym, order, order.remaining, best, False)
+
+    # Цена прошла через лимитные ордера — исполняем их как мейкеров
+    def match_resting(self, sym):
+        bid, ask = sym.best_bid(), sym.best_ask()
+        for order in list(sym.orders.values()):
+            if order.side == 'BUY' and ask is not None and ask < order.price:
+                self.fill(sym, order, order.remaining, order.price, True)
+            elif order.side == 'SELL' and bid is not None and bid > order.price:
+                self.fill(sym, order, order.remaining, order.price, True)
+
+    def fill(self, sym, order, qty, price, maker):
+        fee = price * qty * (self.maker_fee if maker else self.taker_fee)
+        realized = 0.0
+        if self.futures:
+            realized = self._update_position(sym, order.side, price, qty)
+            self.wallet += realized - fee
+        else:
+            quote, base = self.balances[sym.quote], self.balances[sym.base]
+            if order.side == 'BUY':
+                locked = order.reserved * qty / order.remaining
+                order.reserved -= locked
+                quote[1] -= locked
+                quote[0] += locked - price * qty - fee
+                base[0] += qty
+            else:
+                order.reserved -= qty
+                base[1] -= qty
+                quote[0] += price * qty - fee
+        order.filled += qty
+        order.cum_quote += price * qty
+        order.update_time = now_ms()
+        order.status = 'FILLED' if order.remaining <= 1e-12 else 'PARTIALLY_FILLED'
+        trade_id = next(self.trade_ids)
+        ts = now_ms()
+        buyer = order.side == 'BUY'
+        if self.futures:
+            sym.trades.append({'symbol': sym.symbol, 'id': trade_id, 'orderId': order.order_id, 'side': order.side,
+                               'price': fmt_number(price), 'qty': fmt_number(qty), 'realizedPnl': fmt_number(realized),
+                               'quoteQty': fmt_number(price * qty), 'commission': fmt_number(fee),
+                               'commissionAsset': 'USDT', 'time': ts, 'buyer': buyer, 'maker': maker,
+                               'positionSide': 'BOTH'})
+        else:
+            sym.trades.append({'symbol': sym.symbol, 'id': trade_id, 'orderId': order.order_id, 'orderListId': -1,
+                               'price': fmt_number(price), 'qty': fmt_number(qty), 'quoteQty': fmt_number(price * qty),
+                               'commission': fmt_number(fee), 'commissionAsset': 'USDT', 'time': ts,
+                               'isBuyer': buyer, 'isMaker': maker, 'isBestMatch': True})
+        if order.status == 'FILLED':
+            self._close(sym, order, 'FILLED')
+        event = self._order_event(order, 'TRADE', qty, price, fee, trade_id, maker)
+        if self.futures:
+            event['o']['rp'] = fmt_number(realized)
+        self.publish_user(event)
+        self.publish_user(self._account_event(sym))
+        # сделка видна и в публичном потоке: при покупке мейкера агрессор продаёт
+        self.publish(f"{sym.symbol.lower()}@aggTrade", {
+            'e': 'aggTrade', 'E': ts, 's': sym.symbol, 'a': next(self.agg_ids), 'p': fmt_number(price),
+            'q': fmt_number(qty), 'f': trade_id, 'l': trade_id, 'T': ts, 'm': buyer == maker})
+
+    def _update_position(self, sym, side, price, qty):
+        pos = self.positions[sym.symbol]
+        signed = qty if side == 'BUY' else -qty
+        amount, entry = pos
+        if amount == 0 or (amount > 0) == (signed > 0):
+            pos[1] = (entry * abs(amount) + price * qty) / (abs(amount) + qty)
+            pos[0] = amount + signed
+            return 0.0
+        closed = min(qty, abs(amount))
+        realized = closed * (price - entry) * (1 if amount > 0 else -1)
+        pos[0] = amount + signed
+        if abs(pos[0]) < 1e-12:
+            pos[0], pos[1] = 0.0, 0.0
+        elif qty > closed:
+            pos[1] = price
+        return realized
+
+    # === Чтение состояния ===
+    def open_orders(self, params):
+        symbols = [self.symbol(params)] if params.get('symbol') else self.symbols.values()
+        return [self.order_response(o) for s in symbols for o in s.orders.values()]
+
+    def my_trades(self, params):
+        sym = self.symbol(params)
+        limit = min(int(params.get('limit', 500)), 1000)
+        if params.get('fromId'):
+            from_id = int(params['fromId'])
+            return [t for t in sym.trades if t['id'] >= from_id][:limit]
+        return list(sym.trades)[-limit:]
+
+    def account(self, params):
+        return {'makerCommission': 10, 'takerCommission': 10, 'canTrade': True, 'accountType': 'SPOT',
+                'updateTime': now_ms(), 'balances': [
+                    {'asset': a, 'free': fmt_number(b[0]), 'locked': fmt_number(b[1])} for a, b in self.balances.items()]}
+
+    def futures_balance(self, params):
+        unrealized = sum(p[0] * (self.symbols[s].mid - p[1]) for s, p in self.positions.items())
+        return [{'accountAlias': 'mock', 'asset': 'USDT', 'balance': fmt_number(self.wallet),
+                 'crossWalletBalance': fmt_number(self.wallet), 'crossUnPnl': fmt_number(unrealized),
+                 'availableBalance': fmt_number(self.wallet + unrealized), 'maxWithdrawAmount': fmt_number(self.wallet),
+                 'marginAvailable': True, 'updateTime': now_ms()}]
+
+    def position_risk(self, params):
+        out = []
+        for s, (amount, entry) in self.positions.items():
+            if params.get('symbol') and params['symbol'] != s:
+                continue
+            out.append({'symbol': s, 'positionAmt': fmt_number(amount), 'entryPrice': fmt_number(entry),
+                        'markPrice': fmt_number(self.symbols[s].mid),
+                        'unRealizedProfit': fmt_number(amount * (self.symbols[s].mid - entry)),
+                        'positionSide': 'BOTH', 'updateTime': now_ms()})
+        return out
+
+    def exchange_info(self, params):
+        return {'timezone': 'UTC', 'serverTime': now_ms(), 'rateLimits': self.limiter.rate_limits(),
+                'symbols': [{'symbol': s.symbol, 'status': 'TRADING', 'baseAsset': s.base, 'quoteAsset': s.quote,
+                             'filters': s.filters()} for s in self.symbols.values()]}
+
+    def depth(self, params):
+        return self.symbol(params).snapshot(int(params.get('limit', 100)))
+
+    def new_listen_key(self, params):
+        key = secrets.token_hex(32)
+        self.listen_keys.add(key)
+        return {'listenKey': key}
+
+    # === Генератор цены ===
+    async def run_prices(self, tick_ms, trade_prob, rng):
+        while True:
+            await asyncio.sleep(tick_ms / 1000)
+            for sym in self.symbols.values():
+                previous = sym.update_id
+                bids, asks = sym.step_price()
+                ts = now_ms()
+                event = {'e': 'depthUpdate', 'E': ts, 's': sym.symbol, 'U': previous + 1, 'u': sym.update_id,
+                         'b': bids, 'a': asks}
+                if self.futures:
+                    event.update({'T': ts, 'pu': previous})
+                self.publish(f"{sym.symbol.lower()}@depth@100ms", event)
+                self.publish(f"{sym.symbol.lower()}@depth", event)
+                if sym.orders:
+                    self.match_resting(sym)
+                if rng.random() < trade_prob:
+                    buyer_maker = rng.random() < 0.5
+                    price = sym.best_bid() if buyer_maker else sym.best_ask()
+                    self.publish(f"{sym.symbol.lower()}@aggTrade", {
+                        'e': 'aggTrade', 'E': ts, 's': sym.symbol, 'a': next(self.agg_ids), 'p': fmt_number(price),
+                        'q': fmt_number(round(rng.uniform(0.001, 1), 3)), 'f': 0, 'l': 0, 'T': ts, 'm': buyer_maker})
+
+
+# === HTTP/WebSocket сервер ===
+# REST: /api/v3/... (спот), /fapi/v1|v2|v3/... (фьючерсы).
+# WebSocket: /spot|futures/stream?streams=... и /spot|futures/ws/<listenKey>.
+class MockExchange:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.markets = {}
+        for kind in ('spot', 'futures'):
+            symbols = {}
+            for name, price in zip(args.symbols, itertools.cycle(args.prices)):
+                symbols[name] = MockSymbol(name, price, args.tick, args.step, args.step, args.min_notional,
+                                           args.level_ticks, args.vol, random.Random(self.rng.random()))
+            self.markets[kind] = MockMarket(kind, symbols, args)
+        self._tasks = []
+
+    async def _delay(self):
+        latency = self.args.latency_ms + (self.rng.uniform(0, self.args.jitter_ms) if self.args.jitter_ms else 0)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def route(self, market, handler, weight=1, orders=0):
+        async def view(request):
+            params = dict(request.query)
+            if request.method != 'GET' and request.can_read_body:
+                params.update(await request.post())
+            await self._delay()
+            cost = weight(params) if callable(weight) else weight
+            count = orders(params) if callable(orders) else orders
+            limited = market.limiter.charge(cost, count)
+            if limited is not None:
+                kind, retry_after = limited
+                code, msg = (-1015, "Too many new orders.") if kind == 'ORDERS' else (-1003, "Too many requests.")
+                headers = dict(market.limiter.headers(), **{'Retry-After': str(max(retry_after, 1))})
+                return web.json_response({'code': code, 'msg': msg}, status=429, headers=headers)
+            try:
+                result = handler(params)
+                if isinstance(result, MockOrder):
+                    result = market.order_response(result)
+                status = 200
+            except MockError as e:
+                result, status = {'code': e.code, 'msg': e.msg}, e.status
+                if e.data is not None:
+                    result['data'] = e.data
+            except (KeyError, ValueError) as e:
+                result, status = {'code': -1102, 'msg': f"Mandatory parameter {e} was not sent, was empty/null, or malformed."}, 400
+            return web.json_response(result, status=status, headers=market.limiter.headers())
+        return view
+
+    async def market_ws(self, request):
+        market = self.markets[request.match_info['kind']]
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        sub = Subscriber(ws)
+        streams = request.query.get('streams')
+        if streams:
+            sub.streams.update(streams.split('/'))
+        market.market_subs.add(sub)
+        writer = asyncio.ensure_future(sub.writer())
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                req = json.loads(msg.data)
+                if req.get('method') == 'SUBSCRIBE':
+                    sub.streams.update(req.get('params', []))
+                elif req.get('method') == 'UNSUBSCRIBE':
+                    sub.streams.difference_update(req.get('params', []))
+                sub.send(json.dumps({'result': None, 'id': req.get('id')}))
+        finally:
+            market.market_subs.discard(sub)
+            writer.cancel()
+        return ws
+
+    async def user_ws(self, request):
+        market = self.markets[request.match_info['kind']]
+        if request.match_info['key'] not in market.listen_keys:
+            raise web.HTTPBadRequest(text='{"code": -1125, "msg": "This listenKey does not exist."}')
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        sub = Subscriber(ws)
+        market.user_subs.add(sub)
+        writer = asyncio.ensure_future(sub.writer())
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            market.user_subs.discard(sub)
+            writer.cancel()
+        return ws
+
+    def app(self):
+        spot, fut = self.markets['spot'], self.markets['futures']
+        ok = lambda params: {}
+        server_time = lambda params: {'serverTime': now_ms()}
+        spot_depth_weight = lambda p: 5 if int(p.get('limit', 100)) <= 100 else 25 if int(p['limit']) <= 500 else 50
+        fut_depth_weight = lambda p: 5 if int(p.get('limit', 100)) <= 100 else 10 if int(p['limit']) <= 500 else 20
+        app = web.Application()
+        r = app.router
+        # Спот
+        r.add_get('/api/v3/ping', self.route(spot, ok))
+        r.add_get('/api/v3/time', self.route(spot, server_time))
+        r.add_get('/api/v3/exchangeInfo', self.route(spot, spot.exchange_info, 20))
+        r.add_get('/api/v3/depth', self.route(spot, spot.depth, spot_depth_weight))
+        r.add_get('/api/v3/account', self.route(spot, spot.account, 20))
+        r.add_post('/api/v3/order', self.route(spot, spot.new_order, 1, 1))
+        r.add_delete('/api/v3/order', self.route(spot, spot.cancel_order, 1))
+        r.add_post('/api/v3/order/cancelReplace', self.route(spot, spot.cancel_replace, 1, 1))
+        r.add_get('/api/v3/openOrders', self.route(spot, spot.open_orders, 6))
+        r.add_delete('/api/v3/openOrders', self.route(spot, spot.cancel_all, 1))
+        r.add_get('/api/v3/myTrades', self.route(spot, spot.my_trades, 20))
+        r.add_post('/api/v3/userDataStream', self.route(spot, spot.new_listen_key, 2))
+        r.add_put('/api/v3/userDataStream', self.route(spot, ok, 2))
+        r.add_delete('/api/v3/userDataStream', self.route(spot, ok, 2))
+        # Фьючерсы
+        r.add_get('/fapi/v1/ping', self.route(fut, ok))
+        r.add_get('/fapi/v1/time', self.route(fut, server_time))
+        r.add_get('/fapi/v1/exchangeInfo', self.route(fut, fut.exchange_info, 1))
+        r.add_get('/fapi/v1/depth', self.route(fut, fut.depth, fut_depth_weight))
+        for version in ('v2', 'v3'):
+            r.add_get(f'/fapi/{version}/balance', self.route(fut, fut.futures_balance, 5))
+            r.add_get(f'/fapi/{version}/positionRisk', self.route(fut, fut.position_risk, 5))
+        r.add_post('/fapi/v1/order', self.route(fut, fut.new_order, 0, 1))
+        r.add_put('/fapi/v1/order', self.route(fut, fut.modify_order, 1, 1))
+        r.add_delete('/fapi/v1/order', self.route(fut, fut.cancel_order, 1))
+        r.add_post('/fapi/v1/batchOrders', self.route(fut, fut.batch_orders, 5,
+                                                      lambda p: len(json.loads(p.get('batchOrders', '[]')))))
+        r.add_get('/fapi/v1/openOrders', self.route(fut, fut.open_orders, 1))
+        r.add_delete('/fapi/v1/allOpenOrders', self.route(fut, lambda p: (fut.cancel_all(p), {
+            'code': 200, 'msg': 'The operation of cancel all open order is done.'})[1], 1))
+        r.add_get('/fapi/v1/userTrades', self.route(fut, fut.my_trades, 5))
+        r.add_post('/fapi/v1/listenKey', self.route(fut, fut.new_listen_key, 1))
+        r.add_put('/fapi/v1/listenKey', self.route(fut, ok, 1))
+        r.add_delete('/fapi/v1/listenKey', self.route(fut, ok, 1))
+        # WebSocket
+        r.add_get('/{kind:spot|futures}/stream', self.market_ws)
+        r.add_get('/{kind:spot|futures}/ws/{key}', self.user_ws)
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start(self, app):
+        for market in self.markets.values():
+            self._tasks.append(asyncio.ensure_future(
+                market.run_prices(self.args.tick_ms, self.args.trade_prob, random.Random(self.rng.random()))))
+
+    async def _stop(self, app):
+        for task in self._tasks:
+            task.cancel()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная биржа-заглушка Binance (REST + WebSocket)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--symbols', default='BTCUSDT', type=lambda s: s.upper().split(','))
+    parser.add_argument('--prices', default='30000', type=lambda s: [float(x) for x in s.split(',')],
+                        help="начальные цены символов через запятую")
+    parser.add_argument('--tick', type=float, default=0.01)
+    parser.add_argument('--step', type=float, default=0.00001, help="шаг и минимум количества")
+    parser.add_argument('--min-notional', type=float, default=5.0)
+    parser.add_argument('--level-ticks', type=int, default=5, help="расстояние между уровнями стакана в тиках")
+    parser.add_argument('--vol', type=float, default=0.0002, help="волатильность цены за тик")
+    parser.add_argument('--tick-ms', type=int, default=100, help="период обновления стакана")
+    parser.add_argument('--trade-prob', type=float, default=0.3, help="вероятность публичной сделки за тик")
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--weight-limit', type=int, default=6000, help="вес запросов в минуту")
+    parser.add_argument('--order-limit', type=int, default=0,
+                        help="ордеров за 10 секунд, 0 — без лимита ордеров (по умолчанию); как на бирже — 100")
+    parser.add_argument('--balance', type=float, default=10000.0, help="начальный баланс USDT")
+    parser.add_argument('--base-balance', type=float, default=1.0, help="спот: начальный баланс базового актива")
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args(argv)
+
+
+# Запуск: python mock_exchange.py --symbols BTCUSDT --latency-ms 2
+# Бот: API_URL=http://127.0.0.1:8900/api FUTURES_URL=http://127.0.0.1:8900/fapi
+#      STREAM_URL=ws://127.0.0.1:8900/spot FUTURES_STREAM_URL=ws://127.0.0.1:8900/futures
+if __name__ == '__main__':
+    args = parse_args()
+    logger.info(f"[Mock] Биржа на http://{args.host}:{args.port}: {', '.join(args.symbols)}")
+    web.run_app(MockExchange(args).app(), host=args.host, port=args.port, access_log=None, print=None)
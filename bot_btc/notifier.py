@@ -0,0 +1,134 @@
+# notifier.py
+import asyncio
+import os
+import time
+from collections import deque
+from loguru import logger
+from exchange_gateway import get_session
+from metrics import metrics, GLOBAL
+
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "100"))
+NOTIFY_DIGEST_INTERVAL = int(os.getenv("NOTIFY_DIGEST_INTERVAL", "60"))
+TELEGRAM_MIN_INTERVAL = 1.0  # не чаще сообщения в секунду в один чат
+TELEGRAM_MAX_LENGTH = 4096
+SEND_RETRIES = 3
+
+
+# === Асинхронные уведомления в Telegram ===
+# Сообщения ставятся в очередь и отправляются фоновой задачей по общей keep-alive
+# сессии, торговая корутина не ждёт сети. Обновления статуса с ключом (notify(key=...))
+# склеиваются: в сводку раз в NOTIFY_DIGEST_INTERVAL попадает только последнее по ключу,
+# в очередь сводка не ставится. Очередь ограничена NOTIFY_QUEUE_SIZE: при переполнении
+# отбрасывается самое старое обычное сообщение (alert — только если обычных нет),
+# число отброшенных уходит строкой в следующую сводку. Аварийные сообщения обгоняют очередь.
+class TelegramNotifier:
+    def __init__(self, token, chat_id):
+        self.enabled = bool(token and chat_id)
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.alerts = deque()
+        self.messages = deque()
+        self.digest = {}  # ключ -> последний текст
+        self.dropped = 0
+        self._unreported = 0  # отброшено с последней сводки
+        self._wakeup = None
+        self._idle = None
+        self._closing = False
+        self._task = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            if self._wakeup is None:
+                self._wakeup = asyncio.Event()
+                self._idle = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def _push(self, queue, text):
+        self._ensure_started()
+        if len(self.alerts) + len(self.messages) >= NOTIFY_QUEUE_SIZE:
+            (self.messages or self.alerts).popleft()
+            self.dropped += 1
+            self._unreported += 1
+            metrics.inc(GLOBAL, 'telegram_dropped')
+            logger.warning(f"[Telegram] Очередь переполнена, старое сообщение отброшено ({self.dropped})")
+        queue.append(text)
+        self._idle.clear()
+        self._wakeup.set()
+
+    def notify(self, text, key=None):
+        if not self.enabled:
+            return
+        if key is not None:
+            self.digest[key] = text
+            self._ensure_started()
+            return
+        self._push(self.messages, text)
+
+    def alert(self, text):
+        if self.enabled:
+            self._push(self.alerts, text)
+
+    def _take_digest(self):
+        lines = list(self.digest.values())
+        if self._unreported:
+            lines.append(f"⚠️ Очередь уведомлений переполнялась, пропущено сообщений: {self._unreported}")
+        self.digest.clear()
+        self._unreported = 0
+        return "\n\n".join(lines)[:TELEGRAM_MAX_LENGTH] if lines else None
+
+    async def _run(self):
+        next_digest = time.monotonic() + NOTIFY_DIGEST_INTERVAL
+        while True:
+            text = None
+            if self.alerts:
+                text = self.alerts.popleft()
+            elif self._closing or time.monotonic() >= next_digest:
+                text = self._take_digest()
+                next_digest = time.monotonic() + NOTIFY_DIGEST_INTERVAL
+                if text is None and self.messages:
+                    text = self.messages.popleft()
+            elif self.messages:
+                text = self.messages.popleft()
+            if text is None:
+                if self._closing:
+                    self._idle.set()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(next_digest - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._send(text)
+            await asyncio.sleep(TELEGRAM_MIN_INTERVAL)
+
+    async def _send(self, text):
+        for _ in range(SEND_RETRIES):
+            try:
+                with metrics.timer(GLOBAL, 'telegram_send'):
+                    async with get_session(self.url).post(self.url, data={"chat_id": self.chat_id, "text": text}) as resp:
+                        status = resp.status
+                        data = await resp.json(content_type=None) if status == 429 else None
+                        error = await resp.text() if status != 429 and status >= 400 else None
+                metrics.inc(GLOBAL, f"telegram_{status}")
+                if status != 429:
+                    if error is not None:
+                        logger.error(f"[Telegram] Ошибка {status}: {error}")
+                    return
+                retry_after = data.get('parameters', {}).get('retry_after', 1)
+            except Exception as e:
+                logger.error(f"[Telegram] Ошибка: {e}")
+                return
+            logger.warning(f"[Telegram] Лимит, повтор через {retry_after} с")
+            await asyncio.sleep(retry_after)
+
+    # Отправить сводку и всё, что в очереди (при остановке процесса)
+    async def close(self, timeout=10):
+        if not self.enabled or self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("[Telegram] Не все уведомления отправлены до остановки")
+        self._task.cancel()
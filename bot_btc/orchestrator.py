@@ -0,0 +1,388 @@
+# orchestrator.py
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from loguru import logger
+from telegram.ext import Updater, CommandHandler
+import bot_commands
+import rate_governor
+from db import init_db
+from notifier import TelegramNotifier
+
+load_dotenv()
+
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = int(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "60"))
+SUPERVISE_INTERVAL = 1
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 60
+RESTART_BACKOFF_RESET = 300  # проработал дольше — следующий перезапуск снова без задержки
+COMMAND_TIMEOUT = 35         # run_on_loop в воркере ждёт до 30 с
+WORKER_STOP_TIMEOUT = 15
+ROUTED_COMMANDS = ('balance', 'pnl_today', 'latency', 'fills', 'stop')
+
+
+def _exit_on_sigterm():
+    # SystemExit в главном потоке: finally торгового цикла досылает уведомления
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+# Ядра для привязки воркеров: WORKER_CORES=0,1,2 или доступные процессу
+def worker_cores():
+    cores = os.getenv("WORKER_CORES")
+    if cores:
+        return [int(c) for c in cores.split(',')]
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+# Символы по воркерам по кругу: порядок SYMBOLS задаёт раскладку, она не меняется между запусками
+def shard_symbols(symbols, workers):
+    return [symbols[i::workers] for i in range(workers)]
+
+
+# === Воркер: main_bot по своей части символов ===
+# Состояние PnL уходит в оркестратор с каждым heartbeat; команды Telegram приходят по
+# той же трубе и выполняются обработчиками bot_commands в отдельном потоке.
+class _Reply:
+    def __init__(self):
+        self.texts = []
+
+    def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+class WorkerChannel:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.conn.send(message)
+
+    def serve_commands(self):
+        while True:
+            try:
+                _, request_id, name, args = self.conn.recv()
+            except (EOFError, OSError):
+                return
+            threading.Thread(target=self._execute, args=(request_id, name, args), daemon=True).start()
+
+    def _execute(self, request_id, name, args):
+        reply = _Reply()
+        try:
+            getattr(bot_commands, name)(SimpleNamespace(message=reply), SimpleNamespace(args=args))
+        except Exception as e:
+            reply.reply_text(f"❌ Ошибка: {e}")
+        try:
+            self.send(('reply', request_id, reply.texts))
+        except (BrokenPipeError, OSError):
+            pass
+
+    async def heartbeat(self, engines):
+        threading.Thread(target=self.serve_commands, daemon=True).start()
+        while True:
+            self.send(('heartbeat', {symbol: pnl_snapshot(e) for symbol, e in list(engines.items())}))
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+def pnl_snapshot(engine):
+    return {'position': engine.position, 'avg_price': engine.avg_price, 'mark_price': engine.mark_price,
+            'realized': engine.realized, 'unrealized': engine.unrealized, 'fees': engine.fees,
+            'net': engine.net, 'trades': engine.trades}
+
+
+def worker_main(index, symbols, core, conn, metrics_port, rate_share):
+    _exit_on_sigterm()
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {core})
+    # Вес по IP и счётчики ордеров общие для всех воркеров: бакеты воркера — его доля бюджета
+    rate_governor.RATE_LIMIT_SHARE = rate_share
+    # main_bot создаёт клиентов по SYMBOLS при импорте
+    os.environ['SYMBOLS'] = ','.join(symbols)
+    os.environ['METRICS_PORT'] = str(metrics_port)
+    import main_bot
+    channel = WorkerChannel(conn)
+    logger.info(f"[W{index}] Воркер запущен на ядре {core}: {', '.join(symbols)}, доля лимитов {rate_share:.2f}")
+    main_bot.main(telegram=False, extra=[channel.heartbeat(main_bot.pnl_engines)])
+
+
+class Worker:
+    def __init__(self, index, symbols, core):
+        self.index = index
+        self.symbols = symbols
+        self.core = core
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+        self.started = 0.0
+        self.heartbeat = 0.0
+        self.pnl = {}
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF_MIN
+        self.restart_at = None   # время запланированного перезапуска
+        self.restart_requested = False
+        self.stopped = False
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    @property
+    def name(self):
+        return f"W{self.index}"
+
+
+# === Оркестратор: воркеры по ядрам, надзор и единый Telegram ===
+class Orchestrator:
+    def __init__(self, symbols, workers, cores, metrics_port):
+        self.ctx = multiprocessing.get_context('spawn')
+        self.metrics_port = metrics_port
+        self.workers = [Worker(i, shard, cores[i % len(cores)])
+                        for i, shard in enumerate(shard_symbols(symbols, workers))]
+        self.owners = {symbol: w for w in self.workers for symbol in w.symbols}
+        self.notifier = TelegramNotifier(os.getenv("TG_TOKEN"), os.getenv("TG_CHAT_ID"))
+        self.pending = {}  # id запроса -> [Event, ответ]
+        self._ids = itertools.count(1)
+        self.loop = None
+
+    # Доля бюджета лимитов по числу символов воркера: без деления N воркеров тратили бы N× лимит,
+    # пока поправки по заголовкам X-MBX-USED-WEIGHT не догонят
+    def rate_share(self, worker):
+        return len(worker.symbols) / len(self.owners)
+
+    def start(self, worker):
+        parent, child = self.ctx.Pipe()
+        port = self.metrics_port + worker.index if self.metrics_port else 0
+        worker.process = self.ctx.Process(target=worker_main, name=worker.name, daemon=True,
+                                          args=(worker.index, worker.symbols, worker.core, child, port,
+                                                self.rate_share(worker)))
+        worker.process.start()
+        child.close()
+        worker.conn = parent
+        worker.started = time.monotonic()
+        worker.heartbeat = 0.0
+        worker.restart_at = None
+        worker.restart_requested = False
+        worker.stopped = False
+        threading.Thread(target=self._read, args=(worker, parent), daemon=True).start()
+        logger.info(f"[Оркестратор] {worker.name} pid {worker.process.pid}, ядро {worker.core}: "
+                    f"{', '.join(worker.symbols)}")
+
+    def _read(self, worker, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == 'heartbeat':
+                worker.heartbeat = time.monotonic()
+                worker.pnl = message[1]
+            elif message[0] == 'reply':
+                entry = self.pending.get(message[1])
+                if entry is not None:
+                    entry[1] = message[2]
+                    entry[0].set()
+
+    # Вызывается из потока Telegram
+    def request(self, worker, name, args, timeout=COMMAND_TIMEOUT):
+        if not worker.alive:
+            return [f"❌ Воркер {worker.name} ({', '.join(worker.symbols)}) не запущен"]
+        request_id = next(self._ids)
+        entry = self.pending[request_id] = [threading.Event(), None]
+        try:
+            with worker.lock:
+                worker.conn.send(('command', request_id, name, args))
+            if not entry[0].wait(timeout):
+                return [f"⏳ Воркер {worker.name} не ответил за {timeout} с"]
+            return entry[1]
+        except (BrokenPipeError, OSError) as e:
+            return [f"❌ Воркер {worker.name} недоступен: {e}"]
+        finally:
+            self.pending.pop(request_id, None)
+
+    def alert(self, text):
+        logger.warning(text)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.notifier.alert, text)
+
+    # === Надзор: перезапуск упавших и зависших воркеров ===
+    # Код 0 — штатная остановка (SIGTERM извне): воркер не перезапускается. TAKE_PROFIT / STOP_LOSS
+    # и /stop останавливают только свой символ, процесс воркера продолжает работать.
+    def check(self, worker):
+        now = time.monotonic()
+        if worker.process is None:
+            if worker.restart_at is not None and now >= worker.restart_at:
+                self.start(worker)
+            return
+        if worker.process.is_alive():
+            if now - max(worker.heartbeat, worker.started) > HEARTBEAT_TIMEOUT:
+                self.alert(f"[Оркестратор] {worker.name} не отвечает {HEARTBEAT_TIMEOUT} с, перезапуск")
+                worker.process.kill()
+            return
+        code = worker.process.exitcode
+        worker.process.join()
+        worker.conn.close()
+        worker.process = None
+        worker.pnl = {}
+        symbols = ', '.join(worker.symbols)
+        if code == 0 and not worker.restart_requested:
+            worker.stopped = True
+            self.alert(f"[Оркестратор] {worker.name} остановлен ({symbols}), перезапуск: /restart")
+            return
+        if worker.restart_requested:
+            worker.restart_at = now
+        else:
+            if now - worker.started > RESTART_BACKOFF_RESET:
+                worker.backoff = RESTART_BACKOFF_MIN
+            worker.restart_at = now + worker.backoff
+            self.alert(f"[Оркестратор] {worker.name} ({symbols}) завершился с кодом {code}, "
+                       f"перезапуск через {worker.backoff} с")
+            worker.backoff = min(worker.backoff * 2, RESTART_BACKOFF_MAX)
+        worker.restarts += 1
+
+    async def supervise(self):
+        while True:
+            for worker in self.workers:
+                self.check(worker)
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+
+    def shutdown(self):
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(WORKER_STOP_TIMEOUT)
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        init_db()  # схема и миграции до старта воркеров, не параллельно в каждом
+        for worker in self.workers:
+            self.start(worker)
+        token = os.getenv("TG_TOKEN")
+        if token:
+            threading.Thread(target=self.run_telegram, args=(token,), daemon=True).start()
+        try:
+            await self.supervise()
+        finally:
+            self.shutdown()
+            await self.notifier.close()
+
+    # === Telegram: единственный опрос на все воркеры ===
+    def resolve(self, arg):
+        symbol = arg.upper()
+        if symbol not in self.owners and f"{symbol}USDT" in self.owners:
+            symbol = f"{symbol}USDT"
+        return symbol, self.owners.get(symbol)
+
+    def routed(self, name):
+        def handler(update, context):
+            if not context.args:
+                update.message.reply_text(f"Укажи символ: /{name} BTC")
+                return
+            symbol, worker = self.resolve(context.args[0])
+            if worker is None:
+                update.message.reply_text(f"Символ {symbol} не обслуживается")
+                return
+            for text in self.request(worker, name, [symbol] + context.args[1:]):
+                update.message.reply_text(text)
+        return handler
+
+    def worker_status(self, worker):
+        symbols = ', '.join(worker.symbols)
+        if worker.stopped:
+            return f"🛑 {worker.name}: {symbols} — остановлен"
+        if not worker.alive:
+            return f"♻️ {worker.name}: {symbols} — перезапускается (перезапусков {worker.restarts})"
+        now = time.monotonic()
+        beat = f"{now - worker.heartbeat:.0f} с назад" if worker.heartbeat else "ещё не было"
+        return (f"✅ {worker.name} pid {worker.process.pid}, ядро {worker.core}: {symbols} — "
+                f"работает {(now - worker.started) / 60:.0f} мин, перезапусков {worker.restarts}, heartbeat {beat}")
+
+    def status(self, update, context):
+        if not context.args:
+            update.message.reply_text("Укажи символ: /status BTC")
+            return
+        symbol, worker = self.resolve(context.args[0])
+        if worker is None:
+            update.message.reply_text(f"Символ {symbol} не обслуживается")
+            return
+        update.message.reply_text(self.worker_status(worker))
+
+    def workers_cmd(self, update, context):
+        update.message.reply_text("\n".join(self.worker_status(w) for w in self.workers))
+
+    # Перезапуск воркера с символом; остановленный по /stop запускается снова
+    def restart(self, update, context):
+        if not context.args:
+            update.message.reply_text("Укажи символ: /restart BTC")
+            return
+        symbol, worker = self.resolve(context.args[0])
+        if worker is None:
+            update.message.reply_text(f"Символ {symbol} не обслуживается")
+            return
+        worker.restart_requested = True
+        if worker.alive:
+            worker.process.terminate()
+        else:
+            worker.restart_at = time.monotonic()
+        update.message.reply_text(f"♻️ Перезапуск {worker.name}: {', '.join(worker.symbols)}")
+
+    # Сводный PnL сессии по всем воркерам (из последних heartbeat)
+    def pnl_live(self, update, context):
+        lines = []
+        total = realized = unrealized = fees = 0.0
+        for worker in self.workers:
+            if not worker.pnl:
+                lines.append(f"{', '.join(worker.symbols)}  |  нет данных ({worker.name})")
+                continue
+            for symbol, p in sorted(worker.pnl.items()):
+                lines.append(f"{symbol}  |  {p['net']:+.2f} USDT  |  позиция {p['position']:.4f}  |  "
+                             f"сделок {p['trades']}  |  {worker.name}")
+                total += p['net']
+                realized += p['realized']
+                unrealized += p['unrealized']
+                fees += p['fees']
+        msg = "📊 PnL сессии по всем воркерам:\n\n" + "\n".join(lines)
+        msg += (f"\n\nИтого: {total:+.2f} USDT (реализовано {realized:.2f}, нереализовано {unrealized:.2f}, "
+                f"комиссии {fees:.2f})")
+        update.message.reply_text(msg)
+
+    def run_telegram(self, token):
+        updater = Updater(token, use_context=True)
+        dp = updater.dispatcher
+
+        dp.add_handler(CommandHandler("start", bot_commands.start))
+        dp.add_handler(CommandHandler("pnl_table", bot_commands.pnl_table))
+        dp.add_handler(CommandHandler("pnl_total", bot_commands.pnl_total))
+        dp.add_handler(CommandHandler("pnl_live", self.pnl_live))
+        dp.add_handler(CommandHandler("workers", self.workers_cmd))
+        dp.add_handler(CommandHandler("status", self.status))
+        dp.add_handler(CommandHandler("restart", self.restart))
+        for name in ROUTED_COMMANDS:
+            dp.add_handler(CommandHandler(name, self.routed(name)))
+
+        updater.start_polling()
+
+
+# Запуск: python orchestrator.py — все SYMBOLS в одном развёртывании, WORKERS процессов
+if __name__ == '__main__':
+    _exit_on_sigterm()
+    symbols = os.getenv("SYMBOLS", "BTCUSDT,SOLUSDT").split(',')
+    cores = worker_cores()
+    workers = max(1, min(int(os.getenv("WORKERS", "0")) or len(cores), len(symbols)))
+    orchestrator = Orchestrator(symbols, workers, cores, int(os.getenv("METRICS_PORT", "9108")))
+    logger.info(f"[Оркестратор] {len(symbols)} символов на {workers} воркерах, ядра: {cores}")
+    asyncio.run(orchestrator.run())
@@ -0,0 +1,162 @@
+# order_book.py
+from bisect import bisect_left
+from itertools import accumulate
+
+
+# === Одна сторона стакана ===
+# Уровни хранятся в двух параллельных отсортированных списках (ключ, объём),
+# лучшая цена всегда в конце: для bid ключ = цена, для ask ключ = -цена.
+# Поиск уровня — bisect за O(log n), лучший уровень — O(1).
+class BookSide:
+    def __init__(self, is_bid):
+        self.sign = 1.0 if is_bid else -1.0
+        self.keys = []
+        self.qtys = []
+        self._cum = None  # накопленный объём от лучшего уровня, строится лениво
+
+    def clear(self):
+        self.keys.clear()
+        self.qtys.clear()
+        self._cum = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, price, qty):
+        key = price * self.sign
+        i = bisect_left(self.keys, key)
+        found = i < len(self.keys) and self.keys[i] == key
+        if qty == 0:
+            if found:
+                del self.keys[i]
+                del self.qtys[i]
+        elif found:
+            self.qtys[i] = qty
+        else:
+            self.keys.insert(i, key)
+            self.qtys.insert(i, qty)
+        self._cum = None
+
+    def best(self):
+        if not self.keys:
+            return None
+        return self.keys[-1] * self.sign, self.qtys[-1]
+
+    def top(self, n):
+        out = []
+        for i in range(len(self.keys) - 1, max(len(self.keys) - n, 0) - 1, -1):
+            out.append((self.keys[i] * self.sign, self.qtys[i]))
+        return out
+
+    def cumulative(self):
+        if self._cum is None:
+            self._cum = list(accumulate(reversed(self.qtys)))
+        return self._cum
+
+    # Объём на уровнях не хуже price
+    def qty_to_price(self, price):
+        key = price * self.sign
+        i = bisect_left(self.keys, key)
+        levels = len(self.keys) - i
+        if levels <= 0:
+            return 0.0
+        return self.cumulative()[levels - 1]
+
+    # Цена, до которой нужно пройти стакан, чтобы набрать qty (None — не хватает глубины)
+    def price_for_qty(self, qty):
+        cum = self.cumulative()
+        j = bisect_left(cum, qty)
+        if j >= len(cum):
+            return None
+        return self.keys[len(self.keys) - 1 - j] * self.sign
+
+
+class OutOfSync(Exception):
+    pass
+
+
+# === Локальный стакан полной глубины ===
+# Загружается из REST-снимка и обновляется diff-событиями @depth@100ms
+# с проверкой последовательности U/u (спот) и pu (фьючерсы).
+class LocalOrderBook:
+    def __init__(self, symbol, futures=False):
+        self.symbol = symbol
+        self.futures = futures
+        self.bids = BookSide(True)
+        self.asks = BookSide(False)
+        self.last_update_id = None
+        self.synced = False
+        self.event_time = None
+
+    def reset(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.last_update_id = None
+        self.synced = False
+        self.event_time = None
+
+    def load_snapshot(self, snapshot):
+        self.reset()
+        for price, qty in snapshot['bids']:
+            self.bids.update(float(price), float(qty))
+        for price, qty in snapshot['asks']:
+            self.asks.update(float(price), float(qty))
+        self.last_update_id = snapshot['lastUpdateId']
+        self.event_time = snapshot.get('E')
+
+    # Применяет diff-событие (decoder.DepthUpdate). Устаревшие события пропускает,
+    # при разрыве последовательности бросает OutOfSync.
+    def apply_diff(self, update):
+        if self.last_update_id is None:
+            raise OutOfSync(f"{self.symbol}: нет снимка")
+        first, last = update.first_id, update.last_id
+        if not self.synced:
+            if self.futures:
+                if last < self.last_update_id:
+                    return False
+                if first > self.last_update_id:
+                    raise OutOfSync(f"{self.symbol}: снимок {self.last_update_id} старше события {first}")
+            else:
+                if last <= self.last_update_id:
+                    return False
+                if first > self.last_update_id + 1:
+                    raise OutOfSync(f"{self.symbol}: снимок {self.last_update_id} старше события {first}")
+            self.synced = True
+        elif self.futures:
+            if update.prev_id != self.last_update_id:
+                raise OutOfSync(f"{self.symbol}: pu={update.prev_id}, ожидался {self.last_update_id}")
+        elif first != self.last_update_id + 1:
+            raise OutOfSync(f"{self.symbol}: U={first}, ожидался {self.last_update_id + 1}")
+
+        bids, asks = self.bids.update, self.asks.update
+        for price, qty in update.bids:
+            bids(price, qty)
+        for price, qty in update.asks:
+            asks(price, qty)
+        self.last_update_id = last
+        self.event_time = update.event_time
+        return True
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def side(self, side):
+        return self.bids if side.upper() in ('BUY', 'BID') else self.asks
+
+    def top(self, side, n):
+        return self.side(side).top(n)
+
+    def qty_to_price(self, side, price):
+        return self.side(side).qty_to_price(price)
+
+    def price_for_qty(self, side, qty):
+        return self.side(side).price_for_qty(qty)
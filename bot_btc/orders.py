@@ -0,0 +1,41 @@
+# orders.py
+import asyncio
+from collections import namedtuple
+from exchange_gateway import APIError
+
+FUTURES_BATCH_SIZE = 5  # лимит POST /fapi/v1/batchOrders
+
+OrderRequest = namedtuple('OrderRequest', 'level side price qty client_order_id', defaults=(None,))
+OrderResult = namedtuple('OrderResult', 'request response error')
+
+
+async def _futures_batch(gateway, symbol, chunk):
+    responses = await gateway.batch_orders(symbol, [(r.side, r.price, r.qty, r.client_order_id) for r in chunk])
+    results = []
+    for req, resp in zip(chunk, responses):
+        if 'orderId' not in resp:
+            results.append(OrderResult(req, None, APIError(200, resp.get('code'), resp.get('msg'))))
+        else:
+            results.append(OrderResult(req, resp, None))
+    return results
+
+
+# === Пакетное размещение ордеров сетки ===
+# Фьючерсы — batchOrders пачками по 5, спот — параллельные запросы по общей
+# keep-alive сессии шлюза. Результат возвращается по каждому ордеру в порядке запросов.
+async def submit_orders(gateway, symbol, orders):
+    if not gateway.futures:
+        responses = await asyncio.gather(
+            *(gateway.new_order(symbol, r.side, r.price, r.qty, r.client_order_id) for r in orders), return_exceptions=True)
+        return [OrderResult(req, None, resp) if isinstance(resp, Exception) else OrderResult(req, resp, None)
+                for req, resp in zip(orders, responses)]
+
+    chunks = [orders[i:i + FUTURES_BATCH_SIZE] for i in range(0, len(orders), FUTURES_BATCH_SIZE)]
+    batches = await asyncio.gather(*(_futures_batch(gateway, symbol, c) for c in chunks), return_exceptions=True)
+    results = []
+    for chunk, batch in zip(chunks, batches):
+        if isinstance(batch, Exception):
+            results.extend(OrderResult(req, None, batch) for req in chunk)
+        else:
+            results.extend(batch)
+    return results
@@ -0,0 +1,70 @@
+# pnl_engine.py
+
+# === PnL сессии по средней цене позиции ===
+# Состояние — несколько чисел, каждое исполнение обновляет их за O(1).
+# Позиция со знаком: > 0 — лонг, < 0 — шорт (для спота — продажа запаса,
+# купленного до старта сессии). Реализованный PnL фиксируется при сокращении
+# позиции, нереализованный считается от последней цены mark (mid стакана).
+class PnLEngine:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.position = 0.0
+        self.avg_price = 0.0
+        self.realized = 0.0
+        self.fees = 0.0
+        self.buy_qty = self.buy_cost = 0.0
+        self.sell_qty = self.sell_cost = 0.0
+        self.trades = 0
+        self.mark_price = None
+
+    def on_fill(self, side, price, qty, fee=0.0):
+        signed = qty if side == 'BUY' else -qty
+        if side == 'BUY':
+            self.buy_qty += qty
+            self.buy_cost += price * qty
+        else:
+            self.sell_qty += qty
+            self.sell_cost += price * qty
+        self.fees += fee
+        self.trades += 1
+
+        pos = self.position
+        if pos == 0 or (pos > 0) == (signed > 0):
+            # Наращивание позиции: пересчёт средней цены
+            total = abs(pos) + qty
+            self.avg_price = (self.avg_price * abs(pos) + price * qty) / total
+            self.position = pos + signed
+            return
+        # Сокращение (и, возможно, переворот) позиции
+        closed = min(qty, abs(pos))
+        self.realized += closed * (price - self.avg_price) * (1 if pos > 0 else -1)
+        self.position = pos + signed
+        if abs(self.position) < 1e-12:
+            self.position = 0.0
+            self.avg_price = 0.0
+        elif qty > closed:
+            self.avg_price = price
+
+    def mark(self, price):
+        self.mark_price = price
+
+    @property
+    def unrealized(self):
+        if not self.position or self.mark_price is None:
+            return 0.0
+        return self.position * (self.mark_price - self.avg_price)
+
+    # Итог сессии: реализованный + нереализованный за вычетом комиссий
+    @property
+    def net(self):
+        return self.realized + self.unrealized - self.fees
+
+    def summary(self):
+        return (
+            f"[{self.symbol}] Сессия PnL\n"
+            f"Покупка: {self.buy_qty:.4f} на {self.buy_cost:.2f} USDT\n"
+            f"Продажа: {self.sell_qty:.4f} на {self.sell_cost:.2f} USDT\n"
+            f"Позиция: {self.position:.4f} по {self.avg_price:.2f}\n"
+            f"Реализовано: {self.realized:.2f}, нереализовано: {self.unrealized:.2f}, комиссии: {self.fees:.2f}\n"
+            f"→ PnL: {self.net:.2f} USDT"
+        )
@@ -0,0 +1,120 @@
+# quote_manager.py
+import asyncio
+import os
+import re
+import time
+from collections import namedtuple
+from loguru import logger
+from orders import submit_orders
+
+QUOTE_TOLERANCE_TICKS = int(os.getenv("QUOTE_TOLERANCE_TICKS", "2"))
+QUOTE_TOLERANCE_STEPS = int(os.getenv("QUOTE_TOLERANCE_STEPS", "1"))
+CLIENT_ID_PREFIX = "mm-"
+CLIENT_ID_RE = re.compile(r'^mm-([BS])(\d+)-')
+CLOSED_STATUSES = {'FILLED', 'CANCELED', 'EXPIRED', 'REJECTED', 'EXPIRED_IN_MATCH'}
+
+LiveOrder = namedtuple('LiveOrder', 'client_order_id order_id level side price qty')
+
+
+# Уровень остаётся на месте, если цена и объём расходятся не больше допуска в целых
+# tick_size / step_size: прямое сравнение float переставляло ордера из-за шума округления
+def within_tolerance(order, req, filters, ticks=QUOTE_TOLERANCE_TICKS, steps=QUOTE_TOLERANCE_STEPS):
+    return (round(abs(order.price - req.price) / filters.tick_size) <= ticks
+            and round(abs(order.qty - req.qty) / filters.step_size) <= steps)
+
+
+# === Менеджер котировок ===
+# Держит в памяти желаемую сетку и живые ордера (по newClientOrderId вида mm-B1-...)
+# и за цикл отправляет минимальный дифф: уровни в пределах допуска не трогает,
+# сдвинувшиеся переставляет (фьючерсы — modify, спот — cancelReplace),
+# лишние снимает, недостающие ставит пачкой.
+class QuoteManager:
+    def __init__(self, gateway, symbol):
+        self.gateway = gateway
+        self.symbol = symbol
+        self.live = {}  # clientOrderId -> LiveOrder
+        self._seq = int(time.time() * 1000) % 10 ** 9
+        self._dirty = True  # состояние нужно сверить с openOrders
+
+    def _next_client_id(self, side, level):
+        self._seq += 1
+        return f"{CLIENT_ID_PREFIX}{side[0]}{level}-{self._seq}"
+
+    def by_slot(self):
+        return {(o.side, o.level): o for o in self.live.values()}
+
+    # Сверка с открытыми ордерами биржи: свои подхватываем, закрытые забываем
+    async def sync(self):
+        orders = await self.gateway.open_orders(self.symbol)
+        live = {}
+        for o in orders:
+            m = CLIENT_ID_RE.match(o['clientOrderId'])
+            if not m:
+                continue  # ордера, выставленные не ботом
+            live[o['clientOrderId']] = LiveOrder(o['clientOrderId'], o['orderId'], int(m.group(2)),
+                                                 o['side'], float(o['price']), float(o['origQty']))
+        self.live = live
+        self._dirty = False
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    # События user data stream
+    def on_order_update(self, update):
+        order = self.live.get(update.client_order_id)
+        if update.status in CLOSED_STATUSES:
+            self.live.pop(update.client_order_id, None)
+        elif order is not None:
+            self.live[update.client_order_id] = order._replace(order_id=update.order_id, price=update.price, qty=update.qty)
+
+    async def _replace(self, order, req):
+        if self.gateway.futures:
+            await self.gateway.modify_order(self.symbol, req.side, req.price, req.qty, client_order_id=order.client_order_id)
+            self.live[order.client_order_id] = order._replace(price=req.price, qty=req.qty)
+        else:
+            client_id = self._next_client_id(req.side, req.level)
+            resp = await self.gateway.cancel_replace(self.symbol, req.side, req.price, req.qty,
+                                                     order.client_order_id, client_id)
+            self.live.pop(order.client_order_id, None)
+            new = resp['newOrderResponse']
+            self.live[client_id] = LiveOrder(client_id, new['orderId'], req.level, req.side, req.price, req.qty)
+
+    async def _cancel(self, order):
+        await self.gateway.cancel_order(self.symbol, client_order_id=order.client_order_id)
+        self.live.pop(order.client_order_id, None)
+
+    async def reconcile(self, desired, filters):
+        if self._dirty:
+            await self.sync()
+
+        current = self.by_slot()
+        wanted = set()
+        to_place, to_replace = [], []
+        for req in desired:
+            slot = (req.side, req.level)
+            wanted.add(slot)
+            order = current.get(slot)
+            if order is None:
+                to_place.append(req._replace(client_order_id=self._next_client_id(req.side, req.level)))
+            elif not within_tolerance(order, req, filters):
+                to_replace.append((order, req))
+        to_cancel = [o for slot, o in current.items() if slot not in wanted]
+
+        jobs = [self._replace(o, r) for o, r in to_replace] + [self._cancel(o) for o in to_cancel]
+        outcomes = await asyncio.gather(*jobs, return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logger.error(f"[{self.symbol}] Ошибка при перестановке ордера: {outcome}")
+                self._dirty = True
+
+        results = await submit_orders(self.gateway, self.symbol, to_place) if to_place else []
+        for res in results:
+            if res.error is None:
+                req = res.request
+                self.live[req.client_order_id] = LiveOrder(req.client_order_id, res.response['orderId'],
+                                                           req.level, req.side, req.price, req.qty)
+
+        kept = len(desired) - len(to_place) - len(to_replace)
+        logger.info(f"[{self.symbol}] Котировки: оставлено {kept}, переставлено {len(to_replace)}, "
+                    f"снято {len(to_cancel)}, выставлено {len(to_place)}")
+        return results
@@ -0,0 +1,173 @@
+# rate_governor.py
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from loguru import logger
+
+# Приоритеты: меньше — важнее
+PRIORITY_CRITICAL = 0  # отмены, аварийная остановка
+PRIORITY_QUOTE = 1     # новые и переставляемые котировки
+PRIORITY_SYNC = 2      # сверка сделок, openOrders, exchangeInfo, баланс
+PRIORITY_LOW = 3       # Telegram-команды, снимки стакана, listenKey
+
+RATE_LIMIT_SAFETY = float(os.getenv("RATE_LIMIT_SAFETY", "0.9"))  # доля лимита, которую используем
+RATE_LIMIT_SHARE = float(os.getenv("RATE_LIMIT_SHARE", "1"))  # доля процесса, если лимиты делят несколько процессов
+CRITICAL_RESERVE = 0.1  # доля бакета, доступная только PRIORITY_CRITICAL
+
+INTERVAL_SECONDS = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400}
+HEADER_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+DEFAULT_LIMITS = {
+    'spot': [('REQUEST_WEIGHT', 60, 6000), ('ORDERS', 10, 100), ('ORDERS', 86400, 200000)],
+    'futures': [('REQUEST_WEIGHT', 60, 2400), ('ORDERS', 10, 300), ('ORDERS', 60, 1200)],
+}
+
+
+# === Бакет токенов на один лимит Binance ===
+class TokenBucket:
+    def __init__(self, limit, interval):
+        self.limit = limit
+        self.interval = interval
+        self.capacity = limit * RATE_LIMIT_SAFETY * RATE_LIMIT_SHARE
+        self.rate = self.capacity / interval
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, priority):
+        reserve = 0 if priority == PRIORITY_CRITICAL else self.capacity * CRITICAL_RESERVE
+        return self.tokens - reserve
+
+    def wait_time(self, cost, priority):
+        missing = cost - self.available(priority)
+        return max(missing / self.rate, 0)
+
+    # Поправка по заголовку X-MBX-*: биржа знает точный расход в текущем окне. Расход общий
+    # для всех процессов на IP / аккаунте, поэтому сверяется с полным лимитом, а не с долей
+    def correct(self, used):
+        self.tokens = min(self.tokens, self.limit * RATE_LIMIT_SAFETY - used)
+
+
+# === Глобальный регулятор частоты запросов ===
+# Бакеты по весу запросов и числу ордеров, инициализируются из exchangeInfo.rateLimits
+# и корректируются по заголовкам ответов. Ожидающие запросы обслуживаются по приоритету,
+# так что отмены обгоняют новые котировки и Telegram-команды.
+class RateGovernor:
+    def __init__(self, trade_mode):
+        self.trade_mode = trade_mode
+        self.buckets = {}  # (тип, интервал, с) -> TokenBucket
+        for kind, interval, limit in DEFAULT_LIMITS['spot' if trade_mode == 'spot' else 'futures']:
+            self.buckets[(kind, interval)] = TokenBucket(limit, interval)
+        self.banned_until = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def seed(self, rate_limits):
+        buckets = {}
+        for rl in rate_limits:
+            if rl['rateLimitType'] not in ('REQUEST_WEIGHT', 'ORDERS'):
+                continue
+            interval = INTERVAL_SECONDS[rl['interval']] * rl['intervalNum']
+            buckets[(rl['rateLimitType'], interval)] = TokenBucket(rl['limit'], interval)
+        if buckets:
+            self.buckets = buckets
+            logger.info(f"[RateGovernor] Лимиты ({self.trade_mode}): "
+                        + ", ".join(f"{k}/{i}s={b.limit}" for (k, i), b in buckets.items()))
+
+    def _costs(self, weight, orders):
+        for (kind, _), bucket in self.buckets.items():
+            cost = weight if kind == 'REQUEST_WEIGHT' else orders
+            if cost:
+                yield bucket, cost
+
+    def _wait_time(self, weight, orders, priority):
+        now = time.monotonic()
+        wait = max(self.banned_until - now, 0)
+        for bucket, cost in self._costs(weight, orders):
+            bucket.refill(now)
+            wait = max(wait, bucket.wait_time(cost, priority))
+        return wait
+
+    def _take(self, weight, orders):
+        for bucket, cost in self._costs(weight, orders):
+            bucket.tokens -= cost
+
+    async def acquire(self, weight=1, orders=0, priority=PRIORITY_SYNC):
+        if not self._waiters and self._wait_time(weight, orders, priority) == 0:
+            self._take(weight, orders)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), weight, orders, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._dispatch())
+        elif self._wakeup is not None:
+            self._wakeup.set()  # более важный запрос мог встать в голову очереди
+        await future
+
+    async def _dispatch(self):
+        self._wakeup = asyncio.Event()
+        while self._waiters:
+            priority, _, weight, orders, future = self._waiters[0]
+            if future.cancelled():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_time(weight, orders, priority)
+            if wait == 0:
+                heapq.heappop(self._waiters)
+                self._take(weight, orders)
+                future.set_result(None)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    # Ответ биржи: поправка бакетов по заголовкам и бан по 429/418
+    def update(self, rate_limits, status, retry_after=None):
+        for kind, used_map in (('REQUEST_WEIGHT', rate_limits.weight), ('ORDERS', rate_limits.orders)):
+            for window, used in used_map.items():
+                interval = int(window[:-1]) * HEADER_UNITS.get(window[-1], 1)
+                bucket = self.buckets.get((kind, interval))
+                if bucket is not None:
+                    bucket.correct(used)
+        if status in (418, 429):
+            pause = float(retry_after) if retry_after else 60
+            self.banned_until = max(self.banned_until, time.monotonic() + pause)
+            logger.warning(f"[RateGovernor] Ответ {status}, пауза {pause:.0f} с ({self.trade_mode})")
+
+    # Запас: минимальная доля свободных токенов по всем бакетам (0..1)
+    def headroom(self):
+        if time.monotonic() < self.banned_until:
+            return 0.0
+        now = time.monotonic()
+        result = 1.0
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+            result = min(result, max(bucket.tokens, 0) / bucket.capacity)
+        return result
+
+    # Интервал перекотировки: растёт, когда запас лимитов меньше половины
+    def scaled_interval(self, base, max_factor=10):
+        headroom = self.headroom()
+        if headroom >= 0.5:
+            return base
+        return base * min(0.5 / max(headroom, 0.05), max_factor)
+
+
+_governors = {}
+
+
+# Один регулятор на адрес API: вес считается по IP, общий для всех символов процесса
+def governor_for(api_url, trade_mode):
+    governor = _governors.get(api_url)
+    if governor is None:
+        governor = _governors[api_url] = RateGovernor(trade_mode)
+    return governor
@@ -0,0 +1,204 @@
+# recorder.py
+import gzip
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from loguru import logger
+
+RECORD_DIR = os.getenv("RECORD_DIR", "market_data")
+RECORD_COMPRESS = os.getenv("RECORD_COMPRESS", "false").lower() == "true"
+FLUSH_INTERVAL = 1.0  # с, как часто сбрасывать буфер файла на диск
+WRITE_BUFFER = 1 << 20
+
+# === Формат записи: 48 байт, little-endian, выравнивание по 8 ===
+# kind, flags, 6 байт выравнивания, update_id, exchange_ts (мс), local_ts (мкс), price, qty
+RECORD = struct.Struct('<BB6xqqqdd')
+RECORD_SIZE = RECORD.size
+
+KIND_BID = 1
+KIND_ASK = 2
+KIND_TRADE = 3
+
+FLAG_SNAPSHOT = 1   # уровень из REST-снимка
+FLAG_RESET = 2      # первая запись снимка: стакан очищается
+FLAG_LAST = 4       # последняя запись события (граница пакета обновлений)
+FLAG_BUYER_MAKER = 8  # сделка: покупатель — мейкер (агрессор продаёт)
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([('kind', 'u1'), ('flags', 'u1'), ('pad', 'V6'), ('update_id', '<i8'),
+                     ('exchange_ts', '<i8'), ('local_ts', '<i8'), ('price', '<f8'), ('qty', '<f8')])
+
+
+def day_of(ts_us):
+    return datetime.fromtimestamp(ts_us / 1e6, tz=timezone.utc).date().isoformat()
+
+
+def _compress(path):
+    try:
+        with open(path, 'rb') as src, gzip.open(f"{path}.gz", 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, WRITE_BUFFER)
+        os.remove(path)
+    except OSError as e:
+        logger.error(f"[Recorder] Не удалось сжать {path}: {e}")
+
+
+# === Запись одного символа: {RECORD_DIR}/{SYMBOL}/{YYYY-MM-DD}.bin ===
+# Файл только дописывается; смена дня (UTC) — новый файл, прошлый при RECORD_COMPRESS
+# сжимается gzip в отдельном потоке. Ошибка диска отключает запись, но не торговлю.
+class SymbolRecorder:
+    def __init__(self, root, symbol, compress=RECORD_COMPRESS):
+        self.dir = os.path.join(root, symbol)
+        self.symbol = symbol
+        self.compress = compress
+        self.day = None
+        self.path = None
+        self._file = None
+        self._last_flush = 0.0
+        self.records = 0
+        self.enabled = True
+
+    def _open(self, day):
+        self.close()
+        os.makedirs(self.dir, exist_ok=True)
+        self.day = day
+        self.path = os.path.join(self.dir, f"{day}.bin")
+        self._file = open(self.path, 'ab', buffering=WRITE_BUFFER)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if self.compress:
+            threading.Thread(target=_compress, args=(self.path,), daemon=True).start()
+
+    def _write(self, chunk, local_us):
+        if not self.enabled:
+            return
+        try:
+            day = day_of(local_us)
+            if day != self.day:
+                self._open(day)
+            self._file.write(chunk)
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+        except OSError as e:
+            self.enabled = False
+            logger.error(f"[Recorder] [{self.symbol}] Запись остановлена: {e}")
+
+    # Уровни событий в одну пачку записей; граница события помечается FLAG_LAST
+    @staticmethod
+    def _pack_levels(sides, update_id, exchange_ts, local_us, flags=0, first_flag=0):
+        rows = [(kind, price, qty) for kind, levels in sides for price, qty in levels]
+        out = bytearray(RECORD_SIZE * len(rows))
+        last = len(rows) - 1
+        for i, (kind, price, qty) in enumerate(rows):
+            f = flags | (first_flag if i == 0 else 0) | (FLAG_LAST if i == last else 0)
+            RECORD.pack_into(out, i * RECORD_SIZE, kind, f, update_id, exchange_ts, local_us, float(price), float(qty))
+        return out
+
+    def _emit(self, chunk, local_us):
+        if chunk:
+            self.records += len(chunk) // RECORD_SIZE
+            self._write(chunk, local_us)
+
+    # REST-снимок стакана
+    def snapshot(self, snapshot):
+        local_us = time.time_ns() // 1000
+        exchange_ts = snapshot.get('E') or local_us // 1000
+        sides = ((KIND_BID, snapshot['bids']), (KIND_ASK, snapshot['asks']))
+        self._emit(self._pack_levels(sides, snapshot['lastUpdateId'], exchange_ts, local_us,
+                                     FLAG_SNAPSHOT, FLAG_RESET), local_us)
+
+    # Применённое к стакану diff-событие (decoder.DepthUpdate)
+    def diff(self, update):
+        local_us = time.time_ns() // 1000
+        sides = ((KIND_BID, update.bids), (KIND_ASK, update.asks))
+        self._emit(self._pack_levels(sides, update.last_id, update.event_time, local_us), local_us)
+
+    # Сделка aggTrade (decoder.AggTrade)
+    def trade(self, trade):
+        local_us = time.time_ns() // 1000
+        flags = FLAG_LAST | (FLAG_BUYER_MAKER if trade.buyer_maker else 0)
+        self._emit(RECORD.pack(KIND_TRADE, flags, trade.trade_id, trade.trade_time, local_us,
+                               trade.price, trade.qty), local_us)
+
+
+# === Рекордер процесса: по SymbolRecorder на символ ===
+class MarketRecorder:
+    def __init__(self, root=RECORD_DIR, compress=RECORD_COMPRESS):
+        self.root = root
+        self.compress = compress
+        self.symbols = {}
+
+    def writer(self, symbol):
+        rec = self.symbols.get(symbol)
+        if rec is None:
+            rec = self.symbols[symbol] = SymbolRecorder(self.root, symbol, self.compress)
+        return rec
+
+    def close(self):
+        for rec in self.symbols.values():
+            rec.close()
+
+
+# === Чтение записей ===
+# Файлы символа по порядку дней, опционально в диапазоне [start_day, end_day]
+def recorded_files(symbol, root=RECORD_DIR, start_day=None, end_day=None):
+    folder = os.path.join(root, symbol)
+    if not os.path.isdir(folder):
+        return []
+    files = []
+    for name in sorted(os.listdir(folder)):
+        day = name.split('.', 1)[0]
+        if not (name.endswith('.bin') or name.endswith('.bin.gz')):
+            continue
+        if (start_day and day < start_day) or (end_day and day > end_day):
+            continue
+        files.append(os.path.join(folder, name))
+    return files
+
+
+def _read_bytes(path):
+    with gzip.open(path, 'rb') as f:
+        return f.read()
+
+
+# Поток кортежей (kind, flags, update_id, exchange_ts, local_ts, price, qty) без копирования
+# файла: несжатый файл отображается в память, сжатый распаковывается целиком.
+def iter_records(path):
+    if path.endswith('.gz'):
+        data = _read_bytes(path)
+        usable = len(data) - len(data) % RECORD_SIZE
+        yield from RECORD.iter_unpack(memoryview(data)[:usable])
+        return
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        usable = size - size % RECORD_SIZE  # хвост недописанной записи отбрасываем
+        if not usable:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            unpack_from = RECORD.unpack_from
+            for offset in range(0, usable, RECORD_SIZE):
+                yield unpack_from(mm, offset)
+
+
+# Структурированный массив NumPy (для несжатого файла — memmap без копирования)
+def load_records(path):
+    import numpy as np
+    dtype = record_dtype()
+    if path.endswith('.gz'):
+        data = _read_bytes(path)
+        return np.frombuffer(data, dtype=dtype, count=len(data) // RECORD_SIZE)
+    count = os.path.getsize(path) // RECORD_SIZE
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
@@ -0,0 +1,106 @@
+# Остановка по TAKE_PROFIT / STOP_LOSS и по /stop снимает только свой символ, соседи по воркеру торгуют дальше
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+import pytest
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+
+SYMBOLS = ('BTCUSDT', 'ETHUSDT', 'SOLUSDT')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def exchange(monkeypatch, tmp_path):
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, os.path.join(BOT_DIR, 'mock_exchange.py'), '--port', str(port),
+                             '--symbols', ','.join(SYMBOLS), '--prices', '100,50,20', '--base-balance', '100'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    monkeypatch.chdir(tmp_path)  # trades.db теста
+    env = {'SYMBOLS': ','.join(SYMBOLS), 'API_URL': f'http://127.0.0.1:{port}/api',
+           'FUTURES_URL': f'http://127.0.0.1:{port}/fapi', 'STREAM_URL': f'ws://127.0.0.1:{port}/spot',
+           'FUTURES_STREAM_URL': f'ws://127.0.0.1:{port}/futures', 'METRICS_PORT': '0', 'INTERVAL': '1',
+           'TAKE_PROFIT': '1000', 'TG_TOKEN': ''}
+    for symbol in SYMBOLS:
+        env[f'{symbol}_API_KEY'] = env[f'{symbol}_API_SECRET'] = 'test'
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    yield port
+    mock.terminate()
+    mock.wait()
+
+
+async def wait_until(predicate, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await predicate():
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+class Reply:
+    def __init__(self):
+        self.texts = []
+
+    def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+def test_pnl_limit_and_stop_stop_only_their_symbol(exchange):
+    import bot_commands
+    import main_bot
+    from db import init_db
+    from exchange_gateway import close_sessions
+    from user_stream import user_data
+
+    async def open_orders(symbol):
+        return await main_bot.gateways[symbol].open_orders(symbol)
+
+    async def all_quoted():
+        return all([await open_orders(s) for s in SYMBOLS])
+
+    async def scenario():
+        init_db()
+        tasks = [asyncio.ensure_future(main_bot.trade_symbol(s)) for s in SYMBOLS]
+        try:
+            assert await wait_until(all_quoted)
+            main_bot.pnl_engines['BTCUSDT'].realized = 2000.0  # выше TAKE_PROFIT
+
+            async def btc_stopped():
+                return 'BTCUSDT' not in main_bot.symbol_tasks and not await open_orders('BTCUSDT')
+            assert await wait_until(btc_stopped)
+
+            # /stop в режиме main_bot: обработчик в потоке Telegram, торговый цикл — этот
+            loop = asyncio.get_running_loop()
+            bot_commands.attach(main_bot.clients, main_bot.modes, main_bot.gateways, loop, main_bot.stop_symbol)
+            reply = Reply()
+            await loop.run_in_executor(None, bot_commands.stop, SimpleNamespace(message=reply),
+                                       SimpleNamespace(args=['ETHUSDT']))
+            assert reply.texts and reply.texts[0].startswith('🛑')
+            assert 'ETHUSDT' not in main_bot.symbol_tasks
+
+            await asyncio.sleep(2)  # ещё пара циклов: снятые символы не котируют заново, SOL торгует
+            assert not await open_orders('BTCUSDT')
+            assert not await open_orders('ETHUSDT')
+            assert not main_bot.symbol_tasks['SOLUSDT'].done()
+            assert await open_orders('SOLUSDT')
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await main_bot.market_data.close()
+            await user_data.close()
+            await close_sessions()
+
+    asyncio.run(scenario())
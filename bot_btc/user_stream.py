@@ -0,0 +1,223 @@
+# user_stream.py
+import asyncio
+import time
+from collections import namedtuple
+import aiohttp
+from loguru import logger
+from market_data import stream_base_url, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, HEARTBEAT
+from decoder import decode_user, ExecutionReport
+from exchange_gateway import ExchangeGateway
+from rate_governor import PRIORITY_LOW
+
+KEEPALIVE_INTERVAL = 30 * 60  # listenKey живёт 60 минут
+
+Balance = namedtuple('Balance', 'free locked')
+Position = namedtuple('Position', 'amount entry_price unrealized')
+Fill = namedtuple('Fill', 'id symbol side price qty fee fee_asset time order_id client_order_id')
+
+
+# Исполнение из decoder.ExecutionReport (executionReport / ORDER_TRADE_UPDATE)
+def parse_fill(report):
+    if report.exec_type != 'TRADE':
+        return None
+    return Fill(report.trade_id, report.symbol, report.side, report.last_price, report.last_qty,
+                report.fee, report.fee_asset, report.trade_time, report.order_id, report.client_order_id)
+
+
+# Исполнение из REST myTrades / futures userTrades
+def fill_from_trade(symbol, t, trade_mode):
+    if trade_mode == 'spot':
+        side = 'BUY' if t['isBuyer'] else 'SELL'
+    else:
+        side = t['side']
+    return Fill(t['id'], symbol, side, float(t['price']), float(t['qty']),
+                float(t.get('commission', 0)), t.get('commissionAsset'), t['time'], t['orderId'], None)
+
+
+# Комиссия в котируемой валюте: USDT как есть, базовый актив по цене сделки,
+# прочие (BNB) не пересчитываем
+def quote_fee(fill):
+    if not fill.fee or not fill.fee_asset:
+        return 0.0
+    if fill.symbol.endswith(fill.fee_asset):
+        return fill.fee
+    if fill.symbol.startswith(fill.fee_asset):
+        return fill.fee * fill.price
+    return 0.0
+
+
+# === Состояние аккаунта в памяти ===
+# Обновляется событиями outboundAccountPosition / balanceUpdate (спот)
+# и ACCOUNT_UPDATE (фьючерсы). Для фьючерсов free — баланс кошелька.
+class AccountState:
+    def __init__(self, trade_mode):
+        self.trade_mode = trade_mode
+        self.balances = {}   # актив -> Balance
+        self.positions = {}  # символ -> Position
+        self.live = False    # поток подключён и состояние засеяно из REST
+        self.updated_at = None
+
+    def balance(self, asset, locked=False):
+        b = self.balances.get(asset)
+        if b is None:
+            return None
+        return b.free + b.locked if locked else b.free
+
+    async def seed(self, gateway):
+        if self.trade_mode == 'spot':
+            account = await gateway.account(PRIORITY_LOW)
+            for b in account['balances']:
+                self.balances[b['asset']] = Balance(float(b['free']), float(b['locked']))
+        else:
+            for b in await gateway.futures_balances(PRIORITY_LOW):
+                self.balances[b['asset']] = Balance(float(b['balance']), 0.0)
+            for p in await gateway.positions(PRIORITY_LOW):
+                self.positions[p['symbol']] = Position(float(p['positionAmt']), float(p['entryPrice']), float(p.get('unRealizedProfit', 0)))
+        self.updated_at = time.time()
+
+    def on_event(self, event):
+        etype = event.get('e')
+        if etype == 'outboundAccountPosition':
+            for b in event['B']:
+                self.balances[b['a']] = Balance(float(b['f']), float(b['l']))
+        elif etype == 'balanceUpdate':
+            old = self.balances.get(event['a'], Balance(0.0, 0.0))
+            self.balances[event['a']] = Balance(old.free + float(event['d']), old.locked)
+        elif etype == 'ACCOUNT_UPDATE':
+            update = event['a']
+            for b in update.get('B', []):
+                self.balances[b['a']] = Balance(float(b['wb']), 0.0)
+            for p in update.get('P', []):
+                self.positions[p['s']] = Position(float(p['pa']), float(p['ep']), float(p.get('up', 0)))
+        else:
+            return
+        self.updated_at = time.time()
+
+
+# === Поток пользовательских данных одного аккаунта ===
+# Создаёт listenKey, продлевает его каждые 30 минут, пересоздаёт при истечении
+# или разрыве и поддерживает AccountState. REST-вызовы идут через ExchangeGateway
+# с низким приоритетом: их вес учитывает общий RateGovernor.
+class UserDataStream:
+    def __init__(self, client, trade_mode, use_testnet):
+        self.gateway = ExchangeGateway(client, trade_mode)
+        self.trade_mode = trade_mode
+        self.base_url = stream_base_url(trade_mode, use_testnet)
+        self.state = AccountState(trade_mode)
+        self.listen_key = None
+        self.fill_listeners = {}   # символ -> callback(fill)
+        self.order_listeners = {}  # символ -> callback(order_update)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.state.live = False
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            await self.gateway.keepalive_listen_key(self.listen_key)
+            logger.debug(f"[UserStream] listenKey продлён ({self.trade_mode})")
+
+    def _on_message(self, raw):
+        try:
+            event = decode_user(raw)
+        except Exception as e:
+            logger.warning(f"[UserStream] Невалидное сообщение: {e}")
+            return True
+        # ExecutionReport — он же обновление ордера для QuoteManager.on_order_update
+        if type(event) is ExecutionReport:
+            self._dispatch(self.order_listeners, event)
+            fill = parse_fill(event)
+            if fill is not None:
+                self._dispatch(self.fill_listeners, fill)
+            return True
+        if event.get('e') == 'listenKeyExpired':
+            logger.warning(f"[UserStream] listenKey истёк ({self.trade_mode}), пересоздаём")
+            return False
+        self.state.on_event(event)
+        return True
+
+    def _dispatch(self, listeners, item):
+        callback = listeners.get(item.symbol)
+        if callback is None:
+            return
+        try:
+            callback(item)
+        except Exception as e:
+            logger.error(f"[{item.symbol}] Ошибка обработки события ордера: {e}")
+
+    async def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            keepalive = None
+            try:
+                self.listen_key = await self.gateway.new_listen_key()
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(f"{self.base_url}/ws/{self.listen_key}", heartbeat=HEARTBEAT) as ws:
+                        logger.info(f"[UserStream] Подключено ({self.trade_mode})")
+                        keepalive = asyncio.ensure_future(self._keepalive())
+                        await self.state.seed(self.gateway)
+                        self.state.live = True
+                        delay = RECONNECT_MIN_DELAY
+                        async for msg in ws:
+                            if keepalive.done():
+                                keepalive.result()  # пробрасываем ошибку продления
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                if not self._on_message(msg.data):
+                                    break
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[UserStream] Ошибка ({self.trade_mode}): {e}")
+            finally:
+                self.state.live = False
+                if keepalive is not None:
+                    keepalive.cancel()
+            logger.info(f"[UserStream] Переподключение через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+# === Реестр потоков пользовательских данных ===
+# Один поток на аккаунт (API-ключ + сервер), символы с общими ключами его разделяют.
+class UserDataHub:
+    def __init__(self):
+        self.streams = {}  # (ключ, режим, сервер) -> UserDataStream
+        self.by_symbol = {}
+
+    def subscribe(self, symbol, client, trade_mode, use_testnet, on_fill=None, on_order=None):
+        key = (client.API_KEY, trade_mode, stream_base_url(trade_mode, use_testnet))
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = UserDataStream(client, trade_mode, use_testnet).start()
+        self.by_symbol[symbol] = stream
+        if on_fill is not None:
+            stream.fill_listeners[symbol] = on_fill
+        if on_order is not None:
+            stream.order_listeners[symbol] = on_order
+        return stream
+
+    def state(self, symbol):
+        stream = self.by_symbol.get(symbol)
+        return stream.state if stream is not None else None
+
+    async def close(self):
+        for stream in self.streams.values():
+            await stream.stop()
+
+
+user_data = UserDataHub()